@@ -48,7 +48,15 @@ UDP 語音接收端（含桌面 UI｜保留全部原功能｜前端頁面獨立
 USE_NGROK = False           # 想關掉 ngrok 就改 False
 
 USE_MELO_TTS = False        # [NEW] 是否使用 MeloTTS (第1順位)
+MELO_OUT_OF_PROCESS = True  # [NEW] MeloTTS 在獨立子行程推論（melo_worker.py），不佔主行程 GIL
+MELO_WORKERS = 1            # [NEW] 預熱的 MeloTTS 子行程數
 USE_EDGE_TTS = True         # 是否使用 Edge TTS (若 False 則直接跳過，使用 Piper/gTTS)
+TTS_HEDGE_DELAY_SEC = 0     # [NEW] 首選 TTS 引擎超過此秒數沒結果就平行啟動下一個（0 = 關閉，逐一備援；開啟會多用付費/CPU 引擎）
+TTS_DEADLINE_SEC = 20.0     # [NEW] 單次朗讀所有引擎的總時限（秒）
+TTS_STREAM_MIN_CHARS = 60   # [NEW] 超過此字數的公告改為分段合成、邊合成邊播
+TTS_STREAM_CONCURRENCY = 2  # [NEW] 分段合成同時進行的段數上限
+
+USE_LOCAL_MPV = False       # [NEW] 常駐 mpv 由本機 PA 直接播放直播/音檔（預設關閉：目前全由網頁端出聲）
 
 USE_AI_GENERATION = True    # 是否啟用 AI 廣播稿生成 (若 False 則不需安裝 Ollama)
 
@@ -58,7 +66,7 @@ PORT = 8888                 # UDP 監聽埠
 
 YT_AUTO_CLOSE_MIN = 30      # 全螢幕逾時自關閉（分鐘）←保留欄位
 
-TIMETABLE_SCAN_SEC = 5      # 課表掃描週期（秒）
+TIMETABLE_SCAN_SEC = 5      # 課表排程器出錯後的重試間隔（秒）
 
 DISABLE_UDP = False         # True 時不啟動 UDP 接收緒（純本機）
 
@@ -77,6 +85,9 @@ DISABLE_WEB = False         # True 時不啟動 Flask + ngrok（純本機）
 # ---- 隱性匯入（方便 PyInstaller）----
 
 import sys as _sys
+if "--melo-worker" in _sys.argv:   # [NEW] 打包成 EXE 時，MeloTTS 子行程以同一支執行檔啟動
+    import melo_worker
+    _sys.exit(melo_worker.main(_sys.argv[1:]))
 import serial, serial.tools.list_ports  # noqa: F401
 if _sys.platform == "win32":
     try:
@@ -410,7 +421,7 @@ import secrets, hashlib
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-from datetime import date, time as dtime
+from datetime import date
 
 # [Fix] Explicitly register Content-Types to avoid registry issues on Windows
 import mimetypes
@@ -432,6 +443,8 @@ from pathlib import Path
 from functools import wraps
 
 from urllib.parse import quote
+
+from sched_core import (SystemClock, ScheduleIndex, TimetableEngine, schedules_run_once, timetable_run_once)
 _HAS_PYGAME = False
 print("========================================")
 print(" RelayBell Demo Web System v2.1.2-GUID")
@@ -879,7 +892,9 @@ try:
     _melo_state = globals().get("USE_MELO_TTS", False)
     print(f"[DEBUG-INIT] Starting Setup Check. USE_MELO_TTS is: {_melo_state}")
     
-    if _melo_state:
+    if _melo_state and MELO_OUT_OF_PROCESS:
+        print(f"[DEBUG-INIT] MeloTTS runs out-of-process (start_melo_pool)")
+    elif _melo_state:
         print(f"[DEBUG-INIT] Entering MeloTTS setup block...")
         try:
              import torch
@@ -926,6 +941,188 @@ except Exception as e:
     MELO_ERR = str(e)
     print(f"[DEBUG-INIT] General Exception caught: {e}")
 
+# [NEW] MeloTTS 子行程池：推論不在主行程做（PyTorch 佔住 GIL 會讓 Flask/GUI/UDP 卡住）
+class _MeloProc:
+    """單一 melo_worker 子行程；stdout 由 reader 執行緒讀入 queue，一次只處理一個請求"""
+    def __init__(self, cmd):
+        flags = 0x08000000 if os.name == "nt" else 0   # CREATE_NO_WINDOW
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                     text=True, encoding="utf-8", bufsize=1, creationflags=flags)
+        self._q = queue.Queue()
+        self.hello = None
+        self.served = 0
+        threading.Thread(target=self._read, daemon=True).start()
+        threading.Thread(target=self._drain_err, daemon=True).start()
+
+    def _read(self):
+        try:
+            for line in self.proc.stdout:
+                try: self._q.put(json.loads(line))
+                except ValueError: pass
+        finally:
+            self._q.put(None)
+
+    def _drain_err(self):
+        try:
+            for line in self.proc.stderr:
+                if "Traceback" in line or "Error" in line: print(f"[MeloWorker:{self.proc.pid}] {line.rstrip()}")
+        except Exception:
+            pass
+
+    def wait_ready(self, timeout):
+        try: msg = self._q.get(timeout=timeout)
+        except queue.Empty: raise RuntimeError(f"worker not ready after {timeout:.0f}s")
+        if not msg or not msg.get("ready"):
+            raise RuntimeError((msg or {}).get("error") or f"worker exited (code={self.proc.poll()})")
+        self.hello = msg
+        return msg
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def request(self, req, timeout):
+        self.proc.stdin.write(json.dumps(req, ensure_ascii=False) + "\n"); self.proc.stdin.flush()
+        deadline = time.monotonic() + timeout
+        while True:
+            try: msg = self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty: raise TimeoutError(f"melo worker timeout ({timeout:.0f}s)")
+            if msg is None: raise RuntimeError(f"melo worker exited (code={self.proc.poll()})")
+            if msg.get("id") == req["id"]:
+                self.served += 1
+                return msg
+
+    def kill(self):
+        try: self.proc.kill()
+        except Exception: pass
+
+
+class MeloWorkerPool:
+    """
+    預熱 MELO_WORKERS 個子行程；synth() 借一個閒置 worker 合成到指定 WAV 路徑。
+    子行程崩潰/逾時就丟掉並在背景補一個新的（重啟次數有上限，避免模型壞掉時無限重生）。
+    """
+    READY_TIMEOUT = 300.0     # 首次啟動可能要下載模型
+    MAX_RESPAWN_PER_HOUR = 10
+
+    def __init__(self, size=1, language="ZH"):
+        self.size = max(1, int(size))
+        self.language = language
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._rid = 0
+        self._respawns = collections.deque()
+        self.speakers = {}
+        self.ready_n = 0
+        self.crashes = self.timeouts = self.jobs = 0
+        self.error = ""
+
+    def _cmd(self):
+        base = [sys.executable] if getattr(sys, "frozen", False) else [sys.executable, os.path.join(APP_DIR, "melo_worker.py")]
+        return base + ["--melo-worker", "--language", self.language]
+
+    def _spawn_one(self):
+        try:
+            w = _MeloProc(self._cmd())
+            hello = w.wait_ready(self.READY_TIMEOUT)
+        except Exception as e:
+            try: w.kill()
+            except Exception: pass
+            self.error = str(e)
+            print(f"[MeloPool] worker start failed: {e}")
+            return False
+        with self._lock:
+            self._workers.append(w); self.ready_n = len(self._workers)
+            self.speakers = hello.get("speakers") or self.speakers
+        print(f"[MeloPool] worker pid={hello.get('pid')} ready on {hello.get('device')} in {hello.get('load_ms')} ms")
+        self._idle.put(w)
+        return True
+
+    def start(self):
+        ok = False
+        for _ in range(self.size):
+            ok = self._spawn_one() or ok
+        return ok
+
+    def _retire(self, w, reason):
+        w.kill()
+        with self._lock:
+            if w in self._workers: self._workers.remove(w)
+            self.ready_n = len(self._workers)
+            now = time.time()
+            while self._respawns and now - self._respawns[0] > 3600: self._respawns.popleft()
+            if len(self._respawns) >= self.MAX_RESPAWN_PER_HOUR:
+                self.error = f"too many worker restarts ({reason})"
+                print(f"[MeloPool] {self.error}; not respawning")
+                return
+            self._respawns.append(now)
+        print(f"[MeloPool] replacing worker ({reason})")
+        threading.Thread(target=self._spawn_one, daemon=True).start()
+
+    def synth(self, text, speaker, speed, out_path, timeout=120.0):
+        if not self.ready_n:
+            raise RuntimeError(f"MeloTTS worker not ready ({self.error or 'starting'})")
+        try: w = self._idle.get(timeout=timeout)
+        except queue.Empty: raise TimeoutError("no idle MeloTTS worker")
+        if not w.alive():
+            self.crashes += 1; self._retire(w, "dead while idle")
+            return self.synth(text, speaker, speed, out_path, timeout)
+        with self._lock:
+            self._rid += 1; rid = self._rid
+        self.jobs += 1
+        try:
+            msg = w.request({"id": rid, "text": text, "speaker": speaker, "speed": speed, "out": out_path}, timeout)
+        except TimeoutError:
+            self.timeouts += 1; self._retire(w, "timeout"); raise
+        except Exception:
+            self.crashes += 1; self._retire(w, "crashed"); raise
+        self._idle.put(w)
+        if not msg.get("ok"):
+            raise RuntimeError(msg.get("error") or "melo worker failed")
+
+    def close(self):
+        with self._lock: ws = list(self._workers); self._workers.clear(); self.ready_n = 0
+        for w in ws: w.kill()
+
+    def stats(self):
+        with self._lock:
+            return {"size": self.size, "ready": self.ready_n, "jobs": self.jobs, "crashes": self.crashes,
+                    "timeouts": self.timeouts, "idle": self._idle.qsize(), "error": self.error,
+                    "pids": [w.proc.pid for w in self._workers]}
+
+MELO_POOL = None
+
+def start_melo_pool():
+    """開機預熱 MeloTTS 子行程（USE_MELO_TTS 且 MELO_OUT_OF_PROCESS 時）"""
+    global MELO_POOL, HAS_MELO, MELO_ERR
+    if not (USE_MELO_TTS and MELO_OUT_OF_PROCESS) or MELO_POOL:
+        return
+    MELO_POOL = MeloWorkerPool(MELO_WORKERS)
+    _log_boot(f"[SETUP] Starting {MELO_WORKERS} MeloTTS worker process(es)...")
+    if MELO_POOL.start():
+        HAS_MELO = True; MELO_ERR = ""
+        _log_boot("✅ MeloTTS 子行程就緒！")
+        atexit.register(MELO_POOL.close)
+    else:
+        HAS_MELO = False; MELO_ERR = MELO_POOL.error
+        _log_boot(f"[WARN] MeloTTS worker failed: {MELO_POOL.error}")
+
+def _melo_ready():
+    if MELO_POOL is not None:
+        return bool(HAS_MELO and MELO_POOL.ready_n)
+    return bool(HAS_MELO and melo_model)
+
+def _melo_speakers():
+    if MELO_POOL is not None:
+        return dict(MELO_POOL.speakers)
+    return dict(melo_model.hps.data.spk2id)
+
+def _melo_tts_to_file(text, speaker, out_path, speed=1.0):
+    if MELO_POOL is not None:
+        MELO_POOL.synth(text, speaker, speed, out_path)
+    else:
+        melo_model.tts_to_file(text, speaker, out_path, speed=speed)
+
 
 
 # [Changed] Define global executable paths using resource_path for PyInstaller
@@ -1127,7 +1324,7 @@ def api_set_relay_config():
 
 @app.route('/api/tts_preview', methods=['POST'])
 def api_tts_preview():
-    import edge_tts, asyncio, io
+    import edge_tts, io
     from flask import send_file
     try:
         d = request.json or {}
@@ -1161,11 +1358,8 @@ def api_tts_preview():
             out.seek(0)
             return out
 
-        # Run async generation in a fresh loop for this thread
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        audio_io = loop.run_until_complete(_gen())
-        loop.close()
+        # [MOD] 交給常駐語音 loop 執行（不再每次建立新 loop）
+        audio_io = SPEECH_LOOP.run(_gen(), timeout=60)
         
         return send_file(audio_io, mimetype="audio/mpeg", as_attachment=False, download_name="preview.mp3")
 
@@ -1202,10 +1396,10 @@ def api_set_chime_config():
 
 @app.route('/api/melo_voices')
 def api_melo_voices():
-    if not HAS_MELO or not melo_model:
+    if not _melo_ready():
         return jsonify(ok=False, error="Melo not ready")
     try:
-        spks = melo_model.hps.data.spk2id
+        spks = _melo_speakers()
         return jsonify(ok=True, voices=spks)
     except Exception as e:
         return jsonify(ok=False, error=str(e))
@@ -1364,12 +1558,308 @@ def favicon():
 
 # ===============================
 
-LIVE_CLIENTS = set()
-
-LIVE_HEADER_CHUNKS = [] # Cache first few chunks for new viewers
+LIVE_CLIENTS = set()    # LiveSubscriber
 
 RELAY_BROADCASTER_WS = None
 
+# [NEW] 每位收聽者獨立的送出佇列：廣播端只負責丟進佇列，慢速手機不會卡住整條直播
+LIVE_SUB_MAX_CHUNKS = 40        # 每位收聽者最多積壓的 chunk 數（250ms/chunk ≈ 10 秒）
+
+_WEBM_CLUSTER_ID = b"\x1f\x43\xb6\x75"
+
+LIVE_RING_MAX_BYTES = 4 * 1024 * 1024     # 最近一個 Cluster 的暫存上限（超過則等下一個 Cluster）
+LIVE_HEADER_MAX_BYTES = 256 * 1024        # 初始化段（EBML/Segment/Tracks）上限
+
+LIVE_STATS = {"joins": 0, "join_ms_sum": 0.0, "join_ms_max": 0.0, "ring_overflows": 0}
+
+
+class LiveStreamBuffer:
+
+    """直播串流的初始化段 + 最近一個 Cluster，讓中途加入的收聽者能立即解碼。
+
+    MediaRecorder 的 chunk 邊界與 WebM 結構無關，Cluster ID 可能跨兩個 chunk，
+    因此保留上一個 chunk 的末 3 bytes 做增量比對。
+    """
+
+    def __init__(self, max_bytes=LIVE_RING_MAX_BYTES):
+
+        self.lock = threading.Lock()
+
+        self.max_bytes = max_bytes
+
+        self.reset()
+
+    def reset(self):
+
+        self.header = b""
+
+        self.header_done = False
+
+        self.cluster = []               # 目前 Cluster 從起點開始的所有 bytes
+
+        self.cluster_bytes = 0
+
+        self.overflow = False
+
+        self._carry = b""
+
+    def feed(self, data):
+
+        """吃進一個 chunk；若其中有 Cluster 起點，回傳從起點開始的 bytes（重新同步用），否則 None。"""
+
+        if not isinstance(data, (bytes, bytearray)) or not data:
+
+            return None
+
+        buf = self._carry + data
+
+        idx = buf.find(_WEBM_CLUSTER_ID)
+
+        self._carry = bytes(buf[-3:])
+
+        cut = None if idx < 0 else idx - (len(buf) - len(data))    # 負值代表起點在上一個 chunk
+
+        resync = None if idx < 0 else bytes(buf[idx:])
+
+        if not self.header_done:
+
+            if cut is None:
+
+                if len(self.header) + len(data) <= LIVE_HEADER_MAX_BYTES:
+
+                    self.header += data
+
+            else:
+
+                self.header = self.header + data[:cut] if cut >= 0 else self.header[:cut]
+
+                self.header_done = True
+
+        if resync is not None:
+
+            self.cluster = [resync]
+
+            self.cluster_bytes = len(resync)
+
+            self.overflow = False
+
+        elif self.header_done and not self.overflow:
+
+            self.cluster.append(data)
+
+            self.cluster_bytes += len(data)
+
+            if self.cluster_bytes > self.max_bytes:
+
+                self.cluster = []; self.cluster_bytes = 0; self.overflow = True
+
+                LIVE_STATS["ring_overflows"] += 1
+
+        return resync
+
+    def stats(self):
+
+        return {"header_bytes": len(self.header), "header_done": self.header_done,
+
+                "cluster_chunks": len(self.cluster), "cluster_bytes": self.cluster_bytes,
+
+                "overflow": self.overflow}
+
+
+LIVE_BUFFER = LiveStreamBuffer()
+
+
+class LiveSubscriber:
+
+    """單一 /ws/live 收聽者：有界佇列 + 專屬送出執行緒。
+
+    佇列滿時整批丟棄，並跳到下一個 Cluster 起點再繼續送（skip-to-keyframe），
+    避免送出半截的 WebM 結構讓瀏覽器 MSE 解析失敗。
+    """
+
+    def __init__(self, ws, ip=""):
+
+        self.ws = ws
+
+        self.ip = ip
+
+        self.connected_at = time.time()
+
+        self._q = collections.deque()
+
+        self._cond = threading.Condition()
+
+        self._closed = False
+
+        self._resync = False
+
+        self.join_ms = None             # 連線到送出第一個可解碼媒體 chunk 的時間
+
+        self.queued_bytes = 0
+
+        self.sent_chunks = 0
+
+        self.sent_bytes = 0
+
+        self.dropped_chunks = 0
+
+        self.resyncs = 0
+
+        self.max_depth = 0
+
+        self.lag_ms = 0.0               # 最近一個 chunk 從進佇列到送出的時間
+
+        self.max_lag_ms = 0.0
+
+        self._thread = threading.Thread(target=self._sender, daemon=True)
+
+        self._thread.start()
+
+    def prime(self, buf):
+
+        """加入時先送初始化段 + 最近一個 Cluster（呼叫端持有 buf.lock）。"""
+
+        if buf.header:
+
+            self.offer(buf.header, media=False)
+
+        if buf.header_done and buf.cluster:
+
+            self.offer(b"".join(buf.cluster))
+
+        elif buf.header_done:
+
+            with self._cond:
+
+                self._resync = True     # 暫存已溢位 → 等下一個 Cluster
+
+    def offer(self, data, resync_data=None, media=True):
+
+        """由廣播端呼叫；只操作佇列，永不阻塞在網路上。
+
+        resync_data：此 chunk 內從 Cluster 起點開始的 bytes（無則 None）。
+        """
+
+        with self._cond:
+
+            if self._closed:
+
+                return
+
+            if len(self._q) >= LIVE_SUB_MAX_CHUNKS:
+
+                self.dropped_chunks += len(self._q)
+
+                self._q.clear()
+
+                self.queued_bytes = 0
+
+                self._resync = True
+
+                self.resyncs += 1
+
+            if self._resync and media:
+
+                if resync_data is None:
+
+                    self.dropped_chunks += 1
+
+                    return
+
+                data = resync_data
+
+                self._resync = False
+
+            self._q.append((time.monotonic(), data, media))
+
+            self.queued_bytes += len(data)
+
+            self.max_depth = max(self.max_depth, len(self._q))
+
+            self._cond.notify()
+
+    def _sender(self):
+
+        while True:
+
+            with self._cond:
+
+                while not self._q and not self._closed:
+
+                    self._cond.wait()
+
+                if self._closed:
+
+                    return
+
+                ts, data, media = self._q.popleft()
+
+                self.queued_bytes -= len(data)
+
+            try:
+
+                self.ws.send(data)
+
+            except Exception:
+
+                self.close()
+
+                return
+
+            if media and self.join_ms is None:
+
+                self.join_ms = (time.time() - self.connected_at) * 1000.0
+
+                LIVE_STATS["joins"] += 1
+
+                LIVE_STATS["join_ms_sum"] += self.join_ms
+
+                LIVE_STATS["join_ms_max"] = max(LIVE_STATS["join_ms_max"], self.join_ms)
+
+            self.lag_ms = (time.monotonic() - ts) * 1000.0
+
+            self.max_lag_ms = max(self.max_lag_ms, self.lag_ms)
+
+            self.sent_chunks += 1
+
+            self.sent_bytes += len(data)
+
+    def close(self):
+
+        with self._cond:
+
+            if self._closed:
+
+                return
+
+            self._closed = True
+
+            self._q.clear()
+
+            self._cond.notify_all()
+
+        LIVE_CLIENTS.discard(self)
+
+        try: self.ws.close()
+
+        except Exception: pass
+
+    def stats(self):
+
+        with self._cond:
+
+            depth = len(self._q); qbytes = self.queued_bytes
+
+        return {"ip": self.ip, "since": int(self.connected_at), "depth": depth, "queued_bytes": qbytes,
+
+                "max_depth": self.max_depth, "sent": self.sent_chunks, "sent_bytes": self.sent_bytes,
+
+                "dropped": self.dropped_chunks, "resyncs": self.resyncs,
+
+                "join_ms": round(self.join_ms, 1) if self.join_ms is not None else None,
+
+                "lag_ms": round(self.lag_ms, 1), "max_lag_ms": round(self.max_lag_ms, 1)}
+
 
 
 # = [ANCHOR] WebSocket Signaling (P2P Call) ==
@@ -1430,6 +1920,8 @@ def ws_web_handler(ws):
             # 可以處理一些心跳或反饋
             if data == "PING":
                 ws.send("PONG")
+            elif data.startswith("{"):
+                _ws_web_message(ws, data)   # [NEW] 對時握手 / 起播誤差回報
     except Exception as e:
         pass
     finally:
@@ -1438,14 +1930,229 @@ def ws_web_handler(ws):
                 WEB_WS_CLIENTS.remove(ws)
         print(f"[WS-Web] Web client disconnected from {request.remote_addr}")
 
-@app.route('/api/audio_proxy')
-def api_audio_proxy():
-    """
-    讓前端可以下載任何路徑的音訊檔（僅限音訊格式）
-    """
-    path = request.args.get('path')
-    if not path: return abort(400)
-    
+# [NEW] /api/audio_proxy 熱門音檔快取：鈴聲廣播時所有瀏覽器同時抓同一個 URL，
+#       最近廣播的檔案常駐記憶體（single-flight：同一檔案同時只有一個執行緒讀盤），其餘檔案走 send_file / mmap。
+#       強 ETag（size + mtime_ns）、If-None-Match / If-Range、多段 Range（multipart/byteranges）。
+HOT_AUDIO_MAX_BYTES = 64 * 1024 * 1024
+HOT_AUDIO_MAX_FILE = 16 * 1024 * 1024
+AUDIO_PROXY_MAX_RANGES = 16
+
+class HotAudioCache:
+    def __init__(self, max_bytes=HOT_AUDIO_MAX_BYTES, max_file=HOT_AUDIO_MAX_FILE):
+        self.max_bytes, self.max_file = max_bytes, max_file
+        self._lock = threading.Lock()
+        self._items = collections.OrderedDict()   # path -> (mtime_ns, size, bytes)
+        self._loading = {}                         # path -> threading.Event
+        self._bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "loads": 0, "coalesced": 0}
+
+    def get(self, path, st, load=True):
+        """回傳檔案內容（bytes）；檔案太大或 load=False 且未快取時回傳 None"""
+        while True:
+            with self._lock:
+                ent = self._items.get(path)
+                if ent and ent[0] == st.st_mtime_ns and ent[1] == st.st_size:
+                    self._items.move_to_end(path)
+                    self.stats["hits"] += 1
+                    return ent[2]
+                if not load or st.st_size > self.max_file:
+                    self.stats["misses"] += 1
+                    return None
+                ev = self._loading.get(path)
+                if ev is None:
+                    ev = self._loading[path] = threading.Event()
+                    break
+                self.stats["coalesced"] += 1
+            ev.wait(10)                           # 其他執行緒正在讀同一個檔案
+        try:
+            with open(path, "rb") as f: data = f.read()
+            with self._lock:
+                old = self._items.pop(path, None)
+                if old: self._bytes -= len(old[2])
+                self._items[path] = (st.st_mtime_ns, len(data), data)
+                self._bytes += len(data); self.stats["loads"] += 1
+                while self._bytes > self.max_bytes and len(self._items) > 1:
+                    _, (_, _, d) = self._items.popitem(last=False)
+                    self._bytes -= len(d)
+            return data
+        finally:
+            with self._lock: self._loading.pop(path, None)
+            ev.set()
+
+    def warm(self, path):
+        try: st = os.stat(path)
+        except OSError: return
+        self.get(os.path.abspath(path), st)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, files=len(self._items), bytes=self._bytes)
+
+HOT_AUDIO = HotAudioCache()
+
+def _audio_etag(st):
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+def _parse_ranges(header, size):
+    """'bytes=0-99,200-,-50' → [(start, end)]（end 含）；語法錯誤回傳 None，無法滿足回傳 []"""
+    if not header or not header.startswith("bytes="): return None
+    out = []
+    for part in header[6:].split(","):
+        part = part.strip()
+        if "-" not in part: return None
+        a, b = part.split("-", 1)
+        try:
+            if a == "":
+                n = int(b)
+                if n <= 0: continue
+                start, end = max(0, size - n), size - 1
+            else:
+                start = int(a); end = int(b) if b else size - 1
+                if b and end < start: return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start < size: out.append((start, end))
+    return out
+
+def _audio_mmap(path):
+    import mmap
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _serve_audio(abs_path, mimetype):
+    st = os.stat(abs_path)
+    size, etag = st.st_size, _audio_etag(st)
+    inm = request.headers.get("If-None-Match")
+    if inm and (inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]):
+        rv = make_response("", 304)
+        rv.headers["ETag"] = etag
+        return rv
+    ranges = _parse_ranges(request.headers.get("Range"), size) if size else None
+    if_range = request.headers.get("If-Range")
+    if ranges is not None and if_range and if_range.strip() != etag:
+        ranges = None                              # 驗證器不符：回傳完整檔案
+    if ranges is not None and len(ranges) > AUDIO_PROXY_MAX_RANGES:
+        ranges = None
+    data = HOT_AUDIO.get(os.path.abspath(abs_path), st)
+    if ranges == []:
+        rv = make_response("", 416)
+        rv.headers["Content-Range"] = f"bytes */{size}"
+    elif ranges is None:
+        if data is not None:
+            rv = make_response(data)
+            rv.mimetype = mimetype
+        else:
+            rv = make_response(send_file(abs_path, mimetype=mimetype, conditional=False, etag=False))
+    else:
+        src = data if data is not None else _audio_mmap(abs_path)
+        try:
+            if len(ranges) == 1:
+                s0, e0 = ranges[0]
+                rv = make_response(bytes(src[s0:e0 + 1]))
+                rv.mimetype = mimetype
+                rv.headers["Content-Range"] = f"bytes {s0}-{e0}/{size}"
+            else:
+                boundary = secrets.token_hex(12)
+                chunks = []
+                for s0, e0 in ranges:
+                    chunks.append(f"\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n"
+                                  f"Content-Range: bytes {s0}-{e0}/{size}\r\n\r\n".encode("ascii"))
+                    chunks.append(bytes(src[s0:e0 + 1]))
+                chunks.append(f"\r\n--{boundary}--\r\n".encode("ascii"))
+                rv = make_response(b"".join(chunks))
+                rv.headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+        finally:
+            if data is None: src.close()
+        rv.status_code = 206
+    rv.headers["ETag"] = etag
+    rv.headers["Accept-Ranges"] = "bytes"
+    rv.headers["Cache-Control"] = "no-cache"
+    return rv
+
+# [NEW] 可播放音檔索引：邏輯名稱（uploads/x.mp3、records/x.mp3、taigi/x.mp3、tts_cache/x.mp3、temp_audio/x.mp3、x.mp3）
+#       ↔ 絕對路徑 + MIME。上傳/刪除/合成時更新；broadcast_web_audio 產生 URL 與 audio_proxy 查找都是一次 dict 查詢。
+AUDIO_MIME = {".mp3": "audio/mpeg", ".wav": "audio/wav", ".ogg": "audio/ogg", ".m4a": "audio/mp4", ".webm": "audio/webm"}
+
+class AudioIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_name = {}        # logical -> (abs path, mime)
+        self._by_path = {}        # normcase abs path -> logical
+        self._roots = None
+        self.stats = {"hits": 0, "misses": 0, "adds": 0, "removes": 0}
+
+    def roots(self):
+        """(目錄, 邏輯前綴)；APP_DIR 放最後（子目錄優先比對）"""
+        if self._roots is None:
+            r = [(UPLOAD_DIR, "uploads/"), (RECORD_DIR, "records/"), (globals().get("TTS_CACHE_DIR"), "tts_cache/"),
+                 (globals().get("TAIGI_AUDIO_DIR"), "taigi/"), (os.path.join(STATIC_ROOT, "audio"), "static/audio/"),
+                 (tempfile.gettempdir(), "temp_audio/"), (APP_DIR, "")]
+            self._roots = [(os.path.normcase(os.path.abspath(d)) + os.sep, pre) for d, pre in r if d]
+        return self._roots
+
+    def logical_for(self, path):
+        """絕對路徑 → 邏輯名稱（只看路徑字串，不碰磁碟）；不在已知目錄下回傳 None"""
+        k = os.path.normcase(os.path.abspath(path))
+        for root, pre in self.roots():
+            if k.startswith(root) and os.sep not in k[len(root):]:
+                return pre + os.path.basename(path)
+        return None
+
+    def add(self, path, logical=None):
+        mime = AUDIO_MIME.get(os.path.splitext(path)[1].lower())
+        logical = logical or self.logical_for(path)
+        if not mime or not logical: return None
+        ap = os.path.abspath(path)
+        with self._lock:
+            self._by_name[logical] = (ap, mime)
+            self._by_path[os.path.normcase(ap)] = logical
+            self.stats["adds"] += 1
+        return logical
+
+    def discard(self, path):
+        k = os.path.normcase(os.path.abspath(path))
+        with self._lock:
+            logical = self._by_path.pop(k, None)
+            if logical and self._by_name.get(logical, ("",))[0] and os.path.normcase(self._by_name[logical][0]) == k:
+                del self._by_name[logical]
+                self.stats["removes"] += 1
+
+    def lookup(self, logical):
+        with self._lock:
+            ent = self._by_name.get(logical)
+            self.stats["hits" if ent else "misses"] += 1
+        return ent
+
+    def name_of(self, path):
+        with self._lock: return self._by_path.get(os.path.normcase(os.path.abspath(path)))
+
+    def scan(self):
+        n = 0
+        for root, pre in self.roots():
+            try:
+                with os.scandir(root) as it:
+                    for e in it:
+                        if e.is_file() and self.add(e.path, pre + e.name): n += 1
+            except OSError:
+                pass
+        print(f"[AudioIndex] {n} playable file(s) indexed")
+
+    def snapshot(self):
+        with self._lock: return dict(self.stats, entries=len(self._by_name))
+
+AUDIO_INDEX = AudioIndex()
+
+def audio_url_for(filename):
+    """音檔路徑 → 前端可用的 URL；已索引或位於已知目錄下時不需任何字串猜測"""
+    ap = filename if os.path.isabs(filename) else resource_path(filename)
+    logical = AUDIO_INDEX.name_of(ap) or AUDIO_INDEX.add(ap)
+    if not logical: return None
+    if logical.startswith("static/audio/"): return "/" + quote(logical)
+    return f"/api/audio_proxy?path={quote(logical)}"
+
+def _audio_proxy_resolve(path):
+    """虛擬路徑（uploads/、records/、temp_audio/、tts_cache/ 或檔名）→ 實際檔案路徑；找不到回傳 None"""
     # [Robustness] 修正路徑分隔符並避免絕對路徑攻擊
     path = path.replace('\\', '/').strip('/')
     
@@ -1473,6 +2180,8 @@ def api_audio_proxy():
     elif path.startswith("temp_audio/"):
         target_rel = path[len("temp_audio/"):]
         abs_path = os.path.join(tempfile.gettempdir(), target_rel)
+    elif path.startswith("tts_cache/"):
+        abs_path = os.path.join(TTS_CACHE_DIR, os.path.basename(path))
     else:
         # 2. 嘗試資源路徑
         cand = resource_path(path) if not os.path.isabs(path) else path
@@ -1495,8 +2204,23 @@ def api_audio_proxy():
                 if os.path.exists(sys_tmp):
                     abs_path = sys_tmp
 
-    if not abs_path or not os.path.exists(abs_path):
-        print(f"[AudioProxy] 404 Not Found: {path} (Resolved: {abs_path})")
+    return abs_path if abs_path and os.path.exists(abs_path) else None
+
+@app.route('/api/audio_proxy')
+def api_audio_proxy():
+    """
+    讓前端可以下載任何路徑的音訊檔（僅限音訊格式）
+    """
+    path = request.args.get('path')
+    if not path: return abort(400)
+    path = path.replace('\\', '/').strip('/')
+    ent = AUDIO_INDEX.lookup(path)   # [NEW] 索引命中：一次 dict 查詢 + 一次 stat
+    if ent and not os.path.isfile(ent[0]):
+        AUDIO_INDEX.discard(ent[0]); ent = None
+    abs_path = ent[0] if ent else _audio_proxy_resolve(path)
+    if abs_path and not ent: AUDIO_INDEX.add(abs_path)
+    if not abs_path:
+        print(f"[AudioProxy] 404 Not Found: {path}")
         return abort(404)
         
     ext = os.path.splitext(abs_path)[1].lower()
@@ -1510,770 +2234,1581 @@ def api_audio_proxy():
             print(f"[AudioProxy] 403 Forbidden Extension: {ext} for {abs_path}")
             return abort(403)
         
-    # [Fix] support for Range header (required by some browsers/mobile)
+    # [MOD] 熱快取 / mmap / 條件式請求 / 多段 Range 統一由 _serve_audio 處理
     try:
-        from flask import make_response
-        file_size = os.path.getsize(abs_path)
-        range_header = request.headers.get('Range', None)
-        
-        if range_header:
-            byte_range = range_header.replace('bytes=', '').split('-')
-            start = int(byte_range[0])
-            end = int(byte_range[1]) if byte_range[1] else file_size - 1
-            length = (end - start) + 1
-            
-            with open(abs_path, 'rb') as f:
-                f.seek(start)
-                data = f.read(length)
-                
-            rv = make_response(data)
-            rv.headers.add('Content-Range', f'bytes {start}-{end}/{file_size}')
-            rv.headers.add('Accept-Ranges', 'bytes')
-            rv.headers.add('Content-Length', str(length))
-            rv.headers.add('Content-Type', mimetype)
-            rv.status_code = 206
-            return rv
-            
-        else:
-            rv = make_response(send_file(abs_path, mimetype=mimetype))
-            rv.headers.add('Accept-Ranges', 'bytes')
-            return rv
+        return _serve_audio(abs_path, mimetype)
     except Exception as e:
         print(f"[AudioProxy] Error serving file: {e}")
         return send_file(abs_path, mimetype=mimetype)
 
-@sock.route('/ws/live')
+def _spawn_live_player():
 
-def live_stream(ws):
+    """啟動本機直播播放器（stdin 餵 WebM），失敗或無播放器回傳 None。"""
 
-    global RELAY_BROADCASTER_WS, LIVE_HEADER_CHUNKS
+    proc = None
 
     
 
-    # 1. Parse Role
+    # Priority: MPV -> FFplay
 
-    # flask-sock passes the WebSocket, but we can access `request` context
+    _MPV = os.path.join(APP_DIR, "mpv.exe")
 
-    role = request.args.get('role', 'subscriber')
+    if not os.path.exists(_MPV): _MPV = None
 
-    
 
-    # Check if we assume it's a broadcaster (simple auth: if they claim so)
 
-    # In a real app, check a token. Here, trust the query param.
+    if _MPV and _HAS_PYGAME:
 
-    is_broadcaster = (role == 'broadcaster')
+         # Use MPV (Better for streaming pipes)
 
+        cmd = [_MPV, 
 
+               "--no-terminal", 
 
-    print(f"[WS] Connect: IP={request.remote_addr}, Role={role}")
+               "--force-window=no", 
 
+               "--video=no", 
 
+               "--cache=no", 
 
-    if is_broadcaster:
+               "--demuxer-thread=no", 
 
-        # == Broadcaster Setup ==
+               "--untimed", 
 
-        # Kick off existing broadcaster if any? Or reject?
+               "--profile=low-latency",
 
-        # Let's overwrite for simplicity (last one wins)
+               "--audio-buffer=0",       # Minimize audio buffer
 
-        if RELAY_BROADCASTER_WS and RELAY_BROADCASTER_WS != ws:
+               "--stream-buffer-size=4k",# Minimize input stream buffer
 
-             try: RELAY_BROADCASTER_WS.close()
+               "--volume=500",           # Boost volume 500%
 
-             except: pass
+               "-"]
 
-        
+        try:
 
-        RELAY_BROADCASTER_WS = ws
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, bufsize=0)
 
-        LIVE_HEADER_CHUNKS.clear() # New stream, new headers
+            print(f"[WS] MPV started PID={proc.pid}")
 
-        
+            text_area_insert(f"直播播放器(MPV)啟動 (PID={proc.pid})", "Live")
 
-        # Start Local Playback (FFplay)
+        except Exception as e:
 
-        # Stop any audio
+            text_area_insert(f"❌ MPV 啟動失敗: {e}", "Live")
 
-        try:
+    
 
-            pygame.mixer.music.stop()
+    elif _FFMPEG and _HAS_PYGAME:
 
-            pygame.mixer.stop()
+         # Use FFplay
 
-        except: pass
+         cmd = [_FFMPEG.replace("ffmpeg.exe", "ffplay.exe").replace("ffmpeg", "ffplay"), 
 
-        
+               "-i", "-", 
 
+               "-nodisp", "-autoexit", 
 
+               "-fflags", "nobuffer", 
 
-        
+               "-flags", "low_delay", 
 
-        text_area_insert(f"🔴 直播來源已連線 ({request.remote_addr})", "Live")
+               "-framedrop", 
 
-        
+               "-strict", "experimental",
 
-        proc = None
+               "-probesize", "32",       # Minimal probe size (32 bytes)
 
-        
+               "-analyzeduration", "0",  # No analyze duration
 
-        # Priority: MPV -> FFplay
+               "-avioflags", "direct",   # Reduce IO buffering
 
-        _MPV = os.path.join(APP_DIR, "mpv.exe")
+               "-sync", "ext",
 
-        if not os.path.exists(_MPV): _MPV = None
+               "-af", "volume=5.0"]      # Boost volume 500%
 
+         
 
+         try:
 
-        if _MPV and _HAS_PYGAME:
+             # Capture stderr for debugging
 
-             # Use MPV (Better for streaming pipes)
+             proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, bufsize=0)
 
-            cmd = [_MPV, 
+             print(f"[WS] FFplay started PID={proc.pid}")
 
-                   "--no-terminal", 
+             text_area_insert(f"直播播放器(FFplay)啟動 (PID={proc.pid})", "Live")
 
-                   "--force-window=no", 
+         except Exception as e:
 
-                   "--video=no", 
+             msg = f"播放器啟動失敗: {e}"
 
-                   "--cache=no", 
+             print(msg)
 
-                   "--demuxer-thread=no", 
+             text_area_insert(f"❌ {msg}", "Live")
 
-                   "--untimed", 
+    else:
+
+         msg = "未檢測到 mpv/ffmpeg/ffplay，無法播放直播音訊"
+
+         print(f"[WS] {msg}")
+
+         text_area_insert(f"⚠️ {msg}", "Live")
+
+    return proc
+
+
+
+# [NEW] 本機播放器管線：廣播端只把 chunk 丟進有界佇列，由專屬執行緒寫入 mpv/ffplay stdin
+LIVE_PLAYER_MAX_CHUNKS = 24         # 本機播放器最多積壓 chunk 數（250ms/chunk ≈ 6 秒）
+LIVE_PLAYER_UNDERRUN_SEC = 1.0      # 直播中超過此秒數沒資料可寫，記一次 underrun
+LIVE_PLAYER_MAX_RESTARTS = 5        # 每分鐘最多自動重啟次數
+
+
+class LivePlayerPipe:
+
+    """直播來源 → 本機播放器的緩衝寫入器。
+
+    - 佇列滿（播放器消化不及）：丟棄積壓並跳到下一個 Cluster（overrun）
+    - 播放器結束或寫入失敗：自動重啟，並先補送初始化段 + 目前 Cluster 讓解碼器立即同步
+    - 廣播端永遠不會卡在 write()/flush()
+    """
+
+    def __init__(self, spawn=None):
+
+        self._spawn = spawn or _spawn_live_player
+
+        self.proc = None
+
+        self._q = collections.deque()
+
+        self._cond = threading.Condition()
+
+        self._closed = False
+
+        self._resync = False
+
+        self._restart_ts = collections.deque(maxlen=LIVE_PLAYER_MAX_RESTARTS)
+
+        self._stderr_tail = b""
+
+        self.written_chunks = 0
+
+        self.written_bytes = 0
+
+        self.overruns = 0
+
+        self.underruns = 0
+
+        self.dropped_chunks = 0
+
+        self.restarts = 0
+
+        self.max_depth = 0
+
+    def start(self):
+
+        self.proc = self._spawn()
+
+        if self.proc is None:
+
+            return False
+
+        self._watch_stderr(self.proc)
+
+        threading.Thread(target=self._writer, daemon=True).start()
+
+        return True
 
-                   "--profile=low-latency",
+    def feed(self, data, resync_data=None):
 
-                   "--audio-buffer=0",       # Minimize audio buffer
+        with self._cond:
 
-                   "--stream-buffer-size=4k",# Minimize input stream buffer
+            if self._closed or self.proc is None:
 
-                   "--volume=500",           # Boost volume 500%
+                return
 
-                   "-"]
+            if len(self._q) >= LIVE_PLAYER_MAX_CHUNKS:
+
+                self.overruns += 1
+
+                self.dropped_chunks += len(self._q)
+
+                self._q.clear()
+
+                self._resync = True
+
+            if self._resync:
+
+                if resync_data is None:
+
+                    self.dropped_chunks += 1
+
+                    return
+
+                data = resync_data
+
+                self._resync = False
+
+            self._q.append(data)
+
+            self.max_depth = max(self.max_depth, len(self._q))
+
+            self._cond.notify()
+
+    def _watch_stderr(self, proc):
+
+        # 持續讀走 stderr，避免 PIPE 塞滿反過來卡住播放器；只保留最後 2KB 供除錯
+        def _drain():
 
             try:
 
-                proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, bufsize=0)
+                for line in iter(proc.stderr.readline, b""):
+
+                    self._stderr_tail = (self._stderr_tail + line)[-2048:]
+
+            except Exception:
+
+                pass
+
+        if proc.stderr:
+
+            threading.Thread(target=_drain, daemon=True).start()
+
+    def _restart(self, reason):
+
+        code = self.proc.poll() if self.proc else None
+
+        msg = f"直播播放器中斷 (Code: {code}, {reason})"
+
+        print(f"[WS] {msg}")
+
+        text_area_insert(f"❌ {msg}", "Live")
+
+        if self._stderr_tail:
+
+            err_str = self._stderr_tail.decode('utf-8', errors='ignore')
+
+            print(f"[WS] Player Stderr: {err_str}")
+
+            text_area_insert(f"錯誤訊息: {err_str[-200:]}", "Live")
+
+        try: self.proc.kill()
+
+        except Exception: pass
+
+        now_ts = time.monotonic()
+
+        if len(self._restart_ts) == self._restart_ts.maxlen and now_ts - self._restart_ts[0] < 60:
+
+            text_area_insert("❌ 直播播放器重啟過於頻繁，停止本機播放（收聽端不受影響）", "Live")
+
+            return False
+
+        self._restart_ts.append(now_ts)
+
+        proc = self._spawn()
+
+        if proc is None:
+
+            return False
+
+        self._stderr_tail = b""
+
+        self._watch_stderr(proc)
+
+        with LIVE_BUFFER.lock:
+
+            prime = LIVE_BUFFER.header + b"".join(LIVE_BUFFER.cluster) if LIVE_BUFFER.cluster else b""
+
+            overflow = LIVE_BUFFER.header_done and not LIVE_BUFFER.cluster
 
-                print(f"[WS] MPV started PID={proc.pid}")
+        with self._cond:
 
-                text_area_insert(f"直播播放器(MPV)啟動 (PID={proc.pid})", "Live")
+            self.proc = proc
+
+            self._q.clear()
+
+            if prime:
+
+                self._q.append(prime)
+
+            self._resync = overflow
+
+        self.restarts += 1
+
+        return True
+
+    def _writer(self):
+
+        idle_since = time.monotonic()
+
+        while True:
+
+            with self._cond:
+
+                while not self._q and not self._closed:
+
+                    if not self._cond.wait(LIVE_PLAYER_UNDERRUN_SEC) and time.monotonic() - idle_since >= LIVE_PLAYER_UNDERRUN_SEC:
+
+                        self.underruns += 1
+
+                        idle_since = time.monotonic()
+
+                if self._closed:
+
+                    return
+
+                data = self._q.popleft()
+
+                proc = self.proc
+
+            idle_since = time.monotonic()
+
+            try:
+
+                if proc.poll() is not None:
+
+                    raise BrokenPipeError("player exited")
+
+                proc.stdin.write(data)
+
+                proc.stdin.flush()
+
+                self.written_chunks += 1
+
+                self.written_bytes += len(data)
 
             except Exception as e:
 
-                text_area_insert(f"❌ MPV 啟動失敗: {e}", "Live")
+                if self._closed or not self._restart(str(e)):
 
-        
+                    with self._cond:
+
+                        self.proc = None
 
-        elif _FFMPEG and _HAS_PYGAME:
+                        self._q.clear()
 
-             # Use FFplay
+                    return
 
-             cmd = [_FFMPEG.replace("ffmpeg.exe", "ffplay.exe").replace("ffmpeg", "ffplay"), 
+    def close(self):
 
-                   "-i", "-", 
+        with self._cond:
 
-                   "-nodisp", "-autoexit", 
+            self._closed = True
 
-                   "-fflags", "nobuffer", 
+            self._q.clear()
 
-                   "-flags", "low_delay", 
+            self._cond.notify_all()
 
-                   "-framedrop", 
+        if self.proc:
 
-                   "-strict", "experimental",
+            try: self.proc.kill()
 
-                   "-probesize", "32",       # Minimal probe size (32 bytes)
+            except Exception: pass
 
-                   "-analyzeduration", "0",  # No analyze duration
+    def stats(self):
 
-                   "-avioflags", "direct",   # Reduce IO buffering
+        with self._cond:
 
-                   "-sync", "ext",
+            depth = len(self._q)
 
-                   "-af", "volume=5.0"]      # Boost volume 500%
+        return {"running": bool(self.proc and self.proc.poll() is None), "depth": depth,
 
-             
+                "max_depth": self.max_depth, "written": self.written_chunks, "written_bytes": self.written_bytes,
 
-             try:
+                "overruns": self.overruns, "underruns": self.underruns, "dropped": self.dropped_chunks,
 
-                 # Capture stderr for debugging
+                "restarts": self.restarts}
 
-                 proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, bufsize=0)
 
-                 print(f"[WS] FFplay started PID={proc.pid}")
+LIVE_PLAYER = None      # 目前直播的 LivePlayerPipe（供 /api/perf 讀取）
 
-                 text_area_insert(f"直播播放器(FFplay)啟動 (PID={proc.pid})", "Live")
 
-             except Exception as e:
 
-                 msg = f"播放器啟動失敗: {e}"
+# [NEW] 常駐 mpv：開機預先啟動（--idle + JSON IPC），直播與本機音檔都以 loadfile 重用，
+#       省去每次啟動播放器的延遲；健康檢查失敗自動重生
+MPV_HEALTH_SEC = 5.0
+MPV_IPC_TIMEOUT = 2.0
 
-                 print(msg)
 
-                 text_area_insert(f"❌ {msg}", "Live")
+class WarmMpv:
+
+    """以 JSON IPC 控制的常駐 mpv。
+
+    Windows 具名管線同一 handle 無法同時讀寫，因此不開常駐讀取緒，
+    每個指令都是「寫一行 → 讀到對應 request_id 為止」，中間的 event 直接略過。
+    """
+
+    def __init__(self, exe):
+
+        self.exe = exe
+
+        if os.name == "nt":
+
+            self.ipc_path = rf"\\.\pipe\relaybell-mpv-{os.getpid()}"
 
         else:
 
-             msg = "未檢測到 mpv/ffmpeg/ffplay，無法播放直播音訊"
+            self.ipc_path = os.path.join(tempfile.gettempdir(), f"relaybell-mpv-{os.getpid()}.sock")
 
-             print(f"[WS] {msg}")
+        self.proc = None
 
-             text_area_insert(f"⚠️ {msg}", "Live")
+        self._lock = threading.Lock()
 
+        self._rf = None
 
+        self._wf = None
 
+        self._sock = None
 
+        self._req = 0
 
-        # Loop
+        self._event_ts = {}             # 最近一次收到各 mpv event 的時間
+
+        self._closed = False
+
+        self.spawns = 0
+
+        self.health_failures = 0
+
+        self.loads = 0
+
+        self.first_audio = {}           # kind -> {"n", "sum_ms", "max_ms", "last_ms"}
+
+    def spawn(self):
+
+        self._disconnect()
+
+        if self.proc and self.proc.poll() is None:
+
+            try: self.proc.kill()
+
+            except Exception: pass
+
+        cmd = [self.exe, "--idle=yes", "--no-terminal", "--force-window=no", "--video=no",
+
+               "--cache=no", "--demuxer-thread=no", "--profile=low-latency", "--audio-buffer=0",
+
+               "--keep-open=no", f"--input-ipc-server={self.ipc_path}"]
 
         try:
 
-            chunk_count = 0
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
-            while True:
+        except Exception as e:
 
-                data = ws.receive()
+            text_area_insert(f"❌ 常駐 mpv 啟動失敗: {e}", "Live")
 
-                if data:
+            self.proc = None
 
-                    chunk_count += 1
+            return False
 
-                    if chunk_count % 50 == 0:
+        deadline = time.monotonic() + 5.0
 
-                        print(f"[WS] Received chunk #{chunk_count}, len={len(data)}")
+        while time.monotonic() < deadline and self.proc.poll() is None:
 
+            try:
 
+                self._connect()
 
-                    # 1. Cache Header
+                break
 
-                    if len(LIVE_HEADER_CHUNKS) < 3:
+            except Exception:
 
-                        LIVE_HEADER_CHUNKS.append(data)
+                time.sleep(0.05)
 
-                    
+        if not self._rf:
 
-                    # 2. Relay to Subscribers
+            text_area_insert("❌ 常駐 mpv IPC 連線失敗", "Live")
 
-                    try:
+            return False
 
-                        subscribers = list(LIVE_CLIENTS)
+        self.spawns += 1
 
-                        for sub in subscribers:
+        STATE["mpv_ipc_path"] = self.ipc_path
 
-                            try:
+        print(f"[MPV] warm instance PID={self.proc.pid} ipc={self.ipc_path}")
 
-                                sub.send(data)
+        return True
 
-                            except:
+    def _connect(self):
 
-                                LIVE_CLIENTS.discard(sub)
+        if os.name == "nt":
 
-                    except Exception as e:
+            import io
 
-                        print(f"[WS] Relay error: {e}")
+            f = open(self.ipc_path, "r+b", buffering=0)
 
+            self._rf = io.BufferedReader(f); self._wf = f
 
+        else:
 
-                    # 3. Pipe to Local FFplay
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
 
-                    if proc and proc.stdin:
+            s.settimeout(MPV_IPC_TIMEOUT)
 
-                        try:
+            s.connect(self.ipc_path)
 
-                            # Check if process is still alive
+            self._sock = s; self._rf = s.makefile("rb"); self._wf = None
 
-                            if proc.poll() is not None:
+    def _disconnect(self):
 
-                                msg = f"直播播放器中斷 (Code: {proc.returncode})"
+        for h in (self._rf, self._wf, self._sock):
 
-                                print(f"[WS] {msg}")
+            try:
 
-                                text_area_insert(f"❌ {msg}", "Live")
+                if h: h.close()
 
-                                
+            except Exception: pass
 
-                                stderr_out = proc.stderr.read()
+        self._rf = self._wf = self._sock = None
 
-                                if stderr_out:
+    def command(self, *args):
 
-                                    err_str = stderr_out.decode('utf-8', errors='ignore')
+        """送出一個 IPC 指令並回傳 data；mpv 回報錯誤時丟 RuntimeError。"""
 
-                                    print(f"[WS] FFplay Stderr: {err_str}")
+        with self._lock:
 
-                                    text_area_insert(f"錯誤訊息: {err_str[:200]}", "Live")
+            if not self._rf:
 
-                                proc = None
+                raise ConnectionError("mpv ipc not connected")
 
-                            else:
+            self._req += 1
 
-                                proc.stdin.write(data)
+            rid = self._req
 
-                                proc.stdin.flush()
+            line = (json.dumps({"command": list(args), "request_id": rid}) + "\n").encode("utf-8")
 
-                        except Exception as e:
+            try:
 
-                             print(f"[WS] Write to ffplay fail: {e}")
+                if self._sock: self._sock.sendall(line)
 
-                             proc = None
+                else: self._wf.write(line)
 
-                else:
+                while True:
 
-                    break
+                    raw = self._rf.readline()
 
-        except Exception as e:
+                    if not raw:
 
-            print(f"[WS] Broadcaster Error: {e}")
+                        raise ConnectionError("mpv ipc closed")
 
-        finally:
+                    try: msg = json.loads(raw)
 
-            # Cleanup
+                    except ValueError: continue
 
-            if RELAY_BROADCASTER_WS == ws:
+                    if msg.get("event"):
 
-                RELAY_BROADCASTER_WS = None
+                        self._event_ts[msg["event"]] = time.monotonic()
 
-                LIVE_HEADER_CHUNKS.clear()
+                    elif msg.get("request_id") == rid:
 
-                text_area_insert(f"⏹️ 直播來源斷線", "Live")
+                        break
 
+            except (OSError, ConnectionError):
 
+                self._disconnect()
 
-                # Force disconnect all subscribers so they reset
+                raise
 
-                try:
+        if msg.get("error") not in (None, "success"):
 
-                    for sub in list(LIVE_CLIENTS):
+            raise RuntimeError(msg.get("error"))
 
-                        try: sub.close()
+        return msg.get("data")
 
-                        except: pass
+    def alive(self):
 
-                    LIVE_CLIENTS.clear()
+        if not self.proc or self.proc.poll() is not None:
 
-                except Exception as e:
+            return False
 
-                    print(f"[WS] Error closing subs: {e}")
+        try:
+
+            self.command("get_property", "idle-active")
 
+            return True
 
+        except Exception:
 
-                if proc:
+            return False
 
-                    try: proc.kill()
+    def load(self, url, volume=100, kind="file", mode="replace"):
 
-                    except: pass
+        """載入並播放；首次出聲時間在背景量測（loadfile → playback-restart 事件）。"""
 
-                    
+        t0 = time.monotonic()
 
-    else:
+        self.command("set_property", "volume", volume)
 
-        # == Subscriber Setup ==
+        self.command("loadfile", url, mode)
 
-        LIVE_CLIENTS.add(ws)
+        self.loads += 1
 
-        # Send Cached Headers immediately
+        threading.Thread(target=self._measure_first_audio, args=(kind, t0), daemon=True).start()
 
-        if LIVE_HEADER_CHUNKS:
+    def _measure_first_audio(self, kind, t0, limit=10.0):
+
+        # 事件只有在下一個指令回應前才會被讀到，因此用輕量指令輪詢來「抽」出 playback-restart
+        while time.monotonic() - t0 < limit:
 
             try:
 
-                for chunk in LIVE_HEADER_CHUNKS:
+                self.command("get_property", "idle-active")
 
-                    ws.send(chunk)
+                ts = self._event_ts.get("playback-restart", 0.0)
 
-            except: pass
+                if ts > t0:
 
-            
+                    ms = (ts - t0) * 1000.0
 
-        try:
+                    st = self.first_audio.setdefault(kind, {"n": 0, "sum_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
 
-            # Just keep connection open to receive
+                    st["n"] += 1; st["sum_ms"] += ms; st["max_ms"] = max(st["max_ms"], ms); st["last_ms"] = ms
 
-            while True:
+                    return
 
-                # We don't expect data from subscriber, but we must read to keep socket alive?
+            except RuntimeError:
 
-                # Or just block.
+                pass
 
-                data = ws.receive()
+            except Exception:
 
-                if not data: break 
+                return
 
-                # Ignore received data from subscriber
+            time.sleep(0.02)
 
-        except:
+    def stop(self):
 
-            pass
+        try: self.command("stop")
+
+        except Exception: pass
+
+    def health_loop(self):
+
+        while not self._closed:
+
+            time.sleep(MPV_HEALTH_SEC)
+
+            if self._closed:
+
+                return
+
+            if not self.alive():
+
+                self.health_failures += 1
+
+                print("[MPV] health check failed, respawning")
+
+                if not self.spawn():
+
+                    time.sleep(MPV_HEALTH_SEC * 4)
+
+    def close(self):
+
+        self._closed = True
+
+        try: self.command("quit")
+
+        except Exception: pass
+
+        self._disconnect()
+
+        if self.proc:
+
+            try: self.proc.kill()
+
+            except Exception: pass
+
+    def stats(self):
+
+        fa = {k: {"n": v["n"], "avg_ms": round(v["sum_ms"] / v["n"], 1) if v["n"] else 0.0,
+
+                  "max_ms": round(v["max_ms"], 1), "last_ms": round(v["last_ms"], 1)}
+
+              for k, v in self.first_audio.items()}
+
+        return {"running": bool(self.proc and self.proc.poll() is None), "pid": self.proc.pid if self.proc else None,
+
+                "spawns": self.spawns, "health_failures": self.health_failures, "loads": self.loads,
+
+                "first_audio": fa}
+
+
+WARM_MPV = None
+
+
+def start_warm_mpv():
+
+    global WARM_MPV
+
+    exe = _MPV or shutil.which("mpv")
+
+    if not USE_LOCAL_MPV or not exe or WARM_MPV:
+
+        return
+
+    WARM_MPV = WarmMpv(exe)
+
+    if WARM_MPV.spawn():
+
+        threading.Thread(target=WARM_MPV.health_loop, daemon=True).start()
+
+        atexit.register(WARM_MPV.close)
+
+    else:
+
+        WARM_MPV = None
+
+
+class _HttpLiveSink:
+
+    """讓 LiveSubscriber 把 chunk 送進 HTTP 串流（給常駐 mpv 讀取）。"""
+
+    def __init__(self):
+
+        self.q = queue.Queue(maxsize=8)
+
+        self.closed = False
+
+    def send(self, data):
+
+        self.q.put(data, timeout=5.0)
+
+    def close(self):
+
+        self.closed = True
+
+
+@app.get("/live/local.webm")
+
+def live_local_stream():
+
+    """目前直播內容的 HTTP 串流，僅限本機（常駐 mpv loadfile 用）。"""
+
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+
+        return abort(403)
+
+    sink = _HttpLiveSink()
+
+    sub = LiveSubscriber(sink, "local-mpv")
+
+    with LIVE_BUFFER.lock:
+
+        sub.prime(LIVE_BUFFER)
+
+        LIVE_CLIENTS.add(sub)
+
+    def gen():
+
+        try:
+
+            while True:
+
+                try:
+
+                    data = sink.q.get(timeout=1.0)
+
+                except queue.Empty:
+
+                    if sink.closed: return
+
+                    continue
+
+                yield data
 
         finally:
 
-            LIVE_CLIENTS.discard(ws)
+            sub.close()
 
-            print(f"[WS] Subscriber disconnected: {request.remote_addr}")
+    return app.response_class(gen(), mimetype="video/webm")
 
 
 
-@sock.route('/ws/call')
+def _local_base_url():
+    """本機回連用的 base URL：以目前請求實際連入的埠為準（headless 模式可能由 PORT 環境變數覆蓋 HTTP_PORT）"""
+    port = None
+    try: port = request.environ.get("SERVER_PORT")
+    except RuntimeError: pass   # 不在請求內
+    return f"http://127.0.0.1:{port or os.environ.get('PORT') or HTTP_PORT}"
 
-def call_signaling(ws):
+@sock.route('/ws/live')
 
-    global CALL_CLIENTS
+def live_stream(ws):
 
-    my_id = None
+    global RELAY_BROADCASTER_WS, LIVE_PLAYER
 
-    try:
+    
 
-        while True:
+    # 1. Parse Role
 
-            data = ws.receive()
+    # flask-sock passes the WebSocket, but we can access `request` context
 
-            if not data: break
+    role = request.args.get('role', 'subscriber')
 
-            
+    
 
-            try:
+    # Check if we assume it's a broadcaster (simple auth: if they claim so)
 
-                msg = json.loads(data)
+    # In a real app, check a token. Here, trust the query param.
 
-                mtype = msg.get('type')
+    is_broadcaster = (role == 'broadcaster')
 
-                
 
-                if mtype == 'login':
 
-                    my_id = msg.get('id')
+    print(f"[WS] Connect: IP={request.remote_addr}, Role={role}")
 
-                    CALL_CLIENTS[my_id] = ws
 
-                    print(f"[WS-Call] user {my_id} logged in")
 
-                    ws.send(json.dumps({'type': 'login_ack', 'id': my_id}))
+    if is_broadcaster:
 
-                    
+        # == Broadcaster Setup ==
 
-                elif mtype in ('offer', 'answer', 'candidate', 'ready', 'invite', 'text_message'):
+        # Kick off existing broadcaster if any? Or reject?
 
-                    target = msg.get('target')
+        # Let's overwrite for simplicity (last one wins)
 
-                    target_ws = CALL_CLIENTS.get(target)
+        if RELAY_BROADCASTER_WS and RELAY_BROADCASTER_WS != ws:
 
-                    if target_ws:
+             try: RELAY_BROADCASTER_WS.close()
 
-                        try:
+             except: pass
 
-                            target_ws.send(data)
+        
 
-                        except:
+        RELAY_BROADCASTER_WS = ws
 
-                            print(f"[WS-Call] Failed to send to {target}")
+        with LIVE_BUFFER.lock:
 
-                    else:
+            LIVE_BUFFER.reset() # New stream, new headers
 
-                        print(f"[WS-Call] Target {target} not found")
+        
 
-                        # Notify sender?
+        # Start Local Playback (FFplay)
 
-                        
+        # Stop any audio
 
-                elif mtype == 'list_users':
+        try:
 
-                    # Optional: send list of connected signaling users
+            pygame.mixer.music.stop()
 
-                    users = list(CALL_CLIENTS.keys())
+            pygame.mixer.stop()
 
-                    ws.send(json.dumps({'type': 'user_list', 'users': users}))
+        except: pass
 
+        
 
 
-                else:
 
-                    print(f"[WS-Call] Unknown type {mtype}")
+        
 
-                    
+        text_area_insert(f"🔴 直播來源已連線 ({request.remote_addr})", "Live")
 
-            except Exception as e:
+        
 
-                print(f"[WS-Call] Error processing: {e}")
+        # 常駐 mpv 可用時直接 loadfile 本機串流；否則退回每次啟動播放器的 stdin 管線
+        player = None
 
-                
+        if WARM_MPV and WARM_MPV.alive():
 
-    except Exception as e:
+            try:
 
-        print(f"[WS-Call] Connection error: {e}")
+                WARM_MPV.load(f"{_local_base_url()}/live/local.webm", volume=500, kind="live")
 
-    finally:
+                text_area_insert("直播播放器(常駐 MPV) 已接手", "Live")
 
-        if my_id and CALL_CLIENTS.get(my_id) == ws:
+            except Exception as e:
 
-            del CALL_CLIENTS[my_id]
+                print(f"[WS] warm mpv load failed: {e}")
 
-        print(f"[WS-Call] user {my_id} disconnected")
+                player = None
 
+            else:
 
+                player = False
 
-# ===============================
+        if player is None:
 
-# == [ANCHOR] Audio Blob Playback ==
+            player = LivePlayerPipe()
 
-# ===============================
+            player.start()
 
-@app.route('/api/speak_audio_blob', methods=['POST'])
+            LIVE_PLAYER = player
 
-def api_speak_audio_blob():
 
-    """Upload and play audio blob immediately."""
 
-    try:
+        # Loop
 
-        auto_unmute_if_needed()
+        try:
 
-        f = request.files.get('file')
+            chunk_count = 0
 
-        if not f: return jsonify(ok=False, error="no file"), 400
+            while True:
 
-        
+                data = ws.receive()
 
-        # Save temp file
+                if data:
 
-        ext = os.path.splitext(f.filename or "rec.wav")[1] or ".wav"
+                    chunk_count += 1
 
-        fname = f"rec_{int(time.time())}_{secrets.token_hex(4)}{ext}"
+                    if chunk_count % 50 == 0:
 
-        # [MODIFIED] Use RECORD_DIR for mic recordings
+                        print(f"[WS] Received chunk #{chunk_count}, len={len(data)}")
 
-        save_path = os.path.join(RECORD_DIR, fname)
 
-        f.save(save_path)
 
-        
+                    # 1. Cache header + latest cluster, 2. Relay to Subscribers
 
-        print(f"[Debug] 收到錄音上傳: {save_path} (Size: {os.path.getsize(save_path)} bytes)")
+                    #    （只丟進各自佇列，不在此等待網路；與新收聽者 prime 共用同一把鎖以免漏 chunk）
 
+                    resync = None
 
+                    try:
 
-        # Fix: Check for empty or too small files (prevent FFmpeg crash)
+                        with LIVE_BUFFER.lock:
 
-        file_size = os.path.getsize(save_path)
+                            resync = LIVE_BUFFER.feed(data)
 
-        if file_size < 1024:
+                            for sub in list(LIVE_CLIENTS):
 
-            try: os.remove(save_path)
+                                sub.offer(data, resync)
 
-            except: pass
+                    except Exception as e:
 
-            msg = f"錄音檔案過小 ({file_size} bytes)，可能錄音失敗或時間太短"
+                        print(f"[WS] Relay error: {e}")
 
-            text_area_insert(f"❌ {msg}", "Rec")
 
-            return jsonify(ok=False, error=msg), 400
 
+                    # 3. Pipe to Local FFplay（交給 LivePlayerPipe 的寫入執行緒）
 
+                    if player: player.feed(data, resync)
 
-        # Fix: Convert webm/other to MP3 for consistency and Pygame compatibility
+                else:
 
-        if ext.lower() == ".webm":
+                    break
 
-            if not _FFMPEG:
+        except Exception as e:
 
-                err = "伺服器無 ffmpeg，無法轉檔。請安裝 ffmpeg.exe。"
+            print(f"[WS] Broadcaster Error: {e}")
 
-                text_area_insert(f"❌ {err}", "Rec")
+        finally:
 
-                raise RuntimeError(err)
+            # Cleanup
 
-            
+            if RELAY_BROADCASTER_WS == ws:
 
-            text_area_insert(f"🔄 正在將 WebM 轉檔為 MP3...", "Rec")
+                RELAY_BROADCASTER_WS = None
 
-            try:
+                with LIVE_BUFFER.lock:
 
-                mp3_fname = os.path.splitext(fname)[0] + ".mp3"
+                    LIVE_BUFFER.reset()
 
-                mp3_path = os.path.join(RECORD_DIR, mp3_fname)
+                # 只有仍持有串流的連線才停常駐 mpv（重連時新連線已接手，不能把它的串流停掉）
+                if not player and WARM_MPV:
 
-                print(f"[Debug] 開始轉檔 WebM -> MP3: {mp3_path}")
+                    WARM_MPV.stop()
 
-                
+                text_area_insert(f"⏹️ 直播來源斷線", "Live")
 
-                # Convert: -vn (no video), 44.1k, stereo, 192k bitrate mp3
 
-                cmd = [_FFMPEG, "-y", "-i", save_path, "-vn", "-ar", "44100", "-ac", "2", "-b:a", "192k", mp3_path]
 
-                res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                # Force disconnect all subscribers so they reset
 
-                
+                try:
 
-                if res.returncode != 0:
+                    for sub in list(LIVE_CLIENTS):
 
-                    raise subprocess.CalledProcessError(res.returncode, cmd, output=res.stdout, stderr=res.stderr)
+                        sub.close()
 
+                    LIVE_CLIENTS.clear()
 
+                except Exception as e:
 
-                if os.path.exists(mp3_path) and os.path.getsize(mp3_path) > 0:
+                    print(f"[WS] Error closing subs: {e}")
 
-                    sz = os.path.getsize(mp3_path)
 
-                    print(f"[Debug] 轉檔成功, MP3 Size: {sz} bytes")
 
-                    text_area_insert(f"✅ 轉檔成功 ({sz} bytes)，準備播放", "Rec")
+            if player:
 
-                else:
+                player.close()
 
-                    msg = "轉檔後檔案消失或大小為 0"
+                if LIVE_PLAYER is player:
 
-                    text_area_insert(f"❌ {msg}", "Rec")
+                    LIVE_PLAYER = None
 
-                    print(f"[Debug] {msg}")
+                    
 
+    else:
 
+        # == Subscriber Setup ==
 
-                # Success, remove original
+        sub = LiveSubscriber(ws, request.remote_addr or "")
 
-                try: os.remove(save_path)
+        # Send cached header + latest cluster immediately
 
-                except: pass
+        with LIVE_BUFFER.lock:
 
-                
+            sub.prime(LIVE_BUFFER)
 
-                save_path = mp3_path
+            LIVE_CLIENTS.add(sub)
 
-                fname = mp3_fname
 
-                ext = ".mp3"
+        try:
 
-            except subprocess.CalledProcessError as cpe:
+            # Just keep connection open to receive
 
-                err_msg = cpe.stderr if cpe.stderr else str(cpe)
+            while True:
 
-                text_area_insert(f"❌ ffmpeg 轉檔失敗：{err_msg}", "Rec")
+                # We don't expect data from subscriber, but we must read to keep socket alive?
 
-                raise RuntimeError(f"轉檔 MP3 失敗: {err_msg}")
+                # Or just block.
 
-            except Exception as cvt_err:
+                data = ws.receive()
 
-                text_area_insert(f"❌ 轉檔發生例外：{cvt_err}", "Rec")
+                if not data: break 
 
-                raise RuntimeError(f"轉檔 MP3 發生例外: {cvt_err}")
+                # Ignore received data from subscriber
 
+        except:
 
+            pass
 
-        # Save metadata so it appears in file list
+        finally:
 
-        _write_upload_meta(save_path, "錄音-" + datetime.now().strftime("%H%M%S"), fname, "audio")
+            sub.close()
 
+            print(f"[WS] Subscriber disconnected: {request.remote_addr}")
 
 
-        # Queue for playback
 
-        print(f"[Debug] 呼叫 play_mp3_file({save_path})")
+@sock.route('/ws/call')
 
+def call_signaling(ws):
 
+    global CALL_CLIENTS
 
-        # Optional Chime: Merge audio if requested and ffmpeg is available
+    my_id = None
 
-        use_chime = request.form.get("chime") == "true" and _FFMPEG
+    try:
 
-        final_play_path = save_path
+        while True:
 
+            data = ws.receive()
 
+            if not data: break
 
-        if use_chime:
+            
 
             try:
 
-                # Prepare inputs
+                msg = json.loads(data)
 
-                inputs = []
+                mtype = msg.get('type')
 
-                # Fix: Resolve relative paths for ffmpeg
+                
 
-                start_p = resource_path(START_SOUND) if not os.path.isabs(START_SOUND) else START_SOUND
+                if mtype == 'login':
 
-                end_p = resource_path(END_SOUND) if not os.path.isabs(END_SOUND) else END_SOUND
+                    my_id = msg.get('id')
 
-                
+                    CALL_CLIENTS[my_id] = ws
+
+                    print(f"[WS-Call] user {my_id} logged in")
+
+                    ws.send(json.dumps({'type': 'login_ack', 'id': my_id}))
 
-                if os.path.exists(start_p): inputs.append(start_p)
+                    
 
-                inputs.append(save_path)
+                elif mtype in ('offer', 'answer', 'candidate', 'ready', 'invite', 'text_message'):
 
-                if os.path.exists(end_p): inputs.append(end_p)
+                    target = msg.get('target')
 
-                
+                    target_ws = CALL_CLIENTS.get(target)
 
-                if len(inputs) > 1:
+                    if target_ws:
 
-                    # Create concat list
+                        try:
 
-                    list_txt = os.path.splitext(save_path)[0] + "_list.txt"
+                            target_ws.send(data)
 
-                    merged_mp3 = os.path.splitext(save_path)[0] + "_chime.mp3"
+                        except:
 
-                    
+                            print(f"[WS-Call] Failed to send to {target}")
 
-                    with open(list_txt, "w", encoding="utf-8") as lf:
+                    else:
 
-                        for p in inputs:
+                        print(f"[WS-Call] Target {target} not found")
 
-                            # Escape paths for ffmpeg concat demuxer
+                        # Notify sender?
 
-                            p_esc = p.replace("\\", "/")
+                        
 
-                            lf.write(f"file '{p_esc}'\n")
+                elif mtype == 'list_users':
 
-                    
+                    # Optional: send list of connected signaling users
 
-                    # Merge (re-encode to safe MP3 to handle mismatch formats)
+                    users = list(CALL_CLIENTS.keys())
 
-                    # -y: overwrite
+                    ws.send(json.dumps({'type': 'user_list', 'users': users}))
 
-                    # -f concat -safe 0 -i list.txt
 
-                    # -b:a 192k (bitrate)
 
-                    cmd_merge = [_FFMPEG, "-y", "-f", "concat", "-safe", "0", "-i", list_txt, "-b:a", "192k", merged_mp3]
+                else:
 
-                    mres = subprocess.run(cmd_merge, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                    print(f"[WS-Call] Unknown type {mtype}")
 
                     
 
-                    # Cleanup list file
+            except Exception as e:
 
-                    try: os.remove(list_txt)
+                print(f"[WS-Call] Error processing: {e}")
 
-                    except: pass
+                
 
-                    
+    except Exception as e:
 
-                    if mres.returncode == 0 and os.path.exists(merged_mp3) and os.path.getsize(merged_mp3) > 100:
+        print(f"[WS-Call] Connection error: {e}")
 
-                        final_play_path = merged_mp3
+    finally:
 
-                        print(f"[Debug] 合併成功: {final_play_path}")
+        if my_id and CALL_CLIENTS.get(my_id) == ws:
 
-                    else:
+            del CALL_CLIENTS[my_id]
 
-                        print(f"[Debug] 合併失敗: {mres.stderr.decode('utf-8', errors='ignore')}")
+        print(f"[WS-Call] user {my_id} disconnected")
 
-            except Exception as e:
 
-                print(f"[Debug] Chime merge error: {e}")
 
+# ===============================
+# == [ANCHOR] 音效資產（前導音/鈴聲）==
+# ===============================
+# [NEW] 前導/結束音與鈴聲在開機時載入記憶體：去掉 ID3/Xing 標頭的 MP3 frame bytes + 長度。
+#       「前導音 + 內容 + 結束音」在取樣率/聲道一致時直接串接 MP3 frame，不需重新編碼。
+ASSET_MAX_FILE_BYTES = 8 * 1024 * 1024
+ASSET_MAX_TOTAL_BYTES = 64 * 1024 * 1024
+
+_MP3_BR = {1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+           2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]}
+_MP3_SR = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+def _mp3_frame_info(b, i):
+    """解析 i 位置的 MPEG Layer III frame header → (frame_len, sample_rate, mono, samples) 或 None"""
+    if i + 4 > len(b) or b[i] != 0xFF or (b[i + 1] & 0xE0) != 0xE0: return None
+    ver = (b[i + 1] >> 3) & 3; layer = (b[i + 1] >> 1) & 3
+    br_i = (b[i + 2] >> 4) & 15; sr_i = (b[i + 2] >> 2) & 3; pad = (b[i + 2] >> 1) & 1
+    if ver == 1 or layer != 1 or br_i in (0, 15) or sr_i == 3: return None
+    br = _MP3_BR[1 if ver == 3 else 2][br_i] * 1000
+    sr = _MP3_SR[ver][sr_i]
+    flen = (144 if ver == 3 else 72) * br // sr + pad
+    return flen, sr, ((b[i + 3] >> 6) & 3) == 3, (1152 if ver == 3 else 576)
+
+def _mp3_main_data_begin(frame):
+    """Layer III side info 的 main_data_begin：> 0 表示這個 frame 的資料有一部分放在前面 frame 裡（bit reservoir）"""
+    if len(frame) < 8: return 0
+    o = 4 if frame[1] & 1 else 6               # protection bit = 0 時 header 後面有 2 bytes CRC
+    if (frame[1] >> 3) & 3 == 3:               # MPEG1：9 bits
+        return (frame[o] << 1) | (frame[o + 1] >> 7)
+    return frame[o]                            # MPEG2/2.5：8 bits
+
+def mp3_frames(data):
+    """
+    去掉 ID3v2/ID3v1 與 Xing/Info/VBRI 標頭，回傳 (frame bytes, sample_rate, mono, duration 秒)；
+    不是 Layer III 或找不到連續 frame 時回傳 None。
+    """
+    i, end = 0, len(data)
+    if data[:3] == b"ID3" and end >= 10:
+        i = 10 + ((data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F))
+    if end >= 128 and data[end - 128:end - 125] == b"TAG": end -= 128
+    out = bytearray(); fmt = None; samples = 0; first = True
+    while i < end:
+        fi = _mp3_frame_info(data, i)
+        if not fi:
+            j = data.find(b"\xff", i + 1, end)   # 重新同步
+            if j < 0 or (fmt and j - i > 4096): break
+            i = j; continue
+        flen, sr, mono, spf = fi
+        if i + flen > end: break
+        if fmt is None: fmt = (sr, mono)
+        elif (sr, mono) != fmt: break
+        frame = data[i:i + flen]
+        if first and (b"Xing" in frame[:64] or b"Info" in frame[:64] or b"VBRI" in frame[:64]):
+            first = False; i += flen; continue
+        first = False
+        out += frame; samples += spf; i += flen
+    if not fmt or not out: return None
+    return bytes(out), fmt[0], fmt[1], samples / float(fmt[0])
+
+class AudioAsset:
+    __slots__ = ("path", "mtime", "size", "frames", "sample_rate", "mono", "duration")
+    def __init__(self, path, st, parsed):
+        self.path, self.mtime, self.size = path, st.st_mtime, st.st_size
+        self.frames, self.sample_rate, self.mono, self.duration = parsed
+
+    def compatible(self, other):
+        return other is not None and self.sample_rate == other.sample_rate and self.mono == other.mono
+
+class AssetRegistry:
+    """路徑 → AudioAsset；檔案 mtime/size 變了就重新載入"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._assets = {}
+        self.hits = self.loads = 0
+
+    def _key(self, path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def get(self, path, load=True):
+        if not path: return None
+        k = self._key(path)
+        try: st = os.stat(k)
+        except OSError: return None
+        with self._lock:
+            a = self._assets.get(k)
+            if a and a.mtime == st.st_mtime and a.size == st.st_size:
+                self.hits += 1
+                return a
+        if not load or not k.lower().endswith(".mp3") or st.st_size > ASSET_MAX_FILE_BYTES:
+            return None
+        try:
+            with open(k, "rb") as f: parsed = mp3_frames(f.read())
+        except OSError:
+            return None
+        if not parsed: return None
+        a = AudioAsset(k, st, parsed)
+        media_meta_put(k, st, duration=a.duration, sample_rate=a.sample_rate, mono=a.mono)
+        with self._lock:
+            if sum(x.size for x in self._assets.values() if x.path != k) + st.st_size > ASSET_MAX_TOTAL_BYTES:
+                return a       # 超過總量：照樣回傳但不常駐
+            self._assets[k] = a; self.loads += 1
+        return a
+
+    def preload(self, paths):
+        n = 0
+        for p in paths:
+            if self.get(p): n += 1
+        return n
+
+    def stats(self):
+        with self._lock:
+            return {"assets": len(self._assets), "bytes": sum(len(a.frames) for a in self._assets.values()),
+                    "hits": self.hits, "loads": self.loads}
+
+ASSETS = AssetRegistry()
+
+def preload_audio_assets():
+    """開機載入前導/結束/靜音提示音與 APP_DIR 下的鈴聲 MP3"""
+    paths = [START_SOUND, END_SOUND, globals().get("MUTE_SOUND")]
+    try: paths += sorted(glob.glob(os.path.join(APP_DIR, "*.mp3")))
+    except Exception: pass
+    t0 = time.perf_counter()
+    n = ASSETS.preload([p for p in paths if p])
+    print(f"[Assets] {n} audio asset(s) loaded in {(time.perf_counter() - t0) * 1000.0:.0f} ms")
+
+def mp3_concat(parts, dst):
+    """
+    把多段 MP3（AudioAsset）的 frame 直接串接寫到 dst；格式不一致時回傳 False（呼叫端改走重新編碼）。
+    接縫後的第一個 frame 若 main_data_begin != 0，會讀到前一個檔案尾端的 bytes（bit reservoir）而產生爆音，
+    這種情況也回傳 False，改走 PCM 合併。
+    """
+    parts = [p for p in parts if p is not None]
+    if not parts or any(not parts[0].compatible(p) for p in parts[1:]): return False
+    if any(_mp3_main_data_begin(p.frames[:16]) for p in parts[1:]): return False
+    tmp = dst + ".part"
+    with open(tmp, "wb") as f:
+        for p in parts: f.write(p.frames)
+    os.replace(tmp, dst)
+    return True
 
+# [NEW] 音檔長度/格式快取：key = 絕對路徑，mtime + size 不變就不重新解析。
+#       上傳（_write_upload_meta，並寫入 .json 側檔）與音效資產載入時預先填入；play_sound / broadcast_web_audio 共用。
+_MEDIA_META_LOCK = threading.Lock()
+MEDIA_META = {}                                    # path -> (mtime, size, meta dict)
+MEDIA_META_STATS = {"hits": 0, "misses": 0}
+
+def media_meta_put(path, st, **meta):
+    k = os.path.normcase(os.path.abspath(path))
+    with _MEDIA_META_LOCK:
+        MEDIA_META[k] = (st.st_mtime, st.st_size, meta)
+        while len(MEDIA_META) > 4096: MEDIA_META.pop(next(iter(MEDIA_META)))
+    return meta
+
+def _media_probe(path, st):
+    """實際解析音檔長度；優先讀上傳時寫入的 .json 側檔"""
+    try:
+        with open(path + ".json", "r", encoding="utf-8") as f: side = json.load(f)
+        if side.get("duration") and side.get("mtime") == st.st_mtime and side.get("size") == st.st_size:
+            return {"duration": float(side["duration"])}
+    except Exception:
+        pass
+    low = path.lower()
+    if low.endswith(".mp3"):
+        try:
+            from mutagen.mp3 import MP3
+            info = MP3(path).info
+            return {"duration": info.length, "sample_rate": info.sample_rate, "mono": info.channels == 1}
+        except Exception:
+            pass
+        if st.st_size <= ASSET_MAX_FILE_BYTES * 4:
+            with open(path, "rb") as f: parsed = mp3_frames(f.read())
+            if parsed: return {"duration": parsed[3], "sample_rate": parsed[1], "mono": parsed[2]}
+    elif low.endswith(".wav"):
+        import wave
+        with wave.open(path, "rb") as wf:
+            return {"duration": wf.getnframes() / float(wf.getframerate()), "sample_rate": wf.getframerate(),
+                    "mono": wf.getnchannels() == 1}
+    return None
 
-        play_mp3_file(final_play_path) 
+def media_meta(path, probe=True):
+    """取得音檔 metadata（至少含 duration）；找不到檔案或無法解析回傳 None"""
+    if not path: return None
+    k = os.path.normcase(os.path.abspath(path))
+    try: st = os.stat(k)
+    except OSError: return None
+    with _MEDIA_META_LOCK:
+        ent = MEDIA_META.get(k)
+        if ent and ent[0] == st.st_mtime and ent[1] == st.st_size:
+            MEDIA_META_STATS["hits"] += 1
+            return ent[2]
+        MEDIA_META_STATS["misses"] += 1
+    if not probe: return None
+    try: meta = _media_probe(k, st)
+    except Exception: meta = None
+    return media_meta_put(k, st, **meta) if meta else None
+
+def _media_meta_snapshot():
+    with _MEDIA_META_LOCK:
+        st = dict(MEDIA_META_STATS, entries=len(MEDIA_META))
+    st["hit_ratio"] = round(st["hits"] / max(1, st["hits"] + st["misses"]), 3)
+    return st
 
-        
+# ===============================
 
-        # [MODIFIED] Return recording URL with 'rec/' prefix context
+# == [ANCHOR] Audio Blob Playback ==
 
-        return jsonify(ok=True, file=f"rec/{os.path.basename(final_play_path)}")
+# ===============================
 
+# [NEW] 錄音上傳 → 背景轉檔工作：API 立即回傳 job id，轉檔/合併前導音在有上限的 worker pool 執行。
+#       單一串流階段：ffmpeg 解碼錄音一次（s16le）→ Python 依序送入「前導音 PCM + 錄音 PCM + 結束音 PCM」→ ffmpeg 編碼一次。
+# [MOD] 前導/結束音格式一致時改走 MP3 frame 串接（mp3_concat）：MP3 上傳完全不用 ffmpeg，其餘只編碼錄音本身。
+REC_JOB_WORKERS = 2
+REC_JOB_MAX_PENDING = 8
+REC_PCM_ARGS = ["-f", "s16le", "-ar", "44100", "-ac", "2"]
+REC_FFMPEG_WAIT_SEC = 60               # 收尾時等 ffmpeg 結束的上限，逾時直接 kill（避免卡死 worker）
+_rec_pool = None
+_rec_jobs_lock = threading.Lock()
+REC_JOBS = collections.OrderedDict()   # job_id -> dict（只保留最近 100 筆）
+REC_JOB_STATS = {"requests": 0, "jobs": 0, "failed": 0, "rejected": 0, "req_ms_sum": 0.0, "job_ms_sum": 0.0, "cpu_s_sum": 0.0}
+_CHIME_PCM = {}                        # path -> (mtime, size, pcm bytes)
+
+def _ffmpeg_bench_cpu(stderr_text):
+    """解析 ffmpeg -benchmark 的 'bench: utime=0.05s stime=0.01s'，回傳 CPU 秒數"""
+    m = re.search(r"bench:\s*utime=([\d.]+)s\s+stime=([\d.]+)s", stderr_text or "")
+    return float(m.group(1)) + float(m.group(2)) if m else 0.0
+
+def _chime_pcm(path):
+    """前導/結束音解碼成 PCM 後常駐記憶體（檔案變更才重新解碼）"""
+    if not path or not os.path.isfile(path): return b""
+    st = os.stat(path)
+    ent = _CHIME_PCM.get(path)
+    if ent and ent[0] == st.st_mtime and ent[1] == st.st_size:
+        return ent[2]
+    res = subprocess.run([_FFMPEG, "-v", "error", "-i", path, "-vn"] + REC_PCM_ARGS + ["pipe:1"],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if res.returncode != 0:
+        raise RuntimeError(f"chime decode failed: {res.stderr.decode('utf-8', 'ignore')[-200:]}")
+    _CHIME_PCM[path] = (st.st_mtime, st.st_size, res.stdout)
+    return res.stdout
+
+def _rec_transcode(src, dst, head=b"", tail=b""):
+    """
+    src 解碼一次成 PCM，前後接上已解碼的前導/結束音，單次編碼成 192k MP3。
+    回傳 ffmpeg 的 CPU 秒數（兩個行程合計）。
+    """
+    dec = subprocess.Popen([_FFMPEG, "-v", "error", "-benchmark", "-i", src, "-vn"] + REC_PCM_ARGS + ["pipe:1"],
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    enc = subprocess.Popen([_FFMPEG, "-v", "error", "-benchmark", "-y"] + REC_PCM_ARGS + ["-i", "pipe:0", "-b:a", "192k", dst],
+                           stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    errs = {}
+    def _drain(name, p):
+        errs[name] = p.stderr.read().decode("utf-8", "ignore")
+    ths = [threading.Thread(target=_drain, args=(n, p), daemon=True) for n, p in (("dec", dec), ("enc", enc))]
+    for t in ths: t.start()
+    ok = False
+    try:
+        if head: enc.stdin.write(head)
+        while True:
+            chunk = dec.stdout.read(65536)
+            if not chunk: break
+            enc.stdin.write(chunk)
+        if tail: enc.stdin.write(tail)
+        ok = True
+    except (BrokenPipeError, OSError):
+        pass                                   # 編碼端提早結束；下方以 returncode/stderr 回報
+    finally:
+        try: enc.stdin.close()
+        except Exception: pass
+        if not ok:
+            # 解碼端可能正卡在寫滿的 stdout pipe 上，先殺掉再等，否則 wait() 永遠不回來
+            for p in (dec, enc):
+                try: p.kill()
+                except OSError: pass
+        for p in (dec, enc):
+            try: p.wait(timeout=REC_FFMPEG_WAIT_SEC)
+            except subprocess.TimeoutExpired:
+                p.kill(); p.wait()
+        try: dec.stdout.close()
+        except Exception: pass
+        for t in ths: t.join(5)
+    if not ok or dec.returncode != 0 or enc.returncode != 0:
+        raise RuntimeError((errs.get("dec") or errs.get("enc") or f"ffmpeg exit {dec.returncode}/{enc.returncode}")[-400:])
+    if not (os.path.exists(dst) and os.path.getsize(dst) > 0):
+        raise RuntimeError("轉檔後檔案消失或大小為 0")
+    return _ffmpeg_bench_cpu(errs.get("dec")) + _ffmpeg_bench_cpu(errs.get("enc"))
+
+def _rec_chime_concat(src, ext, dst):
+    """前導音 + 錄音 + 結束音以 frame 串接；前導/結束音格式不一致時回傳 None（改走 PCM 合併）"""
+    head, tail = ASSETS.get(START_SOUND), ASSETS.get(END_SOUND)
+    if not head or not head.compatible(tail): return None
+    cpu = 0.0
+    if ext.lower() == ".mp3":
+        with open(src, "rb") as f: parsed = mp3_frames(f.read())
+        if parsed and mp3_concat([head, AudioAsset(src, os.stat(src), parsed), tail], dst):
+            return cpu
+    tmp = dst + ".body.mp3"
+    res = subprocess.run([_FFMPEG, "-v", "error", "-benchmark", "-y", "-i", src, "-vn", "-ar", str(head.sample_rate),
+                          "-ac", "1" if head.mono else "2", "-b:a", "192k", tmp],
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        err = res.stderr.decode("utf-8", "ignore")
+        if res.returncode != 0: raise RuntimeError(err[-400:] or f"ffmpeg exit {res.returncode}")
+        cpu = _ffmpeg_bench_cpu(err)
+        with open(tmp, "rb") as f: parsed = mp3_frames(f.read())
+        if not parsed or not mp3_concat([head, AudioAsset(tmp, os.stat(tmp), parsed), tail], dst):
+            return None
+    finally:
+        try: os.remove(tmp)
+        except OSError: pass
+    return cpu
+
+def _rec_job_run(job_id, save_path, ext, use_chime):
+    job = REC_JOBS[job_id]
+    job["status"] = "running"
+    t0 = time.perf_counter()
+    try:
+        base = os.path.splitext(save_path)[0]
+        final_path = save_path
+        cpu = 0.0
+        if ext.lower() == ".webm" or use_chime:
+            final_path = base + ("_chime.mp3" if use_chime else ".mp3")
+            text_area_insert(f"🔄 正在轉檔{'並合併前導音' if use_chime else ''}...", "Rec")
+            cpu = None
+            if use_chime:
+                try:
+                    cpu = _rec_chime_concat(save_path, ext, final_path)
+                    if cpu is None:
+                        cpu = _rec_transcode(save_path, final_path, _chime_pcm(START_SOUND), _chime_pcm(END_SOUND))
+                except Exception as e:
+                    # 同舊版：合併失敗就播放不含前導/結束音的錄音
+                    text_area_insert(f"⚠️ 前導音合併失敗，改播放原始錄音：{e}", "Rec")
+                    try: os.remove(final_path)
+                    except OSError: pass
+                    cpu = None
+                    final_path = base + ".mp3" if ext.lower() == ".webm" else save_path
+            if cpu is None and final_path != save_path:
+                cpu = _rec_transcode(save_path, final_path)
+            if final_path != save_path:
+                try: os.remove(save_path)
+                except: pass
+            cpu = cpu or 0.0
+            text_area_insert(f"✅ 轉檔成功 ({os.path.getsize(final_path)} bytes)，準備播放", "Rec")
+        # Save metadata so it appears in file list
+        _write_upload_meta(final_path, "錄音-" + datetime.now().strftime("%H%M%S"), os.path.basename(final_path), "audio")
+        play_mp3_file(final_path)
+        ms = (time.perf_counter() - t0) * 1000.0
+        job.update(status="done", file=f"rec/{os.path.basename(final_path)}", job_ms=round(ms, 1), cpu_s=round(cpu, 3))
+        with _rec_jobs_lock:
+            REC_JOB_STATS["jobs"] += 1; REC_JOB_STATS["job_ms_sum"] += ms; REC_JOB_STATS["cpu_s_sum"] += cpu
     except Exception as e:
+        job.update(status="error", error=str(e))
+        with _rec_jobs_lock: REC_JOB_STATS["failed"] += 1
+        text_area_insert(f"❌ 錄音轉檔失敗：{e}", "Rec")
+
+def _rec_job_submit(save_path, ext, use_chime):
+    global _rec_pool
+    with _rec_jobs_lock:
+        pending = sum(1 for j in REC_JOBS.values() if j["status"] in ("queued", "running"))
+        if pending >= REC_JOB_MAX_PENDING:
+            REC_JOB_STATS["rejected"] += 1
+            return None
+        if _rec_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _rec_pool = ThreadPoolExecutor(max_workers=REC_JOB_WORKERS, thread_name_prefix="rec-job")
+        job_id = secrets.token_hex(6)
+        REC_JOBS[job_id] = {"id": job_id, "status": "queued", "ts": time.time()}
+        while len(REC_JOBS) > 100: REC_JOBS.popitem(last=False)
+    _rec_pool.submit(_rec_job_run, job_id, save_path, ext, use_chime)
+    return job_id
+
+def _rec_perf_snapshot():
+    with _rec_jobs_lock:
+        st = dict(REC_JOB_STATS)
+        st["pending"] = sum(1 for j in REC_JOBS.values() if j["status"] in ("queued", "running"))
+    n = st["jobs"] or 1
+    st["avg_job_ms"] = round(st["job_ms_sum"] / n, 1)
+    st["avg_cpu_s"] = round(st["cpu_s_sum"] / n, 3)
+    st["avg_req_ms"] = round(st["req_ms_sum"] / max(1, st["requests"]), 1)
+    return st
+
+@app.get('/api/speak_audio_blob/<job_id>')
+def api_speak_audio_blob_status(job_id):
+    job = REC_JOBS.get(job_id)
+    if not job: return jsonify(ok=False, error="unknown job"), 404
+    return jsonify(ok=True, **job)
 
+@app.route('/api/speak_audio_blob', methods=['POST'])
+def api_speak_audio_blob():
+    """Upload audio blob; transcode/chime merge runs on the rec-job pool and plays when ready."""
+    t_req = time.perf_counter()
+    try:
+        auto_unmute_if_needed()
+        f = request.files.get('file')
+        if not f: return jsonify(ok=False, error="no file"), 400
+        # Save temp file
+        ext = os.path.splitext(f.filename or "rec.wav")[1] or ".wav"
+        fname = f"rec_{int(time.time())}_{secrets.token_hex(4)}{ext}"
+        # [MODIFIED] Use RECORD_DIR for mic recordings
+        save_path = os.path.join(RECORD_DIR, fname)
+        f.save(save_path)
+        print(f"[Debug] 收到錄音上傳: {save_path} (Size: {os.path.getsize(save_path)} bytes)")
+        # Fix: Check for empty or too small files (prevent FFmpeg crash)
+        file_size = os.path.getsize(save_path)
+        if file_size < 1024:
+            try: os.remove(save_path)
+            except: pass
+            msg = f"錄音檔案過小 ({file_size} bytes)，可能錄音失敗或時間太短"
+            text_area_insert(f"❌ {msg}", "Rec")
+            return jsonify(ok=False, error=msg), 400
+        use_chime = request.form.get("chime") == "true"
+        if (ext.lower() == ".webm" or use_chime) and not _FFMPEG:
+            if ext.lower() == ".webm":
+                err = "伺服器無 ffmpeg，無法轉檔。請安裝 ffmpeg.exe。"
+                text_area_insert(f"❌ {err}", "Rec")
+                return jsonify(ok=False, error=err), 500
+            use_chime = False
+        job_id = _rec_job_submit(save_path, ext, use_chime)
+        if not job_id:
+            try: os.remove(save_path)
+            except: pass
+            return jsonify(ok=False, error="轉檔工作過多，請稍後再試"), 503, {"Retry-After": "5"}
+        base = os.path.splitext(fname)[0]
+        final_name = base + ("_chime.mp3" if use_chime else ".mp3") if (ext.lower() == ".webm" or use_chime) else fname
+        with _rec_jobs_lock:
+            REC_JOB_STATS["requests"] += 1; REC_JOB_STATS["req_ms_sum"] += (time.perf_counter() - t_req) * 1000.0
+        # [MODIFIED] Return recording URL with 'rec/' prefix context
+        return jsonify(ok=True, job=job_id, status="queued", file=f"rec/{final_name}"), 202
+    except Exception as e:
         return jsonify(ok=False, error=str(e)), 500
 
 
@@ -2358,6 +3893,24 @@ def _write_upload_meta(save_path: str, orig_name: str, saved_name: str, mtype: s
 
         }
 
+        if mtype == "audio":   # [NEW] 上傳時就解析長度，播放時直接命中快取
+
+            AUDIO_INDEX.add(save_path)
+
+            try:
+
+                am = _media_probe(os.path.abspath(save_path), st)
+
+                if am:
+
+                    media_meta_put(save_path, st, **am)
+
+                    meta["duration"] = round(am["duration"], 3)
+
+            except Exception:
+
+                pass
+
         with open(f"{save_path}.json", "w", encoding="utf-8") as mf:
 
             json.dump(meta, mf, ensure_ascii=False)
@@ -2996,7 +4549,7 @@ def test_relay_on():
 
         _relay_set("last_cmd", "TestON")
 
-        control_usb_relay("ON")
+        relay_manual(True, "test")
 
         _relay_set("last_result", "OK"); _relay_set("last_error", "")
 
@@ -3012,7 +4565,7 @@ def test_relay_off():
 
         _relay_set("last_cmd", "TestOFF")
 
-        control_usb_relay("OFF")
+        relay_manual(False, "test")
 
         _relay_set("last_result", "OK"); _relay_set("last_error", "")
 
@@ -3290,30 +4843,173 @@ RELAY_ACTIVE_CNT = 0
 RELAY_ACTIVE_LOCK = threading.RLock()
 
 
-# [NEW] Relay Config Persistence
-RELAY_CONFIG_PATH = Path(DATA_DIR) / "relay_config.json"
-RELAY_AUTO_ON = True
+# [NEW] Relay Config Persistence
+RELAY_CONFIG_PATH = Path(DATA_DIR) / "relay_config.json"
+RELAY_AUTO_ON = True
+
+def _save_relay_config():
+    try:
+        data = {"auto_on": RELAY_AUTO_ON}
+        RELAY_CONFIG_PATH.write_text(json.dumps(data), encoding="utf-8")
+        print(f"[Config] Saved relay config: {data}")
+    except Exception as e:
+        print(f"[Config] Save relay config failed: {e}")
+
+def _load_relay_config():
+    global RELAY_AUTO_ON
+    try:
+        if RELAY_CONFIG_PATH.exists():
+            data = json.loads(RELAY_CONFIG_PATH.read_text(encoding="utf-8"))
+            RELAY_AUTO_ON = data.get("auto_on", True)
+            print(f"[Config] Loaded relay config: auto_on={RELAY_AUTO_ON}")
+    except Exception as e:
+        print(f"[Config] Load relay config failed: {e}")
+
+# Load immediately
+_load_relay_config()
+
+
+# [NEW] 繼電器預熱 / 共用 / 閒置寬限 / 工作週期統計
+#       舊做法：第一個 relay_acquire 之後固定 sleep 3 秒等擴大機開機 → 每個排程鈴聲都晚 3 秒。
+#       現在記錄繼電器 ON 的時間點，播放前只等「剩餘的」暖機時間（relay_wait_warm）；
+#       relay_prearm_loop 依課表/排程的下一筆，在到期前 RELAY_PREARM_LEAD_SEC 秒先持有繼電器，
+#       到期時已暖機完成，等待為 0。引用數歸零後延後 RELAY_IDLE_GRACE_SEC 才真正 OFF，
+#       期間再 acquire 直接沿用（連續項目共用同一次開機）。
+RELAY_WARMUP_SEC = 3.0          # 擴大機開機所需秒數
+RELAY_PREARM_LEAD_SEC = 5.0     # 排程/課表到期前多久先開（應 >= RELAY_WARMUP_SEC）
+RELAY_IDLE_GRACE_SEC = 10.0     # 閒置多久才關（0 = 立即關，同舊行為）
+RELAY_STATS = {"on_count": 0, "on_s_total": 0.0, "prearms": 0, "warm_waits": 0, "warm_wait_s": 0.0,
+               "grace_reuses": 0}
+_RELAY_ON_SINCE = None                   # 目前這次 ON 的 monotonic 起點（None = OFF）
+_RELAY_OFF_TIMER = None
+_RELAY_ON_LOG = collections.deque()      # 最近 24 小時的 (on, off) monotonic 區間（算工作週期）
+_RELAY_PREARM_COND = threading.Condition()
+_RELAY_PREARM_HELD = False               # relay_prearm_loop 目前是否持有一個引用（手動 OFF 會收回）
+RELAY_PREARM_HORIZON_SEC = 90            # 往後找「會出聲」項目的範圍（須大於預熱迴圈最長睡眠 30 秒 + 提前量）
+
+
+def _relay_switch(on):
+    """實際切換繼電器並記錄工作週期（呼叫者須持有 RELAY_ACTIVE_LOCK）"""
+    global _RELAY_ON_SINCE
+    now = time.monotonic()
+    if on:
+        control_usb_relay("ON")
+        if _RELAY_ON_SINCE is None:
+            _RELAY_ON_SINCE = now; RELAY_STATS["on_count"] += 1
+        return
+    control_usb_relay("OFF")
+    if _RELAY_ON_SINCE is not None:
+        RELAY_STATS["on_s_total"] += now - _RELAY_ON_SINCE
+        _RELAY_ON_LOG.append((_RELAY_ON_SINCE, now)); _RELAY_ON_SINCE = None
+    while _RELAY_ON_LOG and _RELAY_ON_LOG[0][1] < now - 86400: _RELAY_ON_LOG.popleft()
+
+
+def _relay_cancel_off_timer():
+    global _RELAY_OFF_TIMER
+    if _RELAY_OFF_TIMER is not None:
+        _RELAY_OFF_TIMER.cancel(); _RELAY_OFF_TIMER = None
+        return True
+    return False
+
+
+def _relay_idle_off():
+    global _RELAY_OFF_TIMER
+    with RELAY_ACTIVE_LOCK:
+        _RELAY_OFF_TIMER = None
+        if RELAY_ACTIVE_CNT == 0 and RELAY_AUTO_ON: _relay_switch(False)
+
+
+def relay_wait_warm(tag: str = "") -> float:
+    """等擴大機暖機：只睡 RELAY_WARMUP_SEC 扣掉已經 ON 的時間（預熱過就是 0）；回傳實際等待秒數"""
+    with RELAY_ACTIVE_LOCK:
+        since = _RELAY_ON_SINCE
+    if since is None: return 0.0
+    rem = RELAY_WARMUP_SEC - (time.monotonic() - since)
+    if rem <= 0: return 0.0
+    RELAY_STATS["warm_waits"] += 1; RELAY_STATS["warm_wait_s"] += rem
+    _diag(f"[Relay] {tag} waiting {rem:.2f}s for amp warm-up")
+    time.sleep(rem)
+    return rem
+
+
+_RELAY_SILENT_CMDS = ("SilentMsg:", "Schedule", "Set", "Relay", "Piper", "Cancel", "ForceClear", "StopAll",
+                      "Boy", "Girl", "男", "女", "Mute", "Unmute", "靜音", "解除靜音", "取消靜音")
+
+
+def _cmd_plays_audio(cmd):
+    """handle_msg 指令是否會出聲：音效表/Bell:/PlayMP3:/提示音，以及會朗讀的文字（ShowMsg:、一般文字）"""
+    cmd = (cmd or "").strip()
+    if not cmd: return False
+    if cmd in CMD_SOUND_TABLE or cmd.startswith(("Bell:", "PlayMP3:", "PlayWithChime:", "PlayChime:", "PlayTaigi:",
+                                                 "lang:tw|", "lang:nan|", "YTFull:", "ShowMsg:")):
+        return True
+    return not cmd.startswith(_RELAY_SILENT_CMDS)
+
 
-def _save_relay_config():
+def _relay_next_due(now):
+    """RELAY_PREARM_HORIZON_SEC 內第一筆「會出聲」的課表/排程項目到期時間（沒有回傳 None）"""
+    end = now + timedelta(seconds=RELAY_PREARM_HORIZON_SEC)
+    cands = []
     try:
-        data = {"auto_on": RELAY_AUTO_ON}
-        RELAY_CONFIG_PATH.write_text(json.dumps(data), encoding="utf-8")
-        print(f"[Config] Saved relay config: {data}")
+        cursor = now
+        while timetable_enabled:
+            nxt = TT_ENGINE.next_after(cursor)
+            if not nxt or nxt[0] > end: break
+            if any(_cmd_plays_audio(it.get("action")) for _, it in nxt[1]):
+                cands.append(nxt[0]); break
+            cursor = nxt[0] + timedelta(minutes=1)
     except Exception as e:
-        print(f"[Config] Save relay config failed: {e}")
-
-def _load_relay_config():
-    global RELAY_AUTO_ON
+        _diag(f"[Relay] prearm timetable lookup failed: {e}")
     try:
-        if RELAY_CONFIG_PATH.exists():
-            data = json.loads(RELAY_CONFIG_PATH.read_text(encoding="utf-8"))
-            RELAY_AUTO_ON = data.get("auto_on", True)
-            print(f"[Config] Loaded relay config: auto_on={RELAY_AUTO_ON}")
+        for at, it in SCHEDULE_INDEX.upcoming(end):
+            if (it.get("type") or "cmd").lower() == "sendmp3" or _cmd_plays_audio(it.get("payload")):
+                cands.append(at); break
     except Exception as e:
-        print(f"[Config] Load relay config failed: {e}")
+        _diag(f"[Relay] prearm schedule lookup failed: {e}")
+    return min(cands) if cands else None
+
+
+def relay_prearm_loop():
+    """到期前 RELAY_PREARM_LEAD_SEC 秒持有繼電器（tag=prearm），最後一筆到期 + 寬限後釋放"""
+    global _RELAY_PREARM_HELD
+    held_until, skip_due = None, None
+    while True:
+        try:
+            now = SCHED_CLOCK.now()
+            due = _relay_next_due(now) if RELAY_AUTO_ON else None
+            lead = (due - now).total_seconds() if due else None
+            with RELAY_ACTIVE_LOCK:
+                if held_until is not None and not _RELAY_PREARM_HELD:
+                    held_until, skip_due = None, due     # 被手動 OFF 收回：這一筆不再預熱
+                if lead is not None and lead <= RELAY_PREARM_LEAD_SEC and (skip_due is None or due > skip_due):
+                    if held_until is None:
+                        relay_acquire("prearm"); _RELAY_PREARM_HELD = True; RELAY_STATS["prearms"] += 1
+                        _diag(f"[Relay] prearm for {due.strftime('%H:%M:%S')} (lead {lead:.1f}s)")
+                    held_until = max(held_until or due, due + timedelta(seconds=RELAY_IDLE_GRACE_SEC))
+                if held_until is not None and now >= held_until:
+                    held_until = None
+                    if _RELAY_PREARM_HELD:
+                        _RELAY_PREARM_HELD = False; relay_release("prearm")
+            waits = [30.0]
+            if lead is not None: waits.append(lead - RELAY_PREARM_LEAD_SEC if lead > RELAY_PREARM_LEAD_SEC else lead + 0.5)
+            if held_until is not None: waits.append((held_until - now).total_seconds())
+            SCHED_CLOCK.wait(_RELAY_PREARM_COND, max(0.2, min(waits)))
+        except Exception as e:
+            _diag(f"[Relay] prearm loop error: {e}")
+            time.sleep(5)
 
-# Load immediately
-_load_relay_config()
+
+def _relay_snapshot():
+    now = time.monotonic()
+    with RELAY_ACTIVE_LOCK:
+        st = dict(RELAY_STATS, active=RELAY_ACTIVE_CNT, on=_RELAY_ON_SINCE is not None,
+                  off_pending=_RELAY_OFF_TIMER is not None)
+        on_now = now - _RELAY_ON_SINCE if _RELAY_ON_SINCE is not None else 0.0
+        day = sum(b - max(a, now - 86400) for a, b in _RELAY_ON_LOG if b > now - 86400)
+        if _RELAY_ON_SINCE is not None: day += now - max(_RELAY_ON_SINCE, now - 86400)
+    st["on_s_total"] = round(st["on_s_total"] + on_now, 1); st["warm_wait_s"] = round(st["warm_wait_s"], 2)
+    st["on_s_24h"] = round(day, 1); st["duty_24h"] = round(day / 86400.0, 4)
+    return st
 
 
 def relay_acquire(tag: str = "") -> bool:
@@ -3326,12 +5022,16 @@ def relay_acquire(tag: str = "") -> bool:
 
         RELAY_ACTIVE_CNT += 1
 
-        if RELAY_ACTIVE_CNT == 1:
+        reused = _relay_cancel_off_timer()
+        if _RELAY_ON_SINCE is None:
+            # [MOD] 依實際狀態判斷（手動 RelayOff/PlayChime:End 可能在持有期間關掉繼電器）
             if RELAY_AUTO_ON:
                 first_open = True
-                control_usb_relay("ON")
-            else:
+                _relay_switch(True)
+            elif RELAY_ACTIVE_CNT == 1:
                 _diag(f"[Relay] acquire({tag}) but Auto-On disabled. Skipping ON.")
+        elif reused:
+            RELAY_STATS["grace_reuses"] += 1   # [NEW] 寬限期內再次使用：繼電器仍是 ON
 
     return first_open
 
@@ -3339,15 +5039,20 @@ def relay_acquire(tag: str = "") -> bool:
 
 def relay_release(tag: str = ""):
 
-    global RELAY_ACTIVE_CNT
+    global RELAY_ACTIVE_CNT, _RELAY_OFF_TIMER
 
     with RELAY_ACTIVE_LOCK:
 
         RELAY_ACTIVE_CNT = max(0, RELAY_ACTIVE_CNT - 1)
 
         if RELAY_ACTIVE_CNT == 0:
-            if RELAY_AUTO_ON:
-                control_usb_relay("OFF")
+            if RELAY_AUTO_ON and RELAY_IDLE_GRACE_SEC > 0:
+                # [MOD] 延後關閉：寬限期內有新的 acquire 就沿用
+                _relay_cancel_off_timer()
+                _RELAY_OFF_TIMER = threading.Timer(RELAY_IDLE_GRACE_SEC, _relay_idle_off)
+                _RELAY_OFF_TIMER.daemon = True; _RELAY_OFF_TIMER.start()
+            elif RELAY_AUTO_ON:
+                _relay_switch(False)
             else:
                 _diag(f"[Relay] release({tag}) but Auto-On disabled. Skipping OFF.")
 
@@ -3361,7 +5066,27 @@ def relay_force_off():
 
         RELAY_ACTIVE_CNT = 0
 
-    control_usb_relay("OFF")
+        relay_manual(False, "force_off")
+
+
+
+def relay_manual(on: bool, tag: str = ""):
+    """
+    手動/指令開關（RelayOn/RelayOff、PlayChime、測試按鈕）：經 _relay_switch 記錄狀態。
+    手動 OFF 同時取消閒置寬限計時、收回預熱 hold，之後的 relay_acquire 會重新開啟並等暖機。
+    """
+    global RELAY_ACTIVE_CNT, _RELAY_PREARM_HELD
+    with RELAY_ACTIVE_LOCK:
+        _relay_cancel_off_timer()
+        if on:
+            _relay_switch(True)
+            return
+        if _RELAY_PREARM_HELD:
+            _RELAY_PREARM_HELD = False
+            RELAY_ACTIVE_CNT = max(0, RELAY_ACTIVE_CNT - 1)
+        _relay_switch(False)
+    with _RELAY_PREARM_COND: _RELAY_PREARM_COND.notify_all()
+    _diag(f"[Relay] manual OFF ({tag})")
 
 
 
@@ -3405,6 +5130,52 @@ def _broadcast_web(msg):
         for d in dead:
             if d in WEB_WS_CLIENTS: WEB_WS_CLIENTS.remove(d)
 
+# [NEW] 同步播放：兩階段廣播
+#   1) prepare：排程/課表在響鈴前 SYNC_PREFETCH_SEC 秒先送 URL，前端預先下載、解碼
+#   2) play_audio 帶 play_at（伺服器時鐘 epoch 秒），前端以 /ws/web 上的 clock 握手換算本機時間後同時起播
+#   前端起播後回報實際誤差（skew），統計在 /api/perf 的 "sync"。
+SYNC_LEAD_SEC = 0.6          # 臨時廣播：play_at = 現在 + lead（讓各端有時間對齊）
+SYNC_PREFETCH_SEC = 20       # 排程/課表提前送 prepare 的秒數
+SYNC_SKEWS = collections.deque(maxlen=500)   # 最近回報的起播誤差（ms）
+SYNC_STATS = {"prepares": 0, "reports": 0, "clock_pings": 0}
+_SYNC_PREPARED = {}          # url -> 送出 prepare 的時間（避免重複）
+
+def audio_prepare(filename):
+    """送出 prepare（預載）訊息；同一 URL 60 秒內只送一次"""
+    real_path = filename if os.path.isabs(filename) else resource_path(filename)
+    if not os.path.isfile(real_path): return False
+    url = audio_url_for(real_path) or _audio_url_guess(real_path)
+    now = time.time()
+    if now - _SYNC_PREPARED.get(url, 0) < 60: return False
+    for u in [u for u, t in _SYNC_PREPARED.items() if now - t > 300]: _SYNC_PREPARED.pop(u, None)
+    _SYNC_PREPARED[url] = now
+    HOT_AUDIO.warm(real_path)
+    SYNC_STATS["prepares"] += 1
+    _broadcast_web(json.dumps({"type": "prepare", "url": url, "name": os.path.basename(real_path), "ts": now}))
+    return True
+
+def _ws_web_message(ws, data):
+    """/ws/web 的 JSON 訊息：clock 對時握手、skew 起播誤差回報"""
+    try: m = json.loads(data)
+    except Exception: return
+    kind = m.get("type")
+    if kind == "clock":
+        SYNC_STATS["clock_pings"] += 1
+        ws.send(json.dumps({"type": "clock", "t0": m.get("t0"), "ts": time.time()}))
+    elif kind == "skew":
+        try: skew = float(m.get("skew_ms"))
+        except (TypeError, ValueError): return
+        SYNC_SKEWS.append(skew); SYNC_STATS["reports"] += 1
+
+def _sync_snapshot():
+    st = dict(SYNC_STATS)
+    vals = sorted(abs(v) for v in list(SYNC_SKEWS))
+    if vals:
+        st["skew_abs_ms_p50"] = round(vals[len(vals) // 2], 1)
+        st["skew_abs_ms_p95"] = round(vals[min(len(vals) - 1, int(len(vals) * 0.95))], 1)
+        st["skew_abs_ms_max"] = round(vals[-1], 1)
+    return st
+
 
 
 def set_playing_status(text):
@@ -3471,10 +5242,8 @@ def _set_progress(pct):
 
 
 
-def broadcast_web_audio(filename, duration=0):
-    """
-    廣播音訊播放給所有 Web 用戶 (已優化，支援重複過濾)
-    """
+def _audio_url_guess(filename):
+    """不在已知目錄下的檔案：沿用舊的路徑字串判斷"""
     basename = os.path.basename(filename)
     
     # 決定網頁可存取的相對路徑
@@ -3482,6 +5251,9 @@ def broadcast_web_audio(filename, duration=0):
     
     if "static/audio" in clean_path.lower():
         url = f"/static/audio/{quote(basename)}"
+    elif globals().get("TTS_CACHE") and _tts_is_cache_file(filename):
+        # [NEW] TTS 快取檔（內容定址，檔名即 key）
+        url = f"/api/audio_proxy?path={quote('tts_cache/' + basename)}"
     elif "UploadedMP3" in filename or "uploads" in filename.lower():
         rel_path = f"uploads/{basename}"
         url = f"/api/audio_proxy?path={quote(rel_path)}"
@@ -3495,6 +5267,23 @@ def broadcast_web_audio(filename, duration=0):
     else:
         # 預設為根目錄資源
         url = f"/api/audio_proxy?path={quote(basename)}"
+    return url
+
+def broadcast_web_audio(filename, duration=0, seq=None, at=None, stream=None):
+    """
+    廣播音訊播放給所有 Web 用戶 (已優化，支援重複過濾)
+    at：伺服器時鐘的起播時間（epoch 秒）；分段朗讀（seq）依前端佇列接續播放，不帶 play_at
+    stream/seq：同一次分段朗讀的識別與段號（前導音為 -1），前端依 seq 排入佇列
+    """
+    basename = os.path.basename(filename)
+    url = audio_url_for(filename) or _audio_url_guess(filename)   # [MOD] 先查音檔索引
+    if seq is not None:
+        url += f"{'&' if '?' in url else '?'}seq={int(seq)}"
+    real_path = filename if os.path.isabs(filename) else resource_path(filename)
+    if not duration:   # [NEW] 直接呼叫（Bell:/PlayMP3:）時也帶上長度，共用 media_meta 快取
+        meta = media_meta(real_path)
+        if meta: duration = round(meta["duration"], 3)
+    HOT_AUDIO.warm(real_path)   # [NEW] 所有瀏覽器即將同時來抓：先讀進熱快取
 
     
     # Deduplication - Server-side prevent double broadcast
@@ -3512,6 +5301,8 @@ def broadcast_web_audio(filename, duration=0):
         "name": basename,
         "duration": duration,
         "ts": now,
+        "play_at": at or (now + SYNC_LEAD_SEC if seq is None else None),
+        "seq": seq, "stream": stream,
         "guid": broadcast_id
     })
     print(f"[WS-Audio] Broadcasting: {basename} (ID: {broadcast_id[:8]})")
@@ -3527,7 +5318,14 @@ def broadcast_web_audio(filename, duration=0):
             if d in WEB_WS_CLIENTS:
                 WEB_WS_CLIENTS.remove(d)
 
-def play_sound(filename, duration_estimate=None, ignore_interrupt=False, wait=True):
+def _probe_duration(real_path):
+    """音檔長度（秒）；走 media_meta 快取，讀不到時回傳保守估計"""
+    meta = media_meta(real_path)
+    if meta: return meta["duration"]
+    low = (real_path or "").lower()
+    return 3.5 if low.endswith(".mp3") else 3.0 if low.endswith(".wav") else 2.0
+
+def play_sound(filename, duration_estimate=None, ignore_interrupt=False, wait=True, seq=None, stream=None):
     print(f"[Speaker] 播放音訊: {filename} (wait={wait})")
     try:
         # Resolve real path
@@ -3535,29 +5333,18 @@ def play_sound(filename, duration_estimate=None, ignore_interrupt=False, wait=Tr
         if not os.path.isabs(real_path):
             real_path = resource_path(real_path)
             
-        # 1. Local Playback Removed - Fully Web-based now
-
+        # 1. Local Playback Removed - Fully Web-based now（USE_LOCAL_MPV 時交給常駐 mpv）
+        if WARM_MPV:
+            try: WARM_MPV.load(real_path, kind="file", mode="replace" if seq is None else "append-play")
+            except Exception as e: print(f"[Speaker] warm mpv load failed: {e}")
         # 2. Progress Calculation
         if not duration_estimate or duration_estimate <= 0:
-            try:
-                if real_path.lower().endswith(".mp3"):
-                    try:
-                        from mutagen.mp3 import MP3
-                        duration_estimate = MP3(real_path).info.length
-                    except: duration_estimate = 3.5
-                elif real_path.lower().endswith(".wav"):
-                    import wave
-                    with wave.open(real_path, 'rb') as wf:
-                        duration_estimate = wf.getnframes() / float(wf.getframerate())
-                else:
-                    duration_estimate = 2.0
-            except:
-                duration_estimate = 3.0
+            duration_estimate = _probe_duration(real_path)
         
         if duration_estimate < 0.5: duration_estimate = 0.5
         
-        # 3. Web Broadcast
-        broadcast_web_audio(filename, duration_estimate)
+        # 3. Web Broadcast（seq：分段朗讀的段號，讓同一檔案的重複段落不被去重吃掉）
+        broadcast_web_audio(filename, duration_estimate, seq=seq, stream=stream)
         
         # 4. Progress Loop
         if not wait:
@@ -3569,6 +5356,7 @@ def play_sound(filename, duration_estimate=None, ignore_interrupt=False, wait=Tr
             # Check for interrupt
             if stop_playback_event.is_set() and not ignore_interrupt:
                 stop_web_audio()
+                if WARM_MPV: WARM_MPV.stop()
                 break
             time.sleep(0.1)
             t += 0.1
@@ -3587,6 +5375,7 @@ def _interrupt_current_playback():
     print("[Playback] Interrupting current playback...")
     stop_playback_event.set()
     stop_web_audio()
+    if WARM_MPV: WARM_MPV.stop()
     # 給予一點時間讓 Worker 看到 Event，然後再清除，避免誤殺緊接而來的新任務
     time.sleep(0.1)
     stop_playback_event.clear()
@@ -3598,11 +5387,9 @@ def with_relay_playback(play_func):
 
     def wrapper(*args, **kwargs):
 
-        first = relay_acquire(play_func.__name__)
-
-        if first:
+        relay_acquire(play_func.__name__)
 
-            time.sleep(3)
+        relay_wait_warm(play_func.__name__)   # [MOD] 只等剩餘暖機時間（預熱過則不等）
 
         try:
 
@@ -4188,7 +5975,64 @@ def taigi_play_wav_with_fx(path):
     except Exception as e:
         text_area_insert(f"❌ 台語播放例外：{e}")
 
-def tts_full_play(text, force_chime_off=False): asyncio.run(speak_text_async(text, force_chime_off))
+# [NEW] 語音路徑共用一個常駐 event loop（不再每則訊息 asyncio.run 建立/拆除 loop 與 executor）
+TTS_EXECUTOR_WORKERS = 8
+
+class SpeechLoop:
+    """
+    常駐 asyncio loop（獨立執行緒 run_forever）。
+    阻塞型引擎（Melo / Piper / Azure / gTTS / play_sound）走 loop 的預設 executor；
+    Flask 執行緒與 speech_worker 以 run() 提交 coroutine 並等待結果。
+    """
+    def __init__(self, workers=TTS_EXECUTOR_WORKERS):
+        self._workers = workers
+        self._lock = threading.Lock()
+        self.loop = None
+        self._thread = None
+        self.jobs = 0
+
+    def _ensure(self):
+        with self._lock:
+            if self.loop and self._thread and self._thread.is_alive():
+                return self.loop
+            from concurrent.futures import ThreadPoolExecutor
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="tts-exec"))
+            ready = threading.Event()
+            def _run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+            self._thread = threading.Thread(target=_run, name="speech-loop", daemon=True)
+            self._thread.start()
+            ready.wait(5.0)
+            self.loop = loop
+            return loop
+
+    def submit(self, coro):
+        """非阻塞提交，回傳 concurrent.futures.Future"""
+        self.jobs += 1
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure())
+
+    def run(self, coro, timeout=None):
+        """提交並等待結果；不可在 loop 執行緒內呼叫（會死結）"""
+        if self._thread is not None and threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("SpeechLoop.run() called from the loop thread")
+        fut = self.submit(coro)
+        try:
+            return fut.result(timeout)
+        except BaseException:
+            fut.cancel()
+            raise
+
+SPEECH_LOOP = SpeechLoop()
+
+async def _in_executor(fn, *args, **kwargs):
+    """在 loop 的 executor 執行阻塞函式（例如 play_sound），讓 loop 繼續處理其他合成/預覽"""
+    return await asyncio.get_running_loop().run_in_executor(None, lambda: fn(*args, **kwargs))
+
+def tts_full_play(text, force_chime_off=False): SPEECH_LOOP.run(speak_text_async(text, force_chime_off))
 
 
 
@@ -4197,6 +6041,40 @@ def tts_full_play(text, force_chime_off=False): asyncio.run(speak_text_async(tex
 PIPER_CFG_PATH = Path(DATA_DIR) / "piper.json"
 PIPER_CFG = {} # 全域設定快取
 PIPER_FORCE = False  # 透過指令臨時強制 Piper 優先（見 handle_msg）
+PIPER_WARM = True    # [NEW] 每個模型常駐一個 piper 行程（--json-input），不再每句重新載入 ONNX
+PIPER_MAX_RESIDENT = 2
+
+# [NEW] 模型清單快取：原本每次朗讀都 glob 一次；PiperSet / POST /piper/config 時清除
+_piper_reg_lock = threading.Lock()
+_PIPER_MODELS = None          # [*.onnx, ...]（APP_DIR 優先，再來 APP_DIR/piper）
+_PIPER_MATCH_CACHE = {}       # lang_code -> model path ("" = 找不到)
+
+def _piper_models():
+    global _PIPER_MODELS
+    with _piper_reg_lock:
+        if _PIPER_MODELS is None:
+            found = []
+            for d in (APP_DIR, os.path.join(APP_DIR, "piper")):
+                try:
+                    if os.path.isdir(d): found += glob.glob(os.path.join(d, "*.onnx"))
+                except Exception: pass
+            _PIPER_MODELS = found
+        return list(_PIPER_MODELS)
+
+def _piper_registry_invalidate():
+    """模型清單/語系對應重新掃描，並關掉常駐 piper（參數是啟動時帶入的）"""
+    global _PIPER_MODELS
+    with _piper_reg_lock:
+        _PIPER_MODELS = None
+        _PIPER_MATCH_CACHE.clear()
+    _piper_close_warm()
+
+def _piper_save_cfg(cfg):
+    try:
+        PIPER_CFG_PATH.write_text(json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+    finally:
+        _piper_registry_invalidate()
+
 
 
 
@@ -4212,29 +6090,10 @@ def _piper_find_model():
 
     """
 
-    try:
-
-        # Look for .onnx files in APP_DIR
-
-        models = glob.glob(os.path.join(APP_DIR, "*.onnx"))
-
-        if models:
-
-            return models[0]
-
-        # Check inside piper folder
-
-        models = glob.glob(os.path.join(APP_DIR, "piper", "*.onnx"))
-
-        if models:
-
-            return models[0]
-
-    except Exception:
+    models = _piper_models()
 
-        pass
+    return models[0] if models else None
 
-    return None
 
 
 
@@ -4390,43 +6249,146 @@ def _piper_match_model(lang_code: str) -> str:
 
     
 
+    with _piper_reg_lock:
+
+        if lang_code in _PIPER_MATCH_CACHE: return _PIPER_MATCH_CACHE[lang_code]
+
     candidates = []
 
-    # Scan APP_DIR and APP_DIR/piper
+    found = ""
 
-    dirs_to_scan = [APP_DIR, os.path.join(APP_DIR, "piper")]
+    # Scan APP_DIR and APP_DIR/piper（快取的模型清單）
 
-    try:
+    for p in _piper_models():
 
-        for d in dirs_to_scan:
+        name = os.path.basename(p)
 
-            if not os.path.isdir(d): continue
+        if simplified in name:
 
-            for p in glob.glob(os.path.join(d, "*.onnx")):
+            found = p # Found fairly specific match
 
-                name = os.path.basename(p)
+            break
 
-                if simplified in name:
+        # If only primary language matches (e.g. 'en' in 'en_US')
 
-                    return p # Found fairly specific match
+        if parts[0] in name:
 
-                # If only primary language matches (e.g. 'en' in 'en_US')
+            candidates.append(p)
 
-                if parts[0] in name:
+    if not found and candidates: found = candidates[0]
 
-                    candidates.append(p)
+    with _piper_reg_lock:
 
-    except: pass
+        _PIPER_MATCH_CACHE[lang_code] = found
 
-    
+    return found  # "" = Not found
+
+
+
+
+
+class PiperProc:
+    """
+    常駐 piper 行程：--json-input 模式，stdin 每行一個 {"text", "output_file"}，
+    合成完成後 piper 會在 stdout 印出輸出檔路徑。一次只處理一句（lock）。
+    """
+    def __init__(self, exe, model, cfg):
+        self.model = model
+        cmd = [exe, "--model", model, "--json-input", "--output_dir", tempfile.gettempdir(),
+               "--length-scale", str(cfg.get("length_scale", 1.0)),
+               "--noise-scale", str(cfg.get("noise_scale", 0.667)),
+               "--noise-w", str(cfg.get("noise_w", 0.8))]
+        spk = (cfg.get("speaker") or "").strip()
+        if spk: cmd += ["--speaker", spk]
+        flags = 0x08000000 if os.name == "nt" else 0   # CREATE_NO_WINDOW
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                     text=True, encoding="utf-8", bufsize=1, creationflags=flags)
+        self.lock = threading.Lock()
+        self.served = 0
+        self.last_used = time.time()
+        self._q = queue.Queue()
+        self._err = collections.deque(maxlen=20)
+        threading.Thread(target=self._read, daemon=True).start()
+        threading.Thread(target=self._drain_err, daemon=True).start()
+
+    def _read(self):
+        try:
+            for line in self.proc.stdout: self._q.put(line.strip())
+        finally:
+            self._q.put(None)
 
-    if candidates: return candidates[0]
+    def _drain_err(self):
+        try:
+            for line in self.proc.stderr: self._err.append(line.rstrip())
+        except Exception:
+            pass
 
-    return ""  # Not found
+    def alive(self):
+        return self.proc.poll() is None
 
+    def synth(self, text, out_wav, timeout=60.0):
+        with self.lock:
+            self.last_used = time.time()
+            line = json.dumps({"text": " ".join(text.split()), "output_file": out_wav}, ensure_ascii=False)
+            self.proc.stdin.write(line + "\n"); self.proc.stdin.flush()
+            deadline = time.monotonic() + timeout
+            while True:
+                try: got = self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty: raise TimeoutError(f"piper timeout ({timeout:.0f}s)")
+                if got is None:
+                    raise RuntimeError(f"piper exited (code={self.proc.poll()}): {' | '.join(list(self._err)[-3:])}")
+                if got and os.path.normcase(os.path.abspath(got)) == os.path.normcase(os.path.abspath(out_wav)):
+                    break
+            self.served += 1
+        if not (os.path.isfile(out_wav) and os.path.getsize(out_wav) > 0):
+            raise RuntimeError("piper produced no audio")
 
+    def close(self):
+        try: self.proc.stdin.close()
+        except Exception: pass
+        try: self.proc.kill()
+        except Exception: pass
 
 
+_piper_warm_lock = threading.Lock()
+PIPER_PROCS = collections.OrderedDict()   # (exe, model) -> PiperProc，LRU
+PIPER_STATS = {"warm": 0, "cold": 0, "spawns": 0, "failures": 0, "warm_ms_sum": 0.0, "cold_ms_sum": 0.0}
+
+def _piper_get_warm(exe, model):
+    key = (exe, model)
+    with _piper_warm_lock:
+        p = PIPER_PROCS.get(key)
+        if p and p.alive():
+            PIPER_PROCS.move_to_end(key)
+            return p
+        if p: PIPER_PROCS.pop(key).close()
+        p = PiperProc(exe, model, PIPER_CFG)
+        PIPER_STATS["spawns"] += 1
+        PIPER_PROCS[key] = p
+        while len(PIPER_PROCS) > PIPER_MAX_RESIDENT:
+            PIPER_PROCS.popitem(last=False)[1].close()
+        return p
+
+def _piper_drop_warm(proc):
+    with _piper_warm_lock:
+        for k, p in list(PIPER_PROCS.items()):
+            if p is proc: PIPER_PROCS.pop(k)
+    proc.close()
+
+def _piper_close_warm():
+    with _piper_warm_lock:
+        procs = list(PIPER_PROCS.values()); PIPER_PROCS.clear()
+    for p in procs: p.close()
+
+def _piper_perf_snapshot():
+    with _piper_warm_lock:
+        st = dict(PIPER_STATS)
+        st["resident"] = [{"model": os.path.basename(p.model), "pid": p.proc.pid, "served": p.served} for p in PIPER_PROCS.values()]
+    st["warm_avg_ms"] = round(st["warm_ms_sum"] / st["warm"], 1) if st["warm"] else 0.0
+    st["cold_avg_ms"] = round(st["cold_ms_sum"] / st["cold"], 1) if st["cold"] else 0.0
+    return st
+
+atexit.register(_piper_close_warm)
 
 def _piper_run_to_wav(text: str, out_wav: str, lang_code: str = None) -> tuple[bool, str]:
 
@@ -4476,569 +6438,799 @@ def _piper_run_to_wav(text: str, out_wav: str, lang_code: str = None) -> tuple[b
 
 
 
-    cmd = [
-
-        exe, "--model", use_model, "--output_file", out_wav,
-
-        "--length-scale", str(PIPER_CFG.get("length_scale", 1.0)),
-
-        "--noise-scale", str(PIPER_CFG.get("noise_scale", 0.667)),
-
-        "--noise-w", str(PIPER_CFG.get("noise_w", 0.8)),
-
-    ]
-
-    spk = (PIPER_CFG.get("speaker") or "").strip()
-
-    if spk:
-
-        # 注意：若切換模型，原 speaker ID 可能不適用，這裡暫時保留
-
-        cmd += ["--speaker", spk]
-
-    try:
-
-        # Match standalone script: Popen with text=True, encoding='utf-8'
-
-        process = subprocess.Popen(
-
-            cmd,
-
-            stdin=subprocess.PIPE,
-
-            stdout=subprocess.PIPE,
-
-            stderr=subprocess.PIPE,
-
-            text=True,
-
-            encoding='utf-8'
-
-        )
-
-        stdout, stderr = process.communicate(input=text)
-
-        
-
-        ok = (process.returncode == 0 and os.path.isfile(out_wav) and os.path.getsize(out_wav) > 0)
-
-        log = stderr if stderr else (stdout if stdout else "")
-
-        if not ok and not log:
-
-            log = f"No output. ExitCode={process.returncode}, WavExists={os.path.isfile(out_wav)}"
-
-
-
-        return (ok, log if log else ("OK" if ok else "no output"))
-
-    except Exception as e:
-
-        return (False, str(e))
-
-
-
-async def speak_text_async(text, force_chime_off=False):
-    try:
-        should_chime = CHIME_ENABLED and (not force_chime_off)
-        # Parse Per-Message Metadata: {{L=xx|G=xx}}text
-        local_lang = None
-        local_gender = None
-        
-        # [Safety] Strip sender tag if present (e.g. "@API_V2: ...")
-        # Matches "@Tag: " or "@Tag： " at start
-        if text.startswith("@"):
-            import re
-            text = re.sub(r"^@[\w_]+[:：]\s*", "", text)
-
-        if text.startswith("{{") and "}}" in text:
-            try:
-                end_idx = text.find("}}")
-                meta_str = text[2:end_idx]
-                text = text[end_idx+2:]
-                for part in meta_str.split("|"):
-                    if "=" in part:
-                        k, v = part.split("=", 1)
-                        if k == "L": local_lang = v
-                        if k == "G": local_gender = v
-                        if k == "C" and v == "off": force_chime_off = True
-            except Exception: pass
-
-        stop_playback_event.clear()  # ←避免前導音被殘留的停止旗標打斷
-        if stop_playback_event.is_set() or voice_muted:
-            return
-        ui_safe(set_playing_status, " 朗讀中：")
-        ui_safe(_set_progress, 0); STATE["progress"] = 0
-
-        # [Fix] Unified Rate Fetching
-        active_rate = STATE.get("voice_rate") or STATE.get("rate") or str(globals().get("voice_rate", "0%"))
-        if not active_rate.endswith("%"): active_rate += "%"
-        if not (active_rate.startswith("+") or active_rate.startswith("-")):
-            active_rate = "+" + active_rate
-            
-        print(f"[DEBUG] speak_text_async: Using active_rate={active_rate}")
-
-        lang = local_lang if local_lang else detect_language(text)
-        is_taigi = (lang == "nan-TW")
-
+    # [NEW] 常駐行程優先；失敗就丟掉該行程並退回單次啟動
 
+    if PIPER_WARM:
 
-        # 台語路徑：交給專用函式播放，避免重複前導/結束音
-
-        if is_taigi:
+        proc = None
 
-            play_taigi_tts(text)
+        t0 = time.perf_counter()
 
-            return
+        try:
 
+            proc = _piper_get_warm(exe, use_model)
 
+            proc.synth(text, out_wav)
 
-        # [NEW] 0. MeloTTS (Priority 1)
-        # 限制 Melo 僅處理中文 (zh-TW, zh-CN, zh)
-        is_zh = (lang and (lang.startswith("zh") or "zh" in lang))
-        
-        will_use_melo = (USE_MELO_TTS and HAS_MELO and melo_model and is_zh)
+            PIPER_STATS["warm"] += 1; PIPER_STATS["warm_ms_sum"] += (time.perf_counter() - t0) * 1000.0
 
-        if stop_playback_event.is_set() or voice_muted:
-            return
+            return (True, "OK (warm)")
 
-        if USE_MELO_TTS:
-            if not (HAS_MELO and melo_model):
-                 text_area_insert(f"⚠️ 跳過 MeloTTS (Init={HAS_MELO}, Err={MELO_ERR})", "TTS")
-            elif not is_zh:
-                 text_area_insert(f"ℹ️ MeloTTS 僅限中文，目前語系 {lang} 將跳過並使用備援引擎", "TTS")
-        
-        if will_use_melo:
-            try:
-                # 判定角色 
-                melo_speaker_id = 0 # default
-                try:
-                    # Check gender preferences to map to Melo speakers if available?
-                    # Currently Melo ZH usually has one speaker with id 0, or accents
-                    # Let's see if we can find gender specific? 
-                    # If not, just use default.
-                    
-                    spks = melo_model.hps.data.spk2id
-                    # E.g. {'ZH': 0}
-                    if 'ZH' in spks:
-                        melo_speaker_id = spks['ZH']
-                    elif spks:
-                        melo_speaker_id = list(spks.values())[0]
-                except:
-                    pass
+        except Exception as e:
 
-                STATE["playing"] = "melo_generating"
-                ui_safe(set_playing_status, f"✨ AI 合成中 (MeloTTS)...")
-                text_area_insert(f"🌬️ MeloTTS 生成中...", "TTS")
-                
-                # Speed Control
-                speed_factor = 1.0
-                try:
-                    val_str = active_rate.replace("%", "").strip()
-                    val = float(val_str)
-                    speed_factor = 1.0 + (val / 100.0)
-                    speed_factor = max(0.5, min(2.0, speed_factor))
-                except: pass
+            PIPER_STATS["failures"] += 1
 
-                # Save to wav
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as fp:
-                    wav_path = fp.name
-                
-                # Inference (MeloTTS)
-                # tts_to_file(text, speaker_id, output_path, speed=1.0)
-                melo_model.tts_to_file(text, melo_speaker_id, wav_path, speed=speed_factor)
-                
-                if os.path.exists(wav_path) and os.path.getsize(wav_path) > 0:
-                     ui_safe(set_playing_status, f"🔊 MeloTTS 播放中...")
-                     try:
-                        # Log chime status
-                        print(f"[DEBUG] MeloTTS Chime check: CHIME_ENABLED={CHIME_ENABLED}, should_chime={should_chime}, FILE={START_SOUND}")
-                        if should_chime and START_SOUND and os.path.isfile(START_SOUND):
-                            print(f"[Chime] Playing start (Melo): {START_SOUND}")
-                            # Use wait=False for better UX + short delay
-                            play_sound(START_SOUND, ignore_interrupt=True, wait=False)
-                            await asyncio.sleep(1.0) # Just wait a bit for the chime to "kick in"
-                        else:
-                            print(f"[Chime] Skipping start. should_chime={should_chime}, file_ex={os.path.isfile(START_SOUND) if START_SOUND else 'None'}")
-                     except Exception as ce:
-                        print(f"[Chime] Play error: {ce}")
-                     
-                     play_sound(wav_path)
-                     # [Safety] 延遲刪除
-                     def delayed_cleanup(p):
-                        try:
-                            time.sleep(10)
-                            if os.path.exists(p): os.remove(p)
-                        except: pass
-                     threading.Thread(target=delayed_cleanup, args=(wav_path,), daemon=True).start()
-                     
-                     if not (stop_playback_event.is_set() or voice_muted):
-                        ui_safe(set_playing_status, f"✅ 朗讀完成（MeloTTS）")
-                        try:
-                            if should_chime and os.path.exists(END_SOUND):
-                                play_sound(END_SOUND, ignore_interrupt=True)
-                        except: pass
-                     return
-                else:
-                     text_area_insert("⚠️ MeloTTS 產出空檔案", "TTS")
+            print(f"[Piper] warm process failed, falling back to one-shot: {e}")
 
-            except Exception as e:
-                 text_area_insert(f"❌ MeloTTS 失敗: {e}", "TTS")
-                 # Fallthrough to next engine
+            if proc: _piper_drop_warm(proc)
 
 
-        if PIPER_FORCE and _piper_available():
-            try:
-                ui_safe(set_playing_status, "🔊 朗讀中 (Piper Force)...")
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as fp:
-                    wav_path = fp.name
 
-                ok, log = _piper_run_to_wav(text, wav_path, lang_code=lang)
+    t0 = time.perf_counter()
 
-                if not ok:
-                    text_area_insert(f"❌ Piper 合成失敗（force）：{log}", "TTS")
-                else:
-                    # [Chime] Piper Force
-                    if should_chime and START_SOUND and os.path.isfile(START_SOUND):
-                         print(f"[Chime] Playing start (Piper): {START_SOUND}")
-                         play_sound(START_SOUND, ignore_interrupt=True, wait=False)
-                         await asyncio.sleep(1.0)
-                    play_sound(wav_path)
-                    # [Safety] 延遲刪除
-                    def delayed_cleanup(p):
-                        try:
-                            import time
-                            time.sleep(10)
-                            if os.path.exists(p): os.remove(p)
-                        except: pass
-                    threading.Thread(target=delayed_cleanup, args=(wav_path,), daemon=True).start()
+    cmd = [
 
-                    if not (stop_playback_event.is_set() or voice_muted):
-                        try:
-                            if should_chime and os.path.exists(END_SOUND):
-                                play_sound(END_SOUND, ignore_interrupt=True)
-                        except Exception:
-                            pass
-                        ui_safe(set_playing_status, "✅ 朗讀完成（Piper 離線｜force）")
-                    return
+        exe, "--model", use_model, "--output_file", out_wav,
 
-            except Exception as e:
-                text_area_insert(f"❌ Piper force 例外：{e}", "TTS")
+        "--length-scale", str(PIPER_CFG.get("length_scale", 1.0)),
 
+        "--noise-scale", str(PIPER_CFG.get("noise_scale", 0.667)),
 
-        # 1. Azure Speech SDK (Official) - Highest Priority if configured
-        azure_key = os.environ.get("AZURE_SPEECH_KEY") or STATE.get("azure_speech_key")
-        azure_region = os.environ.get("AZURE_SPEECH_REGION") or STATE.get("azure_speech_region")
-        
-        if TRIAL_EXPIRED:
-            text_area_insert("⚠️ 試用期已過，僅能使用 gTTS 備援", "TTS")
-        elif azure_key and azure_region:
-            ui_safe(set_playing_status, "🔊 朗讀中 (Azure TTS)...")
-            try:
-                import azure.cognitiveservices.speech as speechsdk
-                
-                # Setup Config
-                speech_config = speechsdk.SpeechConfig(subscription=azure_key, region=azure_region)
-                v_azure = get_voice_id_auto(text, lang_code=local_lang, gender_code=local_gender) or "zh-TW-HsiaoChenNeural"
-                speech_config.speech_synthesis_voice_name = v_azure
-                
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as fp:
-                    wav_path = fp.name
-                
-                audio_config = speechsdk.audio.AudioOutputConfig(filename=wav_path)
-                synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-                
-                # [Fix] Ensure rate has sign (+/-) for Azure/EdgeTTS
-                rate_str = active_rate 
-                ssml_text = f"<speak version='1.0' xml:lang='{lang}' xmlns='http://www.w3.org/2001/10/synthesis' xmlns:mstts='http://www.w3.org/2001/mstts'><voice name='{v_azure}'><mstts:express-as style='general'><prosody rate='{rate_str}'>{text}</prosody></mstts:express-as></voice></speak>"
-
-                result = synthesizer.speak_ssml_async(ssml_text).get()
-
-                if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-                    # [Chime] Azure
-                    if should_chime and START_SOUND and os.path.isfile(START_SOUND):
-                         print(f"[Chime] Playing start (Azure): {START_SOUND}")
-                         play_sound(START_SOUND, ignore_interrupt=True, wait=False)
-                         await asyncio.sleep(1.0)
-                         
-                    play_sound(wav_path)
-                    # [Safety] 延遲刪除
-                    def delayed_cleanup(p):
-                        try:
-                            import time
-                            time.sleep(10)
-                            if os.path.exists(p): os.remove(p)
-                        except: pass
-                    threading.Thread(target=delayed_cleanup, args=(wav_path,), daemon=True).start()
-                    if not (stop_playback_event.is_set() or voice_muted):
-                        try:
-                            if should_chime and os.path.exists(END_SOUND):
-                                play_sound(END_SOUND, ignore_interrupt=True)
-                        except: pass
-                        ui_safe(set_playing_status, f"✅ 朗讀完成（Azure Official: {v_azure}）")
-                    return
-                else:
-                    cancellation_details = result.cancellation_details
-                    text_area_insert(f"⚠️ Azure Speech 失敗：{cancellation_details.reason} - {cancellation_details.error_details}", "TTS")
+        "--noise-w", str(PIPER_CFG.get("noise_w", 0.8)),
 
-            except ImportError:
-                 text_area_insert("⚠️ 未安裝 azure-cognitiveservices-speech，跳過 Azure 官方路徑", "TTS")
-            except Exception as e:
-                 text_area_insert(f"⚠️ Azure Speech 例外：{e}", "TTS")
-
-
-        # Edge TTS Logic
-        primary_voice = get_voice_id_auto(text, lang_code=local_lang, gender_code=local_gender) or "zh-TW-HsiaoChenNeural"
-        safe_tw = "zh-TW-HsiaoChenNeural"
-        safe_en = "en-US-JennyNeural"
-        # [Fix] Ensure rate is sanitized for Edge TTS too
-        sanitized_rate_edge = "+0%"
-        if voice_rate:
-             vr = str(voice_rate).strip()
-             if vr.endswith("%"):
-                 if not vr.startswith("+") and not vr.startswith("-"):
-                     sanitized_rate_edge = "+" + vr
-                 else:
-                     sanitized_rate_edge = vr
-             else:
-                 try: sanitized_rate_edge = f"{int(float(vr)):+d}%"
-                 except: pass
-
-        trials = [
-            (primary_voice, active_rate),
-            (primary_voice, None),
-            (safe_tw, None),
-            (safe_en, None),
-        ]
-
-        # [Circuit Breaker] check
-        should_use_edge = (USE_EDGE_TTS and STATE.get("edge_tts_fails", 0) < 3)
-         
-        if not TRIAL_EXPIRED and should_use_edge:
-             for v, r in trials:
-                try:
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
-                        mp3_path = fp.name
-                    
-                    ui_safe(set_playing_status, f"🔊 朗讀中 (EdgeTTS: {v})...")
-                    
-                    if r is not None:
-                        tts = edge_tts.Communicate(text=text, voice=v, rate=r, volume='+50%')
-                    else:
-                        tts = edge_tts.Communicate(text=text, voice=v, volume='+50%')
-                    
-                    await tts.save(mp3_path)
+    ]
 
-                    if not os.path.exists(mp3_path) or os.path.getsize(mp3_path) == 0:
-                        raise RuntimeError("edge-tts returned empty file")
+    spk = (PIPER_CFG.get("speaker") or "").strip()
 
-                    if stop_playback_event.is_set() or voice_muted:
-                        try: os.remove(mp3_path)
-                        except Exception: pass
-                        return
-
-                    # [Chime] EdgeTTS
-                    if should_chime and START_SOUND and os.path.isfile(START_SOUND):
-                         print(f"[Chime] Playing start (Edge): {START_SOUND}")
-                         play_fx(START_SOUND, ignore_interrupt=True)
-                         await asyncio.sleep(0.6)
-                    play_sound(mp3_path)
-                    # [Safety] 延遲刪除，讓 Web client 有時間下載
-                    def delayed_cleanup(p):
-                        try:
-                            time.sleep(10)
-                            if os.path.exists(p): os.remove(p)
-                        except: pass
-                    threading.Thread(target=delayed_cleanup, args=(mp3_path,), daemon=True).start()
+    if spk:
 
-                    if not (stop_playback_event.is_set() or voice_muted):
-                        try:
-                            if should_chime and os.path.exists(END_SOUND):
-                                play_sound(END_SOUND, ignore_interrupt=True)
-                        except Exception:
-                            pass
-                        ui_safe(set_playing_status, f"✅ 朗讀完成（{v}{'' if r is None else f', {r}'}）")
-                        STATE["edge_tts_fails"] = 0
-                    return
+        # 注意：若切換模型，原 speaker ID 可能不適用，這裡暫時保留
 
-                except Exception as e:
-                    # [Fallback] If SSL/Connect error
-                    err_str = str(e)
-                    if "SSL" in err_str or "CERTIFICATE" in err_str or "ClientConnectorError" in err_str:
-                         print(f"[EdgeTTS] SSL/Network error: {e}. Retrying with unverified context...")
-                         try:
-                             import ssl
-                             _orig = ssl.create_default_context
-                             ssl.create_default_context = ssl._create_unverified_context
-                             try:
-                                 with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
-                                    mp3_path = fp.name
-                                 
-                                 ui_safe(set_playing_status, f"🔊 朗讀中 (EdgeTTS Unverified: {v})...")
-                                 if r is not None:
-                                     tts = edge_tts.Communicate(text=text, voice=v, rate=r, volume='+50%')
-                                 else:
-                                     tts = edge_tts.Communicate(text=text, voice=v, volume='+50%')
-                                 
-                                 await tts.save(mp3_path)
-
-                                 # [Chime] EdgeTTS (Unverified)
-                                 if should_chime and os.path.exists(START_SOUND):
-                                     play_fx(START_SOUND, ignore_interrupt=True)
-                                 play_sound(mp3_path)
-                                 try: os.remove(mp3_path)
-                                 except: pass
-
-                                 if not (stop_playback_event.is_set() or voice_muted):
-                                     ui_safe(set_playing_status, f"✅ 朗讀完成（Unverified SSL: {v}）")
-                                     STATE["edge_tts_fails"] = 0
-                                 return # Success
-                             finally:
-                                 ssl.create_default_context = _orig
-                         except Exception as e2:
-                             print(f"[EdgeTTS] Retry failed: {e2}")
-
-                    reason = str(e)
-                    text_area_insert(f"⚠️ Edge TTS 失敗（voice={v}, rate={r}）：{reason}", "TTS")
-                    continue
+        cmd += ["--speaker", spk]
 
+    try:
 
+        # Match standalone script: Popen with text=True, encoding='utf-8'
 
+        process = subprocess.Popen(
 
+            cmd,
 
-        # 2nd Priority: gTTS
+            stdin=subprocess.PIPE,
 
-        text_area_insert("ℹ️ Edge TTS 不可用，轉用 gTTS 備援…", "TTS")
+            stdout=subprocess.PIPE,
 
-        try:
+            stderr=subprocess.PIPE,
 
-            # Map simplified lang codes for gTTS
+            text=True,
 
-            # lang (e.g. "zh-TW", "en-US") comes from detect_language() earlier in function
+            encoding='utf-8'
 
-            gtts_map = {
+        )
 
-                "zh-TW": "zh-tw", "zh-CN": "zh-cn",
+        stdout, stderr = process.communicate(input=text)
 
-                "en-US": "en", "en-GB": "en",
+        
 
-                "ja-JP": "ja",
+        ok = (process.returncode == 0 and os.path.isfile(out_wav) and os.path.getsize(out_wav) > 0)
 
-                "ko-KR": "ko",
+        if ok: PIPER_STATS["cold"] += 1; PIPER_STATS["cold_ms_sum"] += (time.perf_counter() - t0) * 1000.0
 
-                "vi-VN": "vi",
+        log = stderr if stderr else (stdout if stdout else "")
 
-                "id-ID": "id",
+        if not ok and not log:
 
-                # gTTS often fails on unknown codes, default to zh-tw or en?
+            log = f"No output. ExitCode={process.returncode}, WavExists={os.path.isfile(out_wav)}"
 
-            }
 
-            t_lang = gtts_map.get(lang, "zh-tw")
 
-            
+        return (ok, log if log else ("OK" if ok else "no output"))
 
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
+    except Exception as e:
 
-                tmp = fp.name
+        return (False, str(e))
 
-            gTTS(text, lang=t_lang).save(tmp)
 
-            if not (stop_playback_event.is_set() or voice_muted):
 
-                # [Chime] gTTS
-                if should_chime and START_SOUND and os.path.isfile(START_SOUND):
-                     print(f"[Chime] Playing start (gTTS): {START_SOUND}")
-                     play_fx(START_SOUND, ignore_interrupt=True)
-                     time.sleep(0.5)
-                play_sound(tmp)
+# ===============================
+# == [ANCHOR] TTS 內容定址快取 ==
+# ===============================
+# [NEW] 同一段文字 + 同引擎/聲音/語速/語系 只合成一次（課表固定廣播、重複公告每天都一樣）
+TTS_CACHE_DIR = os.path.join(DATA_DIR, "tts_cache")
+TTS_CACHE_MAX_BYTES = 512 * 1024 * 1024
+TTS_CACHE_MAX_FILES = 4000
+
+class TTSCache:
+    """磁碟 TTS 快取：key = sha1(engine|voice|rate|lang|正規化文字)，超過上限依 LRU 淘汰（pin 住的不淘汰）。"""
+    def __init__(self, root, max_bytes=TTS_CACHE_MAX_BYTES, max_files=TTS_CACHE_MAX_FILES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._index = collections.OrderedDict()   # key -> (path, size)，越後面越新
+        self._bytes = 0
+        self._pinned = {}                         # key -> 到期 ts
+        self.hits = self.misses = self.stores = self.evictions = 0
+        self.bytes_saved = 0
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for name in os.listdir(self.root):
+            p = os.path.join(self.root, name)
+            k, ext = os.path.splitext(name)
+            if name.startswith(".tmp-"):
+                try: os.remove(p)
+                except OSError: pass
+                continue
+            if len(k) != 40 or ext not in (".mp3", ".wav"): continue
+            try: st = os.stat(p)
+            except OSError: continue
+            found.append((st.st_mtime, k, p, st.st_size))
+        for _, k, p, size in sorted(found):
+            self._index[k] = (p, size); self._bytes += size
+
+    @staticmethod
+    def normalize(text):
+        import unicodedata
+        return " ".join(unicodedata.normalize("NFKC", text or "").split())
+
+    def key(self, engine, voice, rate, lang, text):
+        raw = "\x1f".join([str(engine or ""), str(voice or ""), str(rate or ""), str(lang or ""), self.normalize(text)])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            ent = self._index.get(key)
+            if ent and not os.path.isfile(ent[0]):
+                self._index.pop(key); self._bytes -= ent[1]; ent = None
+            if not ent:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1; self.bytes_saved += ent[1]
+        try: os.utime(ent[0])      # 重啟後仍保留 LRU 順序
+        except OSError: pass
+        return ent[0]
+
+    def tmp_path(self, ext):
+        fd, p = tempfile.mkstemp(prefix=".tmp-", suffix=ext, dir=self.root)
+        os.close(fd)
+        return p
+
+    def put(self, key, src, ext):
+        """把合成好的暫存檔搬進快取，回傳最終路徑；空檔視為失敗。"""
+        size = os.path.getsize(src) if os.path.isfile(src) else 0
+        if size <= 0:
+            try: os.remove(src)
+            except OSError: pass
+            return None
+        dst = os.path.join(self.root, key + ext)
+        os.replace(src, dst)
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old: self._bytes -= old[1]
+            self._index[key] = (dst, size); self._bytes += size
+            self.stores += 1
+            self._evict()
+        AUDIO_INDEX.add(dst)
+        return dst
+
+    def _evict(self):
+        now = time.time()
+        for k in list(self._index.keys()):
+            if self._bytes <= self.max_bytes and len(self._index) <= self.max_files: break
+            if self._pinned.get(k, 0) > now: continue
+            p, size = self._index.pop(k)
+            self._bytes -= size; self.evictions += 1
+            try: os.remove(p)
+            except OSError: pass
+            AUDIO_INDEX.discard(p)
+
+    def pin(self, key, until_ts):
+        now = time.time()
+        with self._lock:
+            for k in [k for k, t in self._pinned.items() if t <= now]: del self._pinned[k]
+            self._pinned[key] = max(self._pinned.get(key, 0), until_ts)
+
+    def contains(self, key):
+        with self._lock: return key in self._index
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            now = time.time()
+            return {"entries": len(self._index), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "stores": self.stores, "evictions": self.evictions,
+                    "hit_rate": round(self.hits / total, 4) if total else 0.0, "bytes_saved": self.bytes_saved,
+                    "pinned": sum(1 for t in self._pinned.values() if t > now)}
 
-            # [Safety] 延遲刪除
-            def delayed_cleanup(p):
-                try:
-                    time.sleep(10)
-                    if os.path.exists(p): os.remove(p)
-                except: pass
-            threading.Thread(target=delayed_cleanup, args=(tmp,), daemon=True).start()
+try:
+    TTS_CACHE = TTSCache(TTS_CACHE_DIR)
+except Exception as e:
+    print(f"[TTSCache] disabled: {e}")
+    TTS_CACHE = None
+
+# [NEW] 各引擎合成延遲直方圖（毫秒桶，最後一桶為 +inf）
+TTS_LAT_BUCKETS_MS = (250, 500, 1000, 2000, 4000, 8000, 16000)
+TTS_ENGINE_STATS = {}
+_tts_stats_lock = threading.Lock()
+
+def _tts_record(engine, outcome, ms=None):
+    """outcome: ok / fail / cancel；只有實際合成（快取未命中）才記錄"""
+    with _tts_stats_lock:
+        st = TTS_ENGINE_STATS.setdefault(engine, {"ok": 0, "fail": 0, "cancel": 0, "wins": 0, "sum_ms": 0.0,
+                                                  "max_ms": 0.0, "hist": [0] * (len(TTS_LAT_BUCKETS_MS) + 1)})
+        st[outcome] += 1
+        if outcome == "ok" and ms is not None:
+            st["sum_ms"] += ms; st["max_ms"] = max(st["max_ms"], ms)
+            i = 0
+            while i < len(TTS_LAT_BUCKETS_MS) and ms > TTS_LAT_BUCKETS_MS[i]: i += 1
+            st["hist"][i] += 1
+
+def _tts_engine_snapshot():
+    with _tts_stats_lock:
+        out = {}
+        for k, st in TTS_ENGINE_STATS.items():
+            d = dict(st, hist=list(st["hist"]), sum_ms=round(st["sum_ms"], 1), max_ms=round(st["max_ms"], 1))
+            d["avg_ms"] = round(st["sum_ms"] / st["ok"], 1) if st["ok"] else 0.0
+            out[k] = d
+        return {"buckets_ms": list(TTS_LAT_BUCKETS_MS), "hedge_delay_s": TTS_HEDGE_DELAY_SEC,
+                "deadline_s": TTS_DEADLINE_SEC, "engines": out}
+
+import contextvars
+_TTS_PIN_UNTIL = contextvars.ContextVar("tts_pin_until", default=None)   # 預先合成時設定：結果 pin 到此時間
+
+async def _tts_cached(engine, voice, rate, lang, text, ext, synth):
+    """
+    先查快取；未命中才呼叫 synth(out_path)（可為 coroutine function 或一般函式，一般函式丟 executor）。
+    回傳可播放的檔案路徑，合成失敗時拋出例外。
+    被取消（對沖輸家）時：coroutine 直接中止；executor 執行緒無法中斷，讓它跑完後照樣存進快取。
+    """
+    if TTS_CACHE is None:
+        key = None
+        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as fp: out = fp.name
+    else:
+        key = TTS_CACHE.key(engine, voice, rate, lang, text)
+        pin_until = _TTS_PIN_UNTIL.get()
+        if pin_until: TTS_CACHE.pin(key, pin_until)
+        hit = TTS_CACHE.get(key)
+        if hit:
+            print(f"[TTSCache] hit {engine}/{voice} {os.path.basename(hit)}")
+            return hit
+        out = TTS_CACHE.tmp_path(ext)
+
+    def _finish():
+        if key is None:
+            if not (os.path.isfile(out) and os.path.getsize(out) > 0):
+                raise RuntimeError(f"{engine} returned empty file")
+            return out
+        path = TTS_CACHE.put(key, out, ext)
+        if not path:
+            raise RuntimeError(f"{engine} returned empty file")
+        return path
 
-            if not (stop_playback_event.is_set() or voice_muted):
+    def _discard():
+        try: os.remove(out)
+        except OSError: pass
 
+    t0 = time.perf_counter()
+    if asyncio.iscoroutinefunction(synth):
+        try:
+            await synth(out)
+        except asyncio.CancelledError:
+            _tts_record(engine, "cancel"); _discard(); raise
+        except BaseException:
+            _tts_record(engine, "fail"); _discard(); raise
+    else:
+        fut = asyncio.get_running_loop().run_in_executor(None, synth, out)
+        try:
+            await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            _tts_record(engine, "cancel")
+            def _late(f):
                 try:
+                    if f.exception() is None and key is not None: _finish(); return
+                except Exception: pass
+                _discard()
+            fut.add_done_callback(_late)
+            raise
+        except BaseException:
+            _tts_record(engine, "fail"); _discard(); raise
+    try:
+        path = _finish()
+    except Exception:
+        _tts_record(engine, "fail"); raise
+    _tts_record(engine, "ok", (time.perf_counter() - t0) * 1000.0)
+    return path
+
+def _tts_is_cache_file(path):
+    return bool(TTS_CACHE) and os.path.dirname(os.path.abspath(path)) == os.path.abspath(TTS_CACHE.root)
+
+async def _tts_play_rendered(path, should_chime, done_label):
+    """前導音 → 內容 → 結束音；快取檔不刪，非快取暫存檔延遲刪除（讓 Web client 有時間下載）。"""
+    if should_chime and START_SOUND and os.path.isfile(START_SOUND):
+        print(f"[Chime] Playing start: {START_SOUND}")
+        await _in_executor(play_fx, START_SOUND, ignore_interrupt=True)
+        await asyncio.sleep(0.6)
+    await _in_executor(play_sound, path)
+    if not _tts_is_cache_file(path):
+        def delayed_cleanup(p):
+            try:
+                time.sleep(10)
+                if os.path.exists(p): os.remove(p)
+            except: pass
+        threading.Thread(target=delayed_cleanup, args=(path,), daemon=True).start()
+    if not (stop_playback_event.is_set() or voice_muted):
+        try:
+            if should_chime and END_SOUND and os.path.exists(END_SOUND):
+                await _in_executor(play_sound, END_SOUND, ignore_interrupt=True)
+        except Exception:
+            pass
+        ui_safe(set_playing_status, f"✅ 朗讀完成（{done_label}）")
+
+def _tts_melo_speaker():
+    try:
+        spks = _melo_speakers()   # E.g. {'ZH': 0}
+        if 'ZH' in spks: return spks['ZH']
+        if spks: return list(spks.values())[0]
+    except Exception:
+        pass
+    return 0
 
-                    if os.path.exists(END_SOUND):
+def _tts_melo_speed(active_rate):
+    try:
+        return max(0.5, min(2.0, 1.0 + float(active_rate.replace("%", "").strip()) / 100.0))
+    except Exception:
+        return 1.0
+
+def _tts_synth_azure(text, lang, voice, rate, out_path):
+    import azure.cognitiveservices.speech as speechsdk
+    azure_key = os.environ.get("AZURE_SPEECH_KEY") or STATE.get("azure_speech_key")
+    azure_region = os.environ.get("AZURE_SPEECH_REGION") or STATE.get("azure_speech_region")
+    speech_config = speechsdk.SpeechConfig(subscription=azure_key, region=azure_region)
+    speech_config.speech_synthesis_voice_name = voice
+    audio_config = speechsdk.audio.AudioOutputConfig(filename=out_path)
+    synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
+    ssml_text = f"<speak version='1.0' xml:lang='{lang}' xmlns='http://www.w3.org/2001/10/synthesis' xmlns:mstts='http://www.w3.org/2001/mstts'><voice name='{voice}'><mstts:express-as style='general'><prosody rate='{rate}'>{text}</prosody></mstts:express-as></voice></speak>"
+    result = synthesizer.speak_ssml_async(ssml_text).get()
+    del synthesizer   # 釋放檔案 handle，之後才能搬進快取
+    if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
+        d = result.cancellation_details
+        raise RuntimeError(f"{d.reason} - {d.error_details}")
+
+# [MOD] 不驗證憑證的重試可能同時有好幾個（對沖/分段朗讀）：全域替換 ssl.create_default_context 以引用計數管理，
+#       最後一個結束才還原（原本各自保存/還原，交錯時會把替換後的版本當成原版留下）
+_SSL_UNVERIFIED = {"depth": 0, "orig": None}
+_SSL_UNVERIFIED_LOCK = threading.Lock()
+
+def _ssl_unverified_enter():
+    import ssl
+    with _SSL_UNVERIFIED_LOCK:
+        if _SSL_UNVERIFIED["depth"] == 0:
+            _SSL_UNVERIFIED["orig"] = ssl.create_default_context
+            ssl.create_default_context = ssl._create_unverified_context
+        _SSL_UNVERIFIED["depth"] += 1
+
+def _ssl_unverified_exit():
+    import ssl
+    with _SSL_UNVERIFIED_LOCK:
+        _SSL_UNVERIFIED["depth"] -= 1
+        if _SSL_UNVERIFIED["depth"] == 0:
+            ssl.create_default_context = _SSL_UNVERIFIED["orig"]; _SSL_UNVERIFIED["orig"] = None
+
+def _edge_accepts_connector():
+    try:
+        import inspect
+        return "connector" in inspect.signature(edge_tts.Communicate.__init__).parameters
+    except (TypeError, ValueError):
+        return False
 
-                        play_sound(END_SOUND, ignore_interrupt=True)
+async def _tts_synth_edge(text, voice, rate, out_path):
+    """edge-tts 存檔；SSL/連線錯誤時以不驗證憑證的連線重試一次"""
+    def _comm(**kw):
+        if rate is not None:
+            return edge_tts.Communicate(text=text, voice=voice, rate=rate, volume='+50%', **kw)
+        return edge_tts.Communicate(text=text, voice=voice, volume='+50%', **kw)
+    try:
+        await _comm().save(out_path)
+    except Exception as e:
+        err_str = str(e)
+        if not ("SSL" in err_str or "CERTIFICATE" in err_str or "ClientConnectorError" in err_str):
+            raise
+        print(f"[EdgeTTS] SSL/Network error: {e}. Retrying with unverified context...")
+        if _edge_accepts_connector():
+            # 新版 edge-tts：只對這一個連線關閉驗證，不動全域 ssl
+            import aiohttp
+            await _comm(connector=aiohttp.TCPConnector(ssl=False)).save(out_path)
+            return
+        _ssl_unverified_enter()
+        try:
+            await _comm().save(out_path)
+        finally:
+            _ssl_unverified_exit()
+
+def _piper_cache_voice(lang_code):
+    """Piper 的快取 voice 欄位：實際使用的模型 + 合成參數"""
+    mdl = (_piper_match_model(lang_code) if lang_code else "") or PIPER_CFG.get("model") or ""
+    return "|".join([os.path.basename(mdl), str(PIPER_CFG.get("speaker") or ""), str(PIPER_CFG.get("length_scale", 1.0)),
+                     str(PIPER_CFG.get("noise_scale", 0.667)), str(PIPER_CFG.get("noise_w", 0.8))])
+
+def _piper_synth(text, lang_code):
+    def _run(out_path):
+        ok, log = _piper_run_to_wav(text, out_path, lang_code=lang_code)
+        if not ok: raise RuntimeError(log)
+    return _run
+
+GTTS_LANG_MAP = {
+    "zh-TW": "zh-tw", "zh-CN": "zh-cn",
+    "en-US": "en", "en-GB": "en",
+    "ja-JP": "ja",
+    "ko-KR": "ko",
+    "vi-VN": "vi",
+    "id-ID": "id",
+}
 
-                except Exception:
 
-                    pass
 
-                ui_safe(set_playing_status, "✅ 朗讀完成（gTTS 備援）")
+class _TTSCandidate:
+    """一個備援引擎：render() → (檔案路徑, 完成標籤)；keys：render 會查的快取 key（用來跳過競速）"""
+    __slots__ = ("engine", "name", "render", "keys")
+    def __init__(self, engine, name, render, keys=()):
+        self.engine, self.name, self.render = engine, name, render
+        self.keys = [k for k in keys if k]
+
+def _tts_ckey(engine, voice, rate, lang, text):
+    return TTS_CACHE.key(engine, voice, rate, lang, text) if TTS_CACHE is not None else None
+
+def _tts_cached_first(cands):
+    """快取已有結果（例如預先合成、被 pin 住的檔案）的候選移到最前面；它直接讀快取，不必等網路引擎或對沖延遲"""
+    if TTS_CACHE is None: return cands
+    for c in cands:
+        if any(TTS_CACHE.contains(k) for k in c.keys):
+            if c is not cands[0]: print(f"[TTS] cache hit on {c.name}, skipping race")
+            return [c] + [x for x in cands if x is not c]
+    return cands
+
+async def _tts_race(cands, hedge_delay=None, deadline=None, status=True):
+    """
+    依序啟動候選引擎：前一個失敗立即換下一個；hedge_delay 秒內沒結果就「平行」啟動下一個。
+    取第一個成功者，其餘取消。hedge_delay=None 等同舊的逐一備援；deadline 為總時限（秒）。
+    回傳 (candidate, path, label)，全部失敗/逾時/被停止時回傳 (None, None, None)。
+    """
+    loop = asyncio.get_running_loop()
+    t_end = loop.time() + deadline if deadline else None
+    pending, idx = {}, 0
+    cands = _tts_cached_first(cands)   # [MOD] 預先合成的結果不管是哪個引擎贏的都直接用
+
+    def _launch():
+        nonlocal idx, next_hedge
+        c = cands[idx]; idx += 1
+        if status: ui_safe(set_playing_status, f"🔊 朗讀中 ({c.name})...")
+        if pending: print(f"[TTS] hedge → {c.name}")
+        pending[asyncio.ensure_future(c.render())] = c
+        next_hedge = loop.time() + hedge_delay if hedge_delay else None
+
+    next_hedge = None
+    try:
+        while True:
+            if not pending:
+                if idx >= len(cands): return None, None, None
+                _launch()
+            now = loop.time()
+            if t_end is not None and now >= t_end:
+                text_area_insert(f"⚠️ TTS 超過總時限 {deadline:.0f}s，放棄：{', '.join(c.name for c in pending.values())}", "TTS")
+                return None, None, None
+            if next_hedge is not None and idx < len(cands) and now >= next_hedge:
+                _launch(); continue
+            waits = [0.5]   # 定期醒來檢查 stop_playback_event
+            if t_end is not None: waits.append(t_end - now)
+            if next_hedge is not None and idx < len(cands): waits.append(next_hedge - now)
+            done, _ = await asyncio.wait(list(pending), timeout=max(0.0, min(waits)), return_when=asyncio.FIRST_COMPLETED)
+            if stop_playback_event.is_set() or voice_muted:
+                return None, None, None
+            for t in done:
+                c = pending.pop(t)
+                if t.exception() is None:
+                    path, label = t.result()
+                    with _tts_stats_lock:
+                        if c.engine in TTS_ENGINE_STATS: TTS_ENGINE_STATS[c.engine]["wins"] += 1
+                    return c, path, label
+                text_area_insert(f"⚠️ {c.name} 失敗：{t.exception()}", "TTS")
+                next_hedge = None     # 失敗 → 下一輪立即啟動下一個（若沒有其他在跑）
+                if pending and idx < len(cands): _launch()
+    finally:
+        for t in pending:
+            t.cancel()
+
+def _tts_build_candidates(text, lang, local_lang, local_gender, active_rate, will_use_melo, notes=True):
+    """
+    [MOD] 各引擎只負責「合成到檔案」，經 _tts_cached 查快取；播放與前導/結束音統一由 _tts_play_rendered 處理。
+    回傳依偏好排序的 _TTSCandidate 清單，交給 _tts_race（慢的引擎不再拖住整條備援鏈）。
+    notes=False 時不重複輸出「未就緒」提示（分段朗讀時每段都會呼叫）。
+    """
+    global PIPER_CFG
+    cands = []
+    if will_use_melo:
+        spk, speed = _tts_melo_speaker(), _tts_melo_speed(active_rate)
+        async def _melo():
+            STATE["playing"] = "melo_generating"
+            text_area_insert(f"🌬️ MeloTTS 生成中...", "TTS")
+            return await _tts_cached("melo", spk, speed, lang, text, ".wav",
+                                     lambda out: _melo_tts_to_file(text, spk, out, speed=speed)), "MeloTTS"
+        cands.append(_TTSCandidate("melo", "MeloTTS", _melo, [_tts_ckey("melo", spk, speed, lang, text)]))
+
+    async def _piper(tag):
+        return await _tts_cached("piper", _piper_cache_voice(lang), "", lang, text, ".wav", _piper_synth(text, lang)), tag
+    if PIPER_FORCE and _piper_available():
+        cands.append(_TTSCandidate("piper", "Piper Force", lambda: _piper("Piper 離線｜force"),
+                                   [_tts_ckey("piper", _piper_cache_voice(lang), "", lang, text)]))
+
+    # 1. Azure Speech SDK (Official) - Highest Priority if configured
+    azure_key = os.environ.get("AZURE_SPEECH_KEY") or STATE.get("azure_speech_key")
+    azure_region = os.environ.get("AZURE_SPEECH_REGION") or STATE.get("azure_speech_region")
+    
+    if TRIAL_EXPIRED:
+        if notes: text_area_insert("⚠️ 試用期已過，僅能使用 gTTS 備援", "TTS")
+    elif azure_key and azure_region:
+        v_azure = get_voice_id_auto(text, lang_code=local_lang, gender_code=local_gender) or "zh-TW-HsiaoChenNeural"
+        async def _azure():
+            try:
+                import azure.cognitiveservices.speech  # noqa: F401
+            except ImportError:
+                raise RuntimeError("未安裝 azure-cognitiveservices-speech，跳過 Azure 官方路徑")
+            return await _tts_cached("azure", v_azure, active_rate, lang, text, ".wav",
+                                     lambda out: _tts_synth_azure(text, lang, v_azure, active_rate, out)), f"Azure Official: {v_azure}"
+        cands.append(_TTSCandidate("azure", "Azure TTS", _azure, [_tts_ckey("azure", v_azure, active_rate, lang, text)]))
+
+    # Edge TTS Logic：聲音/語速的降級在同一個候選內逐一嘗試（同一台伺服器，彼此對沖沒有意義）
+    primary_voice = get_voice_id_auto(text, lang_code=local_lang, gender_code=local_gender) or "zh-TW-HsiaoChenNeural"
+    safe_tw = "zh-TW-HsiaoChenNeural"
+    safe_en = "en-US-JennyNeural"
+
+    trials = [
+        (primary_voice, active_rate),
+        (primary_voice, None),
+        (safe_tw, None),
+        (safe_en, None),
+    ]
+
+    # [Circuit Breaker] check
+    should_use_edge = (USE_EDGE_TTS and STATE.get("edge_tts_fails", 0) < 3)
+
+    if not TRIAL_EXPIRED and should_use_edge:
+        edge_keys = [_tts_ckey("edge", v, r, lang, text) for v, r in trials]
+        async def _edge():
+            last = None
+            # 已快取的聲音/語速先試（預先合成時可能是降級後的組合贏）
+            hit = [TTS_CACHE is not None and bool(k) and TTS_CACHE.contains(k) for k in edge_keys]
+            for v, r in [t for t, h in zip(trials, hit) if h] + [t for t, h in zip(trials, hit) if not h]:
+                try:
+                    path = await _tts_cached("edge", v, r, lang, text, ".mp3",
+                                             lambda out, v=v, r=r: _tts_synth_edge(text, v, r, out))
+                    STATE["edge_tts_fails"] = 0
+                    return path, f"{v}{'' if r is None else f', {r}'}"
+                except Exception as e:
+                    text_area_insert(f"⚠️ Edge TTS 失敗（voice={v}, rate={r}）：{e}", "TTS")
+                    last = e
+            raise RuntimeError(f"all voices failed ({last})")
+        cands.append(_TTSCandidate("edge", f"EdgeTTS: {primary_voice}", _edge, edge_keys))
+
+    # 2nd Priority: gTTS
+    # lang (e.g. "zh-TW", "en-US") comes from detect_language() earlier in function
+    t_lang = GTTS_LANG_MAP.get(lang, "zh-tw")
+    async def _gtts():
+        return await _tts_cached("gtts", t_lang, "", t_lang, text, ".mp3", lambda out: gTTS(text, lang=t_lang).save(out)), "gTTS 備援"
+    cands.append(_TTSCandidate("gtts", "gTTS", _gtts, [_tts_ckey("gtts", t_lang, "", t_lang, text)]))
+
+    # 3rd Priority: Piper
+    # Reload CFG just in case user added it recently
+    if not _piper_available():
+        PIPER_CFG = _piper_load_cfg()
+
+    if not TRIAL_EXPIRED and _piper_available():
+        if not PIPER_FORCE:
+            cands.append(_TTSCandidate("piper", "Piper", lambda: _piper("Piper 離線"),
+                                       [_tts_ckey("piper", _piper_cache_voice(lang), "", lang, text)]))
+    elif notes:
+         # Debug info for user
+         pe = PIPER_CFG.get("piper_exe") or "未設定"
+         pm = PIPER_CFG.get("model") or "未設定"
+         text_area_insert(f"⚠️ Piper 尚未就緒（Exe: {pe}, Model: {pm}）", "TTS")
+    return cands
+
+# [NEW] 分段朗讀：句 → 子句 → 硬切；第一段刻意短一點，讓第一聲更早出來
+TTS_SEG_MAX_CHARS = 80
+TTS_SEG_FIRST_MAX_CHARS = 30
+_TTS_SENT_RE = re.compile(r".+?(?:[。！？!?；;\n]+|[.](?=\s)|$)", re.S)
+_TTS_CLAUSE_RE = re.compile(r".+?(?:[，、：]+|[,:](?=\s)|$)", re.S)
+
+def _tts_split_segments(text):
+    out = []
+    def _push(piece):
+        limit = TTS_SEG_FIRST_MAX_CHARS if not out else TTS_SEG_MAX_CHARS
+        while len(piece) > limit:       # 沒有標點的長句：硬切
+            out.append(piece[:limit]); piece = piece[limit:]
+            limit = TTS_SEG_MAX_CHARS
+        if piece.strip(): out.append(piece)
+    for sent in _TTS_SENT_RE.findall(text):
+        sent = sent.strip()
+        if not sent: continue
+        if len(sent) <= (TTS_SEG_FIRST_MAX_CHARS if not out else TTS_SEG_MAX_CHARS):
+            out.append(sent); continue
+        buf = ""
+        for cl in _TTS_CLAUSE_RE.findall(sent):
+            if buf and len(buf) + len(cl) > (TTS_SEG_FIRST_MAX_CHARS if not out else TTS_SEG_MAX_CHARS):
+                _push(buf.strip()); buf = ""
+            buf += cl
+        if buf.strip(): _push(buf.strip())
+    merged = []
+    for seg in out:                       # 太短的尾巴併回前一段，避免一段只念兩個字
+        if merged and len(seg) < 6 and len(merged[-1]) + len(seg) <= TTS_SEG_MAX_CHARS:
+            merged[-1] += seg
+        else:
+            merged.append(seg)
+    return merged
+
+async def _tts_stream(segs, make_cands, should_chime, hedge):
+    """
+    分段合成（最多 TTS_STREAM_CONCURRENCY 段同時進行）並依序送出。
+    前端 /ws/web 會把 play_audio 排進佇列依序播放，所以某段一合成好就送出，
+    伺服器只用 play_until 追蹤「前端佇列預計播完的時間」來推進度與接結束音。
+    回傳 True 表示已處理（含被停止）；第一段就合成失敗時回傳 False（交給最後的 SAPI5 離線備援）。
+    """
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(TTS_STREAM_CONCURRENCY)
+
+    async def _render(seg):
+        async with sem:
+            if stop_playback_event.is_set() or voice_muted: return None
+            w, p, lbl = await _tts_race(make_cands(seg), hedge_delay=hedge, deadline=TTS_DEADLINE_SEC)
+            return (p, lbl) if w else None
+
+    def _stopped():
+        return stop_playback_event.is_set() or voice_muted
+
+    tasks = [asyncio.ensure_future(_render(seg)) for seg in segs]
+    sid = uuid.uuid4().hex[:8]   # 前導音與各段同屬一個 stream，前端依 seq 排序（不做隨機錯開）
+    t0 = loop.time()
+    play_until, played, label = 0.0, 0, None
+    print(f"[TTS] stream: {len(segs)} segments")
+    try:
+        for i, t in enumerate(tasks):
+            while not t.done():
+                await asyncio.wait({t}, timeout=0.2)
+                if _stopped(): return True
+            r = t.result()
+            if _stopped(): return True
+            if r is None:
+                if played == 0: return False
+                text_area_insert(f"⚠️ 第 {i + 1}/{len(segs)} 段合成失敗，略過", "TTS")
+                continue
+            path, lbl = r
+            now = loop.time()
+            if played == 0:
+                label = lbl
+                print(f"[TTS] stream: first segment ready in {(now - t0) * 1000.0:.0f} ms")
+                if should_chime and START_SOUND and os.path.isfile(START_SOUND):
+                    play_sound(START_SOUND, ignore_interrupt=True, wait=False, seq=-1, stream=sid)
+                    play_until = now + _probe_duration(START_SOUND)
+            dur = max(0.5, _probe_duration(path))
+            play_sound(path, duration_estimate=dur, wait=False, seq=i, stream=sid)
+            play_until = max(play_until, now) + dur
+            played += 1
+            pct = int(100 * (i + 1) / len(segs)); ui_safe(_set_progress, pct); STATE["progress"] = pct
+        while loop.time() < play_until:
+            if _stopped(): return True
+            await asyncio.sleep(0.1)
+        if played == 0: return False
+        if not _stopped():
+            try:
+                if should_chime and END_SOUND and os.path.exists(END_SOUND):
+                    await _in_executor(play_sound, END_SOUND, ignore_interrupt=True)
+            except Exception:
+                pass
+            ui_safe(set_playing_status, f"✅ 朗讀完成（{label}｜分段 {played}/{len(segs)}）")
+        return True
+    finally:
+        for t in tasks:
+            t.cancel()
+
+def _tts_parse_meta(text):
+    """去掉來源標籤並解析 {{L=xx|G=xx|C=off}} → (text, lang, gender, chime_off)"""
+    local_lang = local_gender = None
+    chime_off = False
+    # [Safety] Strip sender tag if present (e.g. "@API_V2: ...")
+    # Matches "@Tag: " or "@Tag： " at start
+    if text.startswith("@"):
+        text = re.sub(r"^@[\w_]+[:：]\s*", "", text)
+    if text.startswith("{{") and "}}" in text:
+        try:
+            end_idx = text.find("}}")
+            meta_str = text[2:end_idx]
+            text = text[end_idx+2:]
+            for part in meta_str.split("|"):
+                if "=" in part:
+                    k, v = part.split("=", 1)
+                    if k == "L": local_lang = v
+                    if k == "G": local_gender = v
+                    if k == "C" and v == "off": chime_off = True
+        except Exception: pass
+    return text, local_lang, local_gender, chime_off
+
+def _tts_active_rate():
+    # [Fix] Unified Rate Fetching
+    active_rate = STATE.get("voice_rate") or STATE.get("rate") or str(globals().get("voice_rate", "0%"))
+    if not active_rate.endswith("%"): active_rate += "%"
+    if not (active_rate.startswith("+") or active_rate.startswith("-")):
+        active_rate = "+" + active_rate
+    return active_rate
+
+async def speak_text_async(text, force_chime_off=False):
+    try:
+        # Parse Per-Message Metadata: {{L=xx|G=xx}}text
+        text, local_lang, local_gender, chime_off = _tts_parse_meta(text)
+        should_chime = CHIME_ENABLED and not (force_chime_off or chime_off)
 
+        stop_playback_event.clear()  # ←避免前導音被殘留的停止旗標打斷
+        if stop_playback_event.is_set() or voice_muted:
             return
+        ui_safe(set_playing_status, " 朗讀中：")
+        ui_safe(_set_progress, 0); STATE["progress"] = 0
 
-        except Exception as e:
+        active_rate = _tts_active_rate()
+        print(f"[DEBUG] speak_text_async: Using active_rate={active_rate}")
 
-            text_area_insert(f"❌ gTTS 備援失敗：{e}，嘗試 Piper...", "TTS")
+        lang = local_lang if local_lang else detect_language(text)
+        is_taigi = (lang == "nan-TW")
 
-            pass
 
 
+        # 台語路徑：交給專用函式播放，避免重複前導/結束音
 
-        # 3rd Priority: Piper
+        if is_taigi:
 
-        # Reload CFG just in case user added it recently
+            await _in_executor(play_taigi_tts, text)
 
-        global PIPER_CFG
+            return
 
-        if not _piper_available():
 
-            PIPER_CFG = _piper_load_cfg()
 
+        # [NEW] 0. MeloTTS (Priority 1)
+        # 限制 Melo 僅處理中文 (zh-TW, zh-CN, zh)
+        is_zh = (lang and (lang.startswith("zh") or "zh" in lang))
+        
+        will_use_melo = (USE_MELO_TTS and _melo_ready() and is_zh)
 
+        if stop_playback_event.is_set() or voice_muted:
+            return
 
-        if not TRIAL_EXPIRED and _piper_available():
-            text_area_insert(f"ℹ️ gTTS 不可用，轉用 Piper 備援…", "TTS")
-            try:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as fp:
-                    wav_path = fp.name
-                ok, log = _piper_run_to_wav(text, wav_path, lang_code=lang)
-                if ok:
-                    if stop_playback_event.is_set() or voice_muted:
-                        try: os.remove(wav_path)
-                        except: pass
-                        return
-                    # [Chime] Piper Fallback
-                    if should_chime and START_SOUND and os.path.isfile(START_SOUND):
-                         print(f"[Chime] Playing start (Azure): {START_SOUND}")
-                         play_fx(START_SOUND, ignore_interrupt=True)
-                         time.sleep(0.5)
-                    play_sound(wav_path)
-                    # [Safety] 延遲刪除
-                    def delayed_cleanup(p):
-                        try:
-                            import time
-                            time.sleep(10)
-                            if os.path.exists(p): os.remove(p)
-                        except: pass
-                    threading.Thread(target=delayed_cleanup, args=(wav_path,), daemon=True).start()
-                    if not (stop_playback_event.is_set() or voice_muted):
-                        try:
-                            if os.path.exists(END_SOUND):
-                                play_sound(END_SOUND, ignore_interrupt=True)
-                        except Exception:
-                            pass
-                        ui_safe(set_playing_status, "✅ 朗讀完成（Piper 離線）")
-                    return
-                else:
-                    text_area_insert(f"❌ Piper 合成失敗：{log}", "TTS")
-            except Exception as e:
-                text_area_insert(f"❌ Piper 例外：{e}", "TTS")
+        if USE_MELO_TTS:
+            if not _melo_ready():
+                 text_area_insert(f"⚠️ 跳過 MeloTTS (Init={HAS_MELO}, Err={MELO_ERR})", "TTS")
+            elif not is_zh:
+                 text_area_insert(f"ℹ️ MeloTTS 僅限中文，目前語系 {lang} 將跳過並使用備援引擎", "TTS")
+
+        hedge = TTS_HEDGE_DELAY_SEC if TTS_HEDGE_DELAY_SEC and TTS_HEDGE_DELAY_SEC > 0 else None
+        segs = _tts_split_segments(text) if len(text) >= TTS_STREAM_MIN_CHARS else [text]
+        if len(segs) > 1:
+            # [NEW] 長公告分段合成，第一段好了就先播，其餘邊播邊合成
+            make = lambda seg: _tts_build_candidates(seg, lang, local_lang, local_gender, active_rate, will_use_melo, notes=(seg is segs[0]))
+            if await _tts_stream(segs, make, should_chime, hedge) or stop_playback_event.is_set() or voice_muted:
+                return
         else:
-             # Debug info for user
-             pe = PIPER_CFG.get("piper_exe") or "未設定"
-             pm = PIPER_CFG.get("model") or "未設定"
-             text_area_insert(f"⚠️ Piper 尚未就緒（Exe: {pe}, Model: {pm}）", "TTS")
+            cands = _tts_build_candidates(text, lang, local_lang, local_gender, active_rate, will_use_melo)
+            if stop_playback_event.is_set() or voice_muted:
+                return
+            winner, path, label = await _tts_race(cands, hedge_delay=hedge, deadline=TTS_DEADLINE_SEC)
+            if stop_playback_event.is_set() or voice_muted:
+                return
+            if winner:
+                if winner.engine == "melo": ui_safe(set_playing_status, f"🔊 MeloTTS 播放中...")
+                await _tts_play_rendered(path, should_chime, label)
+                return
+
 
 
 
@@ -5046,7 +7238,10 @@ async def speak_text_async(text, force_chime_off=False):
 
             import pyttsx3
 
-            eng = pyttsx3.init(); eng.say(text); eng.runAndWait()
+            def _sapi_say():
+                eng = pyttsx3.init(); eng.say(text); eng.runAndWait()
+
+            await _in_executor(_sapi_say)   # runAndWait 會阻塞，移出共用 loop，避免卡住其他合成/預覽
 
             if not (stop_playback_event.is_set() or voice_muted):
 
@@ -5098,6 +7293,110 @@ def speech_worker():
 
 
 
+# ===============================
+# == [ANCHOR] TTS 預先合成（排程/課表） ==
+# ===============================
+# [NEW] 提前把接下來 N 小時內會觸發的朗讀內容合成進 TTS 快取並 pin 住，
+#       07:58 的廣播就算雲端 TTS 掛掉也能直接從本機檔案播出。
+TTS_PRERENDER_HOURS = 14
+TTS_PRERENDER_INTERVAL_SEC = 1800
+TTS_PRERENDER_PIN_GRACE_SEC = 900
+PRERENDER_STATS = {"runs": 0, "items": 0, "rendered": 0, "failed": 0, "last_run": None, "last_ms": 0.0}
+_prerender_kick = threading.Event()
+
+_TTS_CMD_RE = re.compile(r"^[A-Za-z_]+:")
+
+def _tts_payload_text(payload):
+    """排程/課表的 handle_msg 指令 → (朗讀文字, 是否台語)；非朗讀指令回傳 (None, False)"""
+    p = (payload or "").strip()
+    if not p: return None, False
+    show = p.startswith("ShowMsg:")
+    if show:
+        p = p.split(":", 1)[1].strip()
+    if p.startswith("lang:tw|") or p.startswith("lang:nan|"):
+        return p.split("|", 1)[1].strip() or None, True
+    if show or p.startswith("{{"):
+        return p or None, False
+    if p.startswith("PlayTaigi:"):
+        return p.split(":", 1)[1].strip() or None, True
+    if _TTS_CMD_RE.match(p) or re.fullmatch(r"[A-Za-z_]+", p):
+        return None, False     # Bell:/PlayMP3:/SetRate:/CancelAll ... 不是朗讀
+    return p, False
+
+def _tts_upcoming(hours=TTS_PRERENDER_HOURS):
+    """接下來 hours 小時內的 (觸發時間, 指令)：直接問 SCHEDULE_INDEX / TT_ENGINE（假日、星期六規則只有一份）"""
+    now = SCHED_CLOCK.now(); end = now + timedelta(hours=hours)
+    out = []
+    for at, it in SCHEDULE_INDEX.upcoming(end):
+        if (it.get("type") or "cmd").lower() == "sendmp3": continue
+        if at >= now: out.append((at, it.get("payload") or ""))
+    if timetable_enabled:
+        cursor = now
+        while True:
+            nxt = TT_ENGINE.next_after(cursor)
+            if not nxt or nxt[0] > end: break
+            for _, it in nxt[1]:
+                action = (it.get("action") or "").strip()
+                if action: out.append((nxt[0], action))
+            cursor = nxt[0] + timedelta(minutes=1)
+    return sorted(out, key=lambda x: x[0])
+
+async def tts_prerender(text, pin_until):
+    """跟 speak_text_async 相同的解析/分段/引擎順序，只合成不播放；結果 pin 在快取到 pin_until"""
+    text, local_lang, local_gender, _ = _tts_parse_meta(text)
+    active_rate = _tts_active_rate()
+    lang = local_lang if local_lang else detect_language(text)
+    if lang == "nan-TW":
+        return bool(await _in_executor(_taigi_render, text, pin_until))
+    is_zh = (lang and (lang.startswith("zh") or "zh" in lang))
+    will_use_melo = (USE_MELO_TTS and _melo_ready() and is_zh)
+    hedge = TTS_HEDGE_DELAY_SEC if TTS_HEDGE_DELAY_SEC and TTS_HEDGE_DELAY_SEC > 0 else None
+    segs = _tts_split_segments(text) if len(text) >= TTS_STREAM_MIN_CHARS else [text]
+    token = _TTS_PIN_UNTIL.set(pin_until)
+    try:
+        for seg in segs:
+            cands = _tts_build_candidates(seg, lang, local_lang, local_gender, active_rate, will_use_melo, notes=False)
+            w, _, _ = await _tts_race(cands, hedge_delay=hedge, deadline=TTS_DEADLINE_SEC, status=False)
+            if not w: return False
+        return True
+    finally:
+        _TTS_PIN_UNTIL.reset(token)
+
+def tts_prerender_once():
+    t0 = time.perf_counter()
+    seen = set()
+    PRERENDER_STATS["runs"] += 1
+    for at, payload in _tts_upcoming():
+        text, taigi = _tts_payload_text(payload)
+        if not text or text in seen: continue
+        seen.add(text)
+        PRERENDER_STATS["items"] += 1
+        pin_until = at.timestamp() + TTS_PRERENDER_PIN_GRACE_SEC
+        try:
+            if taigi:
+                ok = bool(_taigi_render(text, pin_until))
+            else:
+                ok = SPEECH_LOOP.run(tts_prerender(text, pin_until), timeout=TTS_DEADLINE_SEC * 4)
+        except Exception as e:
+            ok = False
+            print(f"[Prerender] {text[:20]}…: {e}")
+        PRERENDER_STATS["rendered" if ok else "failed"] += 1
+    PRERENDER_STATS["last_run"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    PRERENDER_STATS["last_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    if seen: print(f"[Prerender] {len(seen)} item(s) checked in {PRERENDER_STATS['last_ms']:.0f} ms")
+
+def tts_prerender_loop():
+    time.sleep(60)   # 等開機時的引擎/網路初始化
+    while True:
+        try:
+            if TTS_CACHE is not None: tts_prerender_once()
+        except Exception as e:
+            print(f"[Prerender] error: {e}")
+        _prerender_kick.wait(TTS_PRERENDER_INTERVAL_SEC)
+        _prerender_kick.clear()
+
+
+
 # ===============================
 
 # == [ANCHOR] 網路工具 ==
@@ -5341,35 +7640,63 @@ def generate_taigi_tts(text, gender=None, speed_percent=None):
     return None
 
 
+def _taigi_is_mostly_mandarin(t):
+    # 簡單判定：若無台語特有漢字/符號且是中文，則嘗試翻譯
+    taigi_markers = ["嘅","哋","冇","係","乜","啦","咩","啫","㗎","呢","咗","喺","度","領","閣","咧","毋","袂","ê"]
+    for m in taigi_markers:
+        if m in t: return False
+    return True
+
+def _taigi_render(text, pin_until=None):
+    """
+    (必要時翻譯) → 合成，回傳檔案路徑。
+    [NEW] 結果複製進 TTS 快取；key 用翻譯前的原文，命中時連翻譯 API 都不用呼叫。
+    """
+    key = None
+    if TTS_CACHE is not None:
+        g = globals().get("voice_gender") or "female"
+        key = TTS_CACHE.key("taigi", "f" if g.startswith("f") else "m", globals().get("voice_rate"), "nan-TW", text)
+        hit = TTS_CACHE.get(key)
+        if hit:
+            if pin_until: TTS_CACHE.pin(key, pin_until)
+            return hit
+
+    processed_text = text
+    translated_ok = True
+    if _taigi_is_mostly_mandarin(text):
+        translated_ok = False   # 需要翻譯：翻譯成功前不寫入快取（否則之後每次都播國語版本、永不重試）
+        try:
+            # 呼叫翻譯 API (zh2nan)
+            # 使用已有邏輯，假設 API Key 正確
+            headers = {"x-api-key": TAIGI_TRANSLATE_API_KEY, "Content-Type":"application/json"}
+            payload = {"inputText": text, "inputLan": "zhtw", "outputLan": "tw"}
+            r = _post_with_fallback(TAIGI_TRANSLATE_ENDPOINTS, headers, payload, timeout=10)
+            if r.status_code == 200:
+                jr = r.json()
+                if jr.get("outputText"):
+                    processed_text = jr["outputText"]; translated_ok = True
+                    print(f"[Taigi] Translated: {text} -> {processed_text}")
+            if not translated_ok:
+                print(f"[Taigi] Translate failed (HTTP {r.status_code}), not caching untranslated render")
+        except Exception as e:
+            print(f"[Taigi] Translate error: {e}, not caching untranslated render")
+
+    # Generate (Uses model6 by default)
+    path = generate_taigi_tts(processed_text)
+    if path and key and translated_ok and os.path.isfile(path):
+        if pin_until: TTS_CACHE.pin(key, pin_until)
+        ext = os.path.splitext(path)[1] or ".wav"
+        tmp = TTS_CACHE.tmp_path(ext)
+        shutil.copyfile(path, tmp)
+        path = TTS_CACHE.put(key, tmp, ext) or path
+    return path
+
 def play_taigi_tts(text):
     """此處模仿 taigi_edu.html 的「發聲模組」方式：高音質合成 + 直接廣播。"""
     try:
         # 自動偵測是否需要翻譯 (若文字為國語則先轉台語，模仿教育模組流程)
-        def _is_mostly_mandarin(t):
-            # 簡單判定：若無台語特有漢字/符號且是中文，則嘗試翻譯
-            taigi_markers = ["嘅","哋","冇","係","乜","啦","咩","啫","㗎","呢","咗","喺","度","領","閣","咧","毋","袂","ê"]
-            for m in taigi_markers:
-                if m in t: return False
-            return True
-
-        processed_text = text
-        if _is_mostly_mandarin(text):
-            try:
-                # 呼叫翻譯 API (zh2nan)
-                # 使用已有邏輯，假設 API Key 正確
-                headers = {"x-api-key": TAIGI_TRANSLATE_API_KEY, "Content-Type":"application/json"}
-                payload = {"inputText": text, "inputLan": "zhtw", "outputLan": "tw"}
-                r = _post_with_fallback(TAIGI_TRANSLATE_ENDPOINTS, headers, payload, timeout=10)
-                if r.status_code == 200:
-                    jr = r.json()
-                    if jr.get("outputText"):
-                        processed_text = jr["outputText"]
-                        print(f"[Taigi] Translated: {text} -> {processed_text}")
-            except: pass
+        path = _taigi_render(text)
 
-        # Generate (Uses model6 by default)
-        path = generate_taigi_tts(processed_text)
-        
         # Play (Server Side + Web Broadcast)
         if path:
             taigi_play_wav_with_fx(path)
@@ -5625,145 +7952,81 @@ def _load_timetable_from_disk():
 
             data = sample; loaded = True
 
-    except Exception as e:
-
-        text_area_insert(f"❌ 載入課表失敗：{e}")
-
-    timetable_data = data
-
-    timetable_enabled = bool(timetable_data.get("enabled", True))
-
-    try:
-
-        _TIMETABLE_MTIME = os.path.getmtime(path_json)
-
-    except Exception:
-
-        _TIMETABLE_MTIME = None
-
-    STATE["timetable"] = {
-
-        "enabled": timetable_enabled,
-
-        "loaded": loaded,
-
-        "count": len(timetable_data.get("items", [])),
-
-        "path": TIMETABLE_PATH
-
-    }
-
-    if 'timetable_status_var' in globals():
-
-        ui_safe(timetable_status_var.set, f" 課表：{'啟用' if timetable_enabled else '停用'}，已載入 {STATE['timetable']['count']} 筆")
-
-    if 'timetable_path_var' in globals():
-
-        ui_safe(lambda: timetable_path_var.set(f"路徑：{STATE['timetable']['path']}"))
-
-    if 'refresh_timetable_tree' in globals():
-
-        ui_safe(refresh_timetable_tree)
-
-
-
-def _is_holiday(today: date) -> bool:
-
-    if today.isoweekday() == 6 and not timetable_data.get("treat_saturday_as_school", False):
-
-        return True
-
-    if timetable_data.get("skip_holidays", True):
-
-        ymd = today.strftime("%Y-%m-%d")
-
-        if ymd in (timetable_data.get("holidays") or []):
-
-            return True
-
-    return False
-
-
-
-def _parse_hhmm_to_minutes(s: str) -> int | None:
-
-    try:
-
-        h, m = s.strip().split(":")
-
-        return int(h)*60 + int(m)
-
-    except Exception:
-
-        return None
+    except Exception as e:
 
+        text_area_insert(f"❌ 載入課表失敗：{e}")
 
+    timetable_data = data
 
-def compute_next_ring(now_dt=None):
+    timetable_enabled = bool(timetable_data.get("enabled", True))
 
-    if now_dt is None: now_dt = datetime.now()
+    try:
 
-    if not timetable_data.get("items"): return None
+        _TIMETABLE_MTIME = os.path.getmtime(path_json)
 
-    for day_offset in range(0, 14):
+    except Exception:
 
-        d = (now_dt.date() if hasattr(now_dt, "date") else date.today()) + timedelta(days=day_offset)
+        _TIMETABLE_MTIME = None
 
-        if _is_holiday(d): continue
+    STATE["timetable"] = {
 
-        wd = d.isoweekday(); ymd = d.strftime("%Y-%m-%d")
+        "enabled": timetable_enabled,
 
-        candidates = []
+        "loaded": loaded,
 
-        for i, it in enumerate(timetable_data.get("items", [])):
+        "count": len(timetable_data.get("items", [])),
 
-            t = (it.get("time") or "").strip()
+        "path": TIMETABLE_PATH
 
-            if not t: continue
+    }
 
-            mins = _parse_hhmm_to_minutes(t)
+    if 'timetable_status_var' in globals():
 
-            if mins is None: continue
+        ui_safe(timetable_status_var.set, f" 課表：{'啟用' if timetable_enabled else '停用'}，已載入 {STATE['timetable']['count']} 筆")
 
-            if it.get("date"):
+    if 'timetable_path_var' in globals():
 
-                if it["date"] == ymd: continue
+        ui_safe(lambda: timetable_path_var.set(f"路徑：{STATE['timetable']['path']}"))
 
-            else:
+    if 'refresh_timetable_tree' in globals():
 
-                dow = it.get("dow") or it.get("weekday") or it.get("days")
+        ui_safe(refresh_timetable_tree)
 
-                ok = False
 
-                if isinstance(dow, (list, tuple)):
 
-                    ok = any(int(d)==wd if isinstance(d, int) or str(d).isdigit() else False for d in dow)
+def _is_holiday(today: date) -> bool:
 
-                else:
+    return TT_ENGINE.is_holiday(today)   # [MOD] 假日/星期六規則只保留 TimetableEngine 一份
 
-                    try: ok = int(dow) == wd
 
-                    except Exception: ok = False
 
-                if not ok: continue
+def _parse_hhmm_to_minutes(s: str) -> int | None:
 
-            if day_offset == 0:
+    try:
 
-                now_mins = now_dt.hour*60 + now_dt.minute
+        h, m = s.strip().split(":")
 
-                if mins <= now_mins: continue
+        return int(h)*60 + int(m)
 
-            candidates.append((mins, it.get("label","")))
+    except Exception:
 
-        if candidates:
+        return None
 
-            mins, label = sorted(candidates)[0]
 
-            hh, mm = divmod(mins, 60)
 
-            return ymd, f"{hh:02d}:{mm:02d}", label
+# [NEW] 課表引擎（sched_core.TimetableEngine）：每個星期幾一份排序陣列 + 指定日期例外表 + 假日集合，
+#       直接算出下一次響鈴的精確時間；排程器在 Condition 上睡到那一刻（重新載入/編輯/啟停會喚醒重算）。
+#       SCHED_CLOCK 可替換成模擬時鐘（bench/sched_replay_bench.py 用它重播整個學年）。
+SCHED_CLOCK = SystemClock()
+TT_ENGINE = TimetableEngine(SCHED_CLOCK)
 
-    return None
+def compute_next_ring(now_dt=None):
+    if now_dt is None: now_dt = SCHED_CLOCK.now()
+    nxt = TT_ENGINE.next_after(now_dt.replace(second=0, microsecond=0) + timedelta(minutes=1))
+    if not nxt: return None
+    at, idxs = nxt
+    label = min((it.get("label", "") for _, it in idxs), default="")
+    return at.strftime("%Y-%m-%d"), at.strftime("%H:%M"), label
 
 
 
@@ -5833,59 +8096,21 @@ _schedules_last_fired = set()
 
 
 
-def timetable_scheduler_loop():
-
-    global _last_fired_today
+def _timetable_prefetch(idxs):
+    """[NEW] 鈴聲在 SYNC_PREFETCH_SEC 秒內響起：先送 prepare 讓前端預載"""
+    for _, it in idxs:
+        rel = CMD_SOUND_TABLE.get((it.get("action") or "").strip())
+        if rel: audio_prepare(os.path.abspath(rel))
 
+def timetable_scheduler_loop():
+    fire = lambda i, it, at: _trigger_action((it.get("action") or "").strip(), it.get("label", ""), idx=i)
     while True:
-
         try:
-
-            if timetable_enabled and timetable_data.get("items"):
-
-                today = date.today()
-
-                if not _is_holiday(today):
-
-                    hhmm = _now_hhmm()
-
-                    ymd = _today_str()
-
-                    wd = today.isoweekday()
-
-                    for i, it in enumerate(timetable_data.get("items", [])):
-
-                        action = (it.get("action") or "").strip()
-
-                        if not action: continue
-
-                        label = it.get("label",""); key = f"{ymd} {hhmm} #{i}"
-
-                        if key in _last_fired_today: continue
-
-                        if it.get("date"):
-
-                            if it["date"] == ymd and it.get("time") == hhmm:
-
-                                _last_fired_today.add(key); _trigger_action(action, label, idx=i)
-
-                        else:
-
-                            if int(it.get("dow", 0)) == wd and it.get("time") == hhmm:
-
-                                _last_fired_today.add(key); _trigger_action(action, label, idx=i)
-
-            prefix = _today_str()
-
-            for k in list(_last_fired_today):
-
-                if not k.startswith(prefix): _last_fired_today.discard(k)
-
+            timetable_run_once(TT_ENGINE, _last_fired_today, lambda: timetable_enabled, fire,
+                               prefetch=_timetable_prefetch, prefetch_sec=SYNC_PREFETCH_SEC)
         except Exception as e:
-
             text_area_insert(f"⚠️ 課表排程器錯誤：{e}")
-
-        time.sleep(TIMETABLE_SCAN_SEC)
+            time.sleep(TIMETABLE_SCAN_SEC)
 
 
 
@@ -6050,7 +8275,7 @@ def handle_msg(text, addr):
 
     if text == "ScheduleEnable":
 
-        timetable_enabled = True; STATE["timetable"]["enabled"] = True
+        timetable_enabled = True; STATE["timetable"]["enabled"] = True; TT_ENGINE.kick()
 
         if 'timetable_status_var' in globals(): ui_safe(timetable_status_var.set, " 課表：啟用")
 
@@ -6060,7 +8285,7 @@ def handle_msg(text, addr):
 
     if text == "ScheduleDisable":
 
-        timetable_enabled = False; STATE["timetable"]["enabled"] = False
+        timetable_enabled = False; STATE["timetable"]["enabled"] = False; TT_ENGINE.kick()
 
         if 'timetable_status_var' in globals(): ui_safe(timetable_status_var.set, " 課表：停用")
 
@@ -6248,7 +8473,7 @@ def handle_msg(text, addr):
 
     if text == "RelayOn":
 
-        control_usb_relay("ON")
+        relay_manual(True, "RelayOn")
 
         text_area_insert(f" 收到 RelayOn 指令（來自 {sender}）")
 
@@ -6258,7 +8483,7 @@ def handle_msg(text, addr):
 
     if text == "RelayOff":
 
-        control_usb_relay("OFF")
+        relay_manual(False, "RelayOff")
 
         text_area_insert(f" 收到 RelayOff 指令（來自 {sender}）")
 
@@ -6423,6 +8648,7 @@ def handle_msg(text, addr):
         val = text[15:].strip().lower()
         USE_MELO_TTS = (val == "true")
         STATE["melo_enabled"] = USE_MELO_TTS
+        if USE_MELO_TTS: threading.Thread(target=start_melo_pool, daemon=True).start()
         status_msg = "已啟用" if USE_MELO_TTS else "已停用"
         text_area_insert(f" Melo AI 语系 {status_msg}（来自 {sender}）")
         return
@@ -6609,7 +8835,7 @@ def handle_msg(text, addr):
 
             # Request: PlayChime:Start -> Relay ON -> Sound
 
-            try: control_usb_relay("ON")
+            try: relay_manual(True, "PlayChime:Start")
 
             except Exception as e: text_area_insert(f"❌ Relay ON Fail: {e}")
 
@@ -6653,7 +8879,7 @@ def handle_msg(text, addr):
 
             text_area_insert(f" 結束音播畢 -> Relay OFF")
 
-            try: control_usb_relay("OFF")
+            try: relay_manual(False, "PlayChime:End")
 
             except Exception as e: text_area_insert(f"❌ Relay OFF Fail: {e}")
 
@@ -6809,6 +9035,8 @@ def _load_timetable_from_disk():
 
         STATE["timetable"]["loaded"] = True
 
+        TT_ENGINE.rebuild(timetable_data)   # [NEW] 重新編譯課表引擎並喚醒排程器
+
         print(f"[TIMETABLE] Load complete. enabled={timetable_enabled}, items={len(timetable_data.get('items', []))}")
 
     except Exception as e:
@@ -6931,6 +9159,110 @@ tracker = OnlineTracker(groups=6, ttl=15, stale=600)
 
 
 
+# -------- 指令紀錄（環狀緩衝） --------
+
+class CommandLog:
+
+    """固定容量的每組指令紀錄。
+
+    版本號由 bump() 逐一遞增，因此「版本 → 槽位」可直接換算，不需掃描；
+    指定 IP 的指令另存 frozenset 供 O(1) 判斷。
+    """
+
+    def __init__(self, capacity: int = 500):
+
+        self.capacity = capacity
+
+        self._buf = [None] * capacity     # (entry, ipset|None)
+
+        self._head = 0                    # 最舊一筆的槽位
+
+        self._count = 0
+
+        self._first_v = 0                 # 最舊一筆的版本
+
+    def __len__(self):
+
+        return self._count
+
+    @property
+
+    def last_v(self):
+
+        return self._first_v + self._count - 1 if self._count else 0
+
+    def append(self, entry, ips=None):
+
+        v = entry["v"]
+
+        if self._count and v != self.last_v + 1:
+
+            self.clear()              # 版本不連續（理論上不會發生）→ 重新起算
+
+        if not self._count:
+
+            self._first_v = v
+
+        ipset = frozenset(ips) if ips else None
+
+        if self._count < self.capacity:
+
+            self._buf[(self._head + self._count) % self.capacity] = (entry, ipset)
+
+            self._count += 1
+
+        else:
+
+            self._buf[self._head] = (entry, ipset)
+
+            self._head = (self._head + 1) % self.capacity
+
+            self._first_v += 1
+
+    def clear(self):
+
+        self._buf = [None] * self.capacity
+
+        self._head = self._count = self._first_v = 0
+
+    def needs_resync(self, since: int) -> bool:
+
+        """since 之後的指令已被覆蓋（或 since 比目前版本還新，例如伺服器重啟）。"""
+
+        if since <= 0:
+
+            return False
+
+        if not self._count:
+
+            return True
+
+        return since < self._first_v - 1 or since > self.last_v
+
+    def since(self, since: int, ip: str = ""):
+
+        """回傳版本 > since 且對該 IP 有效的指令。"""
+
+        if not self._count or since >= self.last_v:
+
+            return []
+
+        start = max(since + 1, self._first_v) - self._first_v
+
+        out = []
+
+        for i in range(start, self._count):
+
+            entry, ipset = self._buf[(self._head + i) % self.capacity]
+
+            if ipset is not None and ip not in ipset: continue
+
+            out.append(entry)
+
+        return out
+
+
+
 # -------- 狀態 --------
 
 groups_lock = threading.Lock()
@@ -6941,7 +9273,7 @@ groups = {
 
         "version": 0,
 
-        "queue": [],
+        "cmdlog": CommandLog(500),
 
         "state": {
 
@@ -6967,6 +9299,15 @@ group_targets = {str(i): [] for i in range(1,7)}
 
 live_sync = {i: None for i in range(1,7)}
 
+# [NEW] /poll 長輪詢喚醒：每組一個 Condition（共用 groups_lock），push_cmd 時 notify_all
+POLL_TIMEOUT_SEC = 25.0     # 單次長輪詢最長掛起秒數
+POLL_MAX_WAITERS = 400      # 每組同時掛起的 /poll 上限，超過回 503 讓前端退避
+groups_cond = {i: threading.Condition(groups_lock) for i in groups}
+poll_waiters = {i: 0 for i in groups}
+_poll_notify_ts = {i: 0.0 for i in groups}
+POLL_STATS = {"wakes": 0, "timeouts": 0, "rejected": 0, "resyncs": 0, "peak_waiters": 0,
+              "wake_lat_ms_sum": 0.0, "wake_lat_ms_max": 0.0}
+
 TARGETS_FILE = os.path.join(APP_DIR, "targets.json")
 
 
@@ -7047,17 +9388,19 @@ def client_ip():
 
 def push_cmd(g, cmd, only_ips=None):
 
+    """寫入指令並喚醒該組掛起的 /poll（呼叫端須持有 groups_lock）。"""
+
     v = bump(g)
 
     entry = {"v": v, "cmd": cmd, "ts": now()}
 
     if only_ips: entry["ips"] = list(only_ips)
 
-    groups[g]["queue"].append(entry)
+    groups[g]["cmdlog"].append(entry, only_ips)
 
-    if len(groups[g]["queue"]) > 500:
+    _poll_notify_ts[g] = time.monotonic()
 
-        groups[g]["queue"] = groups[g]["queue"][-500:]
+    groups_cond[g].notify_all()
 
     return v
 
@@ -8680,41 +11023,67 @@ def api_poll():
 
 
 
-    start = time.time(); timeout = 25.0; interval = 0.25
+    ip = client_ip()
 
-    while time.time() - start < timeout:
+    deadline = time.monotonic() + POLL_TIMEOUT_SEC
 
-        with groups_lock:
+    with groups_lock:
+
+        if groups[g]["cmdlog"].needs_resync(since):
 
-            curv = groups[g]["version"]
+            POLL_STATS["resyncs"] += 1
 
-            if curv > since:
+            return jsonify(ok=True, resync=True, version=groups[g]["version"], cmds=[], state=snapshot(g),
 
-                ip = (request.headers.get("X-Forwarded-For") or "").split(",")[0].strip() or request.remote_addr or ""
+                           live_sync=live_sync.get(g), now=int(time.time()),
 
-                cmds = []
+                           title=SITE_TITLE, public_url=STATE.get("ngrok_url"))
 
-                for e in groups[g]["queue"]:
+        if groups[g]["version"] <= since:
 
-                    if e["v"] <= since: continue
+            if poll_waiters[g] >= POLL_MAX_WAITERS:
 
-                    ips = e.get("ips")
+                POLL_STATS["rejected"] += 1
 
-                    if ips and ip not in ips: continue
+                return jsonify(ok=False, error="too many pollers"), 503, {"Retry-After": "2"}
 
-                    cmds.append(e)
+            poll_waiters[g] += 1
 
-                return jsonify(ok=True, version=curv, cmds=cmds, state=snapshot(g),
+            POLL_STATS["peak_waiters"] = max(POLL_STATS["peak_waiters"], poll_waiters[g])
 
-                               live_sync=live_sync.get(g), now=int(time.time()),
+            try:
 
-                               title=SITE_TITLE, public_url=STATE.get("ngrok_url"))
+                while groups[g]["version"] <= since:
 
-        time.sleep(interval)
+                    remaining = deadline - time.monotonic()
 
-    with groups_lock:
+                    if remaining <= 0: break
+
+                    groups_cond[g].wait(remaining)
+
+            finally:
+
+                poll_waiters[g] -= 1
 
-        return jsonify(ok=True, version=groups[g]["version"], cmds=[], state=snapshot(g),
+            if groups[g]["version"] > since:
+
+                lat_ms = (time.monotonic() - _poll_notify_ts[g]) * 1000.0
+
+                POLL_STATS["wakes"] += 1
+
+                POLL_STATS["wake_lat_ms_sum"] += lat_ms
+
+                POLL_STATS["wake_lat_ms_max"] = max(POLL_STATS["wake_lat_ms_max"], lat_ms)
+
+            else:
+
+                POLL_STATS["timeouts"] += 1
+
+        curv = groups[g]["version"]
+
+        cmds = groups[g]["cmdlog"].since(since, ip)
+
+        return jsonify(ok=True, version=curv, cmds=cmds, state=snapshot(g),
 
                        live_sync=live_sync.get(g), now=int(time.time()),
 
@@ -9749,6 +12118,8 @@ def api_quake_state():
         has_key=bool(CWA_API_KEY), 
         tcp_account=CWA_TCP_ACCOUNT,
         tcp_status=CWA_TCP_STATUS,
+        tcp_stats=dict(CWA_TCP_STATS),
+        tcp_last=CWA_TCP_LAST,
         license_site=CWA_LICENSE_SITE,
         last=CWA_LAST_DATA, 
         last_error=CWA_LAST_ERROR
@@ -9862,6 +12233,194 @@ def api_location():
 
 
 
+# [NEW] CWA TCP 即時推播：直接解析 <Earthquake> XML
+#       舊做法收到推播後丟掉內容、再開執行緒呼叫 _cwa_poll_once（E-A0015/E-A0016 兩次 HTTPS）才響警報；
+#       現在 CWATCPFramer 跨 recv(8192) 邊界組出完整的 <Earthquake>…</Earthquake>，
+#       _cwa_parse_eq_xml 取出規模/震央/深度/各縣市震度，門檻判斷與警報直接從推播觸發；
+#       HTTP 輪詢只當確認（以發震時間去重，不重複響）。
+CWA_TCP_MAX_BUF = 1 << 20           # 找不到結尾時最多暫存的位元組數
+CWA_TCP_STATS = {"frames": 0, "parsed": 0, "parse_errors": 0, "dropped_bytes": 0,
+                 "alarms": 0, "confirmed": 0, "stale": 0, "last_recv_to_alarm_ms": None}
+CWA_TCP_LAST = None                       # 最近一次推播解析出的 event（CWA_LAST_DATA 仍由 HTTP 輪詢維護）
+CWA_EVENT_STALE_SEC = 1800               # 發震超過 30 分鐘的報告不響警報（重連重送/重啟後的舊推播）
+CWA_TCP_CONFIRM_SEC = 30                  # 推播後多久用 HTTP 輪詢確認（報告發布需要時間）
+CWA_ALARMED = collections.OrderedDict()   # 發震時間 -> {"src", "mag", "ts"}（最近 50 筆）
+_CWA_ALARM_LOCK = threading.Lock()
+_CWA_CITY_CACHE = {"city": "", "ts": 0.0}
+_CWA_EQ_OPEN = re.compile(rb"<(?:\w+:)?Earthquake[\s>]")
+_CWA_EQ_CLOSE = re.compile(rb"</(?:\w+:)?Earthquake\s*>")
+
+
+class CWATCPFramer:
+    """把 TCP 位元組流切成完整的 <Earthquake>…</Earthquake> 區塊（以位元組處理，不會切壞 UTF-8）"""
+
+    def __init__(self, max_buf=CWA_TCP_MAX_BUF):
+        self.buf = bytearray(); self.max_buf = max_buf
+
+    def feed(self, data):
+        self.buf += data
+        out = []
+        while True:
+            m = _CWA_EQ_OPEN.search(self.buf)
+            if not m:
+                keep = len("<cwa:Earthquake")          # 開頭標籤可能被切在尾端
+                if len(self.buf) > keep:
+                    CWA_TCP_STATS["dropped_bytes"] += len(self.buf) - keep
+                    del self.buf[:-keep]
+                break
+            if m.start():
+                CWA_TCP_STATS["dropped_bytes"] += m.start(); del self.buf[:m.start()]
+            e = _CWA_EQ_CLOSE.search(self.buf)
+            if not e:
+                if len(self.buf) > self.max_buf:
+                    CWA_TCP_STATS["dropped_bytes"] += len(self.buf); self.buf.clear()
+                break
+            out.append(bytes(self.buf[:e.end()])); del self.buf[:e.end()]
+        return out
+
+
+def _cwa_int_val(s):
+    s = (s or "").replace("級", "").strip()
+    if s in ("5弱", "5-"): return 5.0
+    if s in ("5強", "5+"): return 5.5
+    if s in ("6弱", "6-"): return 6.0
+    if s in ("6強", "6+"): return 6.5
+    try: return float(s)
+    except: return 0.0
+
+
+def _cwa_parse_eq_xml(block):
+    """<Earthquake> XML → 與 fetch_cwa_events 相同格式的 event dict；解析失敗回傳 None"""
+    import xml.etree.ElementTree as ET
+    try:
+        root = ET.fromstring(block)
+    except ET.ParseError:
+        return None
+    for el in root.iter():                       # 去掉 namespace，欄位名稱同 E-A0015 JSON
+        if isinstance(el.tag, str) and "}" in el.tag: el.tag = el.tag.split("}", 1)[1]
+
+    def _t(node, *names):
+        for n in names:
+            x = node.find(f".//{n}")
+            if x is not None and (x.text or "").strip(): return x.text.strip()
+        return ""
+
+    origin = _t(root, "OriginTime")
+    if not origin: return None
+    mag = _parse_cwa_float(_t(root, "MagnitudeValue", "Magnitude")) or 0.0
+    areas, max_i = {}, "0"
+    for a in root.iter("ShakingArea"):
+        i_str = _t(a, "AreaIntensity")
+        county = _t(a, "CountyName") or _t(a, "AreaDesc")
+        if _cwa_int_val(i_str) > _cwa_int_val(max_i): max_i = i_str
+        if county and _cwa_int_val(i_str) > _cwa_int_val(areas.get(county, "0")): areas[county] = i_str
+    eq_no = _t(root, "EarthquakeNo")
+    loc = _t(root, "Epicenter/Location", "Location")
+    return {
+        "id": f"tcp_{eq_no or origin}",
+        "time": origin.replace(" ", "T"),
+        "mag": float(mag),
+        "lat": _parse_cwa_float(_t(root, "EpicenterLatitude")),
+        "lon": _parse_cwa_float(_t(root, "EpicenterLongitude")),
+        "depth": _parse_cwa_float(_t(root, "FocalDepth", "Depth")),
+        "location": loc,
+        "title": _t(root, "ReportContent") or f"{origin} {loc} 規模{mag}",
+        "src": "CWA-TCP",
+        "img": _t(root, "ReportImageURI", "ShakemapImageURI"),
+        "intensity": max_i,
+        "shaking_areas": areas,
+    }
+
+
+def _cwa_refresh_city(force=False):
+    """IP 定位本地縣市並更新快取（只在 _cwa_bg_loop 呼叫；1 小時更新一次，查不到時 5 分鐘後重試）"""
+    if CWA_LOCAL_CITY: return
+    age = time.time() - _CWA_CITY_CACHE["ts"]
+    if not force and age < (3600 if _CWA_CITY_CACHE["city"] else 300): return
+    try:
+        loc = _get_server_location()
+        city = loc.get("city") or loc.get("region") or ""
+    except Exception as e:
+        city = ""; _diag(f"[CWA] location lookup failed: {e}")
+    _CWA_CITY_CACHE.update(city=city or _CWA_CITY_CACHE["city"], ts=time.time())   # 查不到就沿用舊值
+
+
+def _cwa_target_city():
+    """本地縣市：設定值優先，否則讀快取（可能是舊值；不做網路查詢、不阻塞）"""
+    return CWA_LOCAL_CITY or _CWA_CITY_CACHE["city"]
+
+
+def _cwa_event_age_sec(ev):
+    """發震時間距今秒數；無法解析回傳 None"""
+    try:
+        return (datetime.now() - datetime.strptime((ev.get("time") or "").replace("T", " ")[:19], "%Y-%m-%d %H:%M:%S")).total_seconds()
+    except ValueError:
+        return None
+
+
+def _cwa_local_intensity(ev, target_city):
+    local_intensity = "0"
+    if target_city and ev.get("shaking_areas"):
+        for c in (target_city, target_city.replace("台", "臺"), target_city.replace("臺", "台")):
+            local_intensity = ev["shaking_areas"].get(c, "0")
+            if local_intensity != "0": break
+    return local_intensity
+
+
+def _cwa_claim_alarm(ev, src):
+    """同一發震時間只響一次；回傳 True 表示由這次呼叫負責響警報"""
+    key = (ev.get("time") or "")[:19]
+    with _CWA_ALARM_LOCK:
+        prev = CWA_ALARMED.get(key)
+        if prev:
+            if prev["src"] != src:
+                CWA_TCP_STATS["confirmed"] += 1
+                print(f"[CWA] {src} confirms {prev['src']} event {key} (mag {prev['mag']} -> {ev.get('mag')})")
+            return False
+        CWA_ALARMED[key] = {"src": src, "mag": ev.get("mag"), "ts": time.time()}
+        while len(CWA_ALARMED) > 50: CWA_ALARMED.popitem(last=False)
+    return True
+
+
+def _handle_cwa_tcp_event(block, recv_ts=None):
+    """推播的一個 <Earthquake> 區塊：解析 → 門檻判斷 → 直接響警報；解析不了才退回 HTTP 輪詢"""
+    global CWA_TCP_LAST
+    recv_ts = recv_ts or time.perf_counter()
+    CWA_TCP_STATS["frames"] += 1
+    ev = _cwa_parse_eq_xml(block)
+    if not ev:
+        CWA_TCP_STATS["parse_errors"] += 1
+        print("[TCP] Earthquake XML not parseable, falling back to HTTP poll.")
+        threading.Thread(target=_cwa_poll_once, args=(False,), daemon=True).start()
+        return
+    CWA_TCP_STATS["parsed"] += 1
+    CWA_TCP_LAST = ev
+    target_city = _cwa_target_city()
+    local_intensity = _cwa_local_intensity(ev, target_city)
+    intensity_str = f"最大震度 {ev.get('intensity', '0')}"
+    if target_city and local_intensity != "0":
+        intensity_str += f"，{target_city} {local_intensity}"
+    msg = f"【地震速報】{ev['time']} {ev['location']} 規模 {ev['mag']} 深度 {ev['depth']}km {intensity_str}"
+    print(f"[TCP] Earthquake: {msg} (Local Int: {local_intensity} @ {target_city})")
+    age = _cwa_event_age_sec(ev)
+    if age is not None and age > CWA_EVENT_STALE_SEC:
+        CWA_TCP_STATS["stale"] += 1
+        print(f"[TCP] Event outdated ({int(age)}s ago), alarm skipped.")
+        return
+    val_local, val_thresh = _cwa_int_val(local_intensity), _cwa_int_val(CWA_INTENSITY_THRESHOLD)
+    if CWA_ENABLED and CWA_BROADCAST_ENABLED and val_local > 0 and val_local >= val_thresh:
+        if _cwa_claim_alarm(ev, "TCP"):
+            threading.Thread(target=handle_msg, args=("PlayMP3:justEarthquakeAlarm.mp3", ("System", "CWA")), daemon=True).start()
+            threading.Thread(target=handle_msg, args=(f"ShowMsg:{msg}", ("System", "CWA")), daemon=True).start()
+            CWA_TCP_STATS["alarms"] += 1
+            CWA_TCP_STATS["last_recv_to_alarm_ms"] = round((time.perf_counter() - recv_ts) * 1000.0, 2)
+    else:
+        print(f"[TCP] Alarm skipped. Local Int {val_local} < Threshold {val_thresh}")
+    # HTTP 輪詢只做確認（同一發震時間不會重複響）
+    t = threading.Timer(CWA_TCP_CONFIRM_SEC, _cwa_poll_once, args=(False,)); t.daemon = True; t.start()
+
+
+
 def _cwa_poll_once(silent=False):
 
     """單次輪詢邏輯，若有新且顯著地震則廣播"""
@@ -9924,7 +12483,7 @@ def _cwa_poll_once(silent=False):
 
                 
 
-                if diff > 1800: # 30 minutes
+                if diff > CWA_EVENT_STALE_SEC: # 30 minutes
 
                     print(f"[CWA] Event outdated ({int(diff)}s ago), broadcast skipped.")
 
@@ -9944,47 +12503,13 @@ def _cwa_poll_once(silent=False):
 
             # 1. Get Target City
 
-            target_city = CWA_LOCAL_CITY
-
-            if not target_city:
-
-                # Auto-detect
-
-                loc = _get_server_location()
-
-                target_city = loc.get("city") or loc.get("region") or ""
+            target_city = _cwa_target_city()   # [MOD] Auto-detect result cached (shared with TCP path)
 
             
 
-            # 2. Lookup Intensity
-
-            local_intensity = "0"
-
-            if target_city and ev.get("shaking_areas"):
-
-                # Try exact match first
-
-                local_intensity = ev["shaking_areas"].get(target_city, "0")
-
-                
-
-                if local_intensity == "0":
-
-                    # Try "臺" vs "台" replacement
-
-                    alt_city = target_city.replace("台", "臺")
-
-                    local_intensity = ev["shaking_areas"].get(alt_city, "0")
-
-                
-
-                if local_intensity == "0":
-
-                    # Try "臺" vs "台" reverse
+            # 2. Lookup Intensity ("台"/"臺" variants)
 
-                    alt_city = target_city.replace("臺", "台")
-
-                    local_intensity = ev["shaking_areas"].get(alt_city, "0")
+            local_intensity = _cwa_local_intensity(ev, target_city)
 
             
 
@@ -10018,27 +12543,9 @@ def _cwa_poll_once(silent=False):
 
                     
 
-                    def _int_val(s):
-
-                        s = s.replace("級", "").strip()
-
-                        if s in ("5弱", "5-"): return 5.0
-
-                        if s in ("5強", "5+"): return 5.5
-
-                        if s in ("6弱", "6-"): return 6.0
-
-                        if s in ("6強", "6+"): return 6.5
-
-                        try: return float(s)
-
-                        except: return 0.0
-
-                    
-
-                    val_local = _int_val(local_intensity)
+                    val_local = _cwa_int_val(local_intensity)
 
-                    val_thresh = _int_val(CWA_INTENSITY_THRESHOLD)
+                    val_thresh = _cwa_int_val(CWA_INTENSITY_THRESHOLD)
 
                     
 
@@ -10050,7 +12557,9 @@ def _cwa_poll_once(silent=False):
 
                     
 
-                    if should_alarm:
+                    if should_alarm and not _cwa_claim_alarm(ev, "HTTP"):
+                        pass   # [NEW] TCP 推播已響過（此次輪詢為確認）
+                    elif should_alarm:
                         if CWA_BROADCAST_ENABLED:
                             # TTS & Text
                             threading.Thread(target=handle_msg, args=(f"ShowMsg:{msg}", ("System", "CWA")), daemon=True).start()
@@ -10121,11 +12630,13 @@ def _cwa_bg_loop():
     # Start TCP Client if credentials exist
     if CWA_TCP_ACCOUNT and CWA_TCP_PASSWORD:
         global _cwa_tcp_client
+        _cwa_refresh_city(force=True)   # [NEW] 先解析本地縣市，推播到時只讀快取
         _cwa_tcp_client = CWATCPClient(account=CWA_TCP_ACCOUNT, password=CWA_TCP_PASSWORD)
         _cwa_tcp_client.start(callback=_handle_cwa_tcp_data)
     
     while True:
         try:
+            _cwa_refresh_city()   # [NEW] 縣市快取只在這裡更新（推播/輪詢路徑不查網路）
             if CWA_ENABLED:
                 _cwa_poll_once()
             time.sleep(CWA_POLL_SEC)
@@ -10155,14 +12666,15 @@ class CWATCPClient:
                 self.sock.send(login_msg.encode('utf-8'))
                 CWA_TCP_STATUS = "Connected"
                 retry_delay = 15 # Reset delay on success
+                framer = CWATCPFramer()   # [MOD] 跨 recv 邊界組出完整 <Earthquake> 區塊
                 
                 while self.running:
                     try:
                         data = self.sock.recv(8192)
                         if not data: break
-                        text = data.decode('utf-8', errors='ignore')
-                        if "<Earthquake" in text and self.callback:
-                            self.callback(text)
+                        recv_ts = time.perf_counter()
+                        for block in framer.feed(data):
+                            if self.callback: self.callback(block, recv_ts)
                     except socket.timeout: continue
                     except Exception: break
             except Exception as e:
@@ -10187,18 +12699,17 @@ class CWATCPClient:
                 self.sock = None
         CWA_TCP_STATUS = "Stopped"
 
-def _handle_cwa_tcp_data(xml_str):
+def _handle_cwa_tcp_data(block, recv_ts=None):
     """
-    Handle real-time XML from scseewser.
-    Parse roughly to satisfy _cwa_poll_once logic or call it with mock data.
-    For simplicity, we trigger a poll_once(silent=False) immediately to get the latest details 
-    via API but triggered instantly by TCP.
+    Handle real-time XML from scseewser: one complete <Earthquake> block per call
+    (framed by CWATCPFramer). Parsed in place and alarmed immediately;
+    the HTTP poll only confirms (see _handle_cwa_tcp_event).
     """
-    print(f"[TCP] Earthquake Signal Received! Triggering immediate poll.")
-    # We could parse XML here for even faster response, but _cwa_poll_once 
-    # already has all the intensity and broadcast logic.
-    # To avoid double broadcast, we might need a small cooldown.
-    threading.Thread(target=_cwa_poll_once, args=(False,), daemon=True).start()
+    try:
+        _handle_cwa_tcp_event(block, recv_ts)
+    except Exception as e:
+        print(f"[TCP] Earthquake handling error: {e}. Triggering immediate poll.")
+        threading.Thread(target=_cwa_poll_once, args=(False,), daemon=True).start()
 
 _cwa_tcp_client = None
 
@@ -10642,25 +13153,91 @@ def translate_api():
         except Exception as el: 
             print(f"[DEBUG] LibreTranslate failed: {el}")
 
-        # Try MyMemory
-        try:
-            print(f"[DEBUG] MyMemory trying: {source} -> {target}")
-            s_my = source if source != "auto" else "en"
-            out = _try_mymemory(q, s_my, target)
-            if out:
-                return jsonify(ok=True, translatedText=out, text=out, via="mymemory")
-        except Exception as em: 
-            print(f"[DEBUG] All engines failed")
-            return jsonify(ok=False, error=f"所有翻譯引擎均失敗: {em}"), 502
-    except Exception as e:
-        print(f"[DEBUG] translate_api Exception: {e}")
-        return jsonify(ok=False, error=str(e)), 500
+        # Try MyMemory
+        try:
+            print(f"[DEBUG] MyMemory trying: {source} -> {target}")
+            s_my = source if source != "auto" else "en"
+            out = _try_mymemory(q, s_my, target)
+            if out:
+                return jsonify(ok=True, translatedText=out, text=out, via="mymemory")
+        except Exception as em: 
+            print(f"[DEBUG] All engines failed")
+            return jsonify(ok=False, error=f"所有翻譯引擎均失敗: {em}"), 502
+    except Exception as e:
+        print(f"[DEBUG] translate_api Exception: {e}")
+        return jsonify(ok=False, error=str(e)), 500
+
+@app.get("/health")
+
+def health():
+
+    return jsonify(ok=True, ts=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+
+
+def _poll_perf_snapshot():
+
+    with groups_lock:
+
+        st = dict(POLL_STATS)
+
+        st["waiters"] = {str(g): n for g, n in poll_waiters.items()}
+
+    lat_sum = st.pop("wake_lat_ms_sum")
+
+    st["wake_lat_ms_avg"] = round(lat_sum / st["wakes"], 3) if st["wakes"] else 0.0
+
+    st["wake_lat_ms_max"] = round(st["wake_lat_ms_max"], 3)
+
+    return st
+
+
+
+def _live_perf_snapshot():
+
+    st = dict(LIVE_STATS)
+
+    lat_sum = st.pop("join_ms_sum")
+
+    st["join_ms_avg"] = round(lat_sum / st["joins"], 1) if st["joins"] else 0.0
+
+    st["join_ms_max"] = round(st["join_ms_max"], 1)
+
+    with LIVE_BUFFER.lock:
+
+        st["buffer"] = LIVE_BUFFER.stats()
+
+    st["broadcasting"] = RELAY_BROADCASTER_WS is not None
+
+    st["player"] = LIVE_PLAYER.stats() if LIVE_PLAYER else None
+
+    st["mpv"] = WARM_MPV.stats() if WARM_MPV else None
+
+    st["subscribers"] = [sub.stats() for sub in list(LIVE_CLIENTS)]
+
+    return st
+
+
+
+@app.get("/api/perf")
+
+def api_perf():
+
+    """效能計數器（給 bench/ 腳本與監控用）"""
 
-@app.get("/health")
+    return jsonify(ok=True, ts=time.time(), cpu_s=round(time.process_time(), 4),
 
-def health():
+                   threads=threading.active_count(), poll=_poll_perf_snapshot(),
 
-    return jsonify(ok=True, ts=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+                   live=_live_perf_snapshot(), tts_cache=TTS_CACHE.stats() if TTS_CACHE else None,
+                   tts_engines=_tts_engine_snapshot(), speech_loop_jobs=SPEECH_LOOP.jobs,
+                   melo_pool=MELO_POOL.stats() if MELO_POOL else None, piper=_piper_perf_snapshot(),
+                   prerender=dict(PRERENDER_STATS), rec_jobs=_rec_perf_snapshot(),
+                   assets=ASSETS.stats(), media_meta=_media_meta_snapshot(),
+                   hot_audio=HOT_AUDIO.snapshot(), audio_index=AUDIO_INDEX.snapshot(),
+                   sync=_sync_snapshot(), schedules=SCHEDULE_INDEX.snapshot(),
+                   timetable=TT_ENGINE.snapshot(), relay=_relay_snapshot(),
+                   cwa_tcp=dict(CWA_TCP_STATS))
 
 
 
@@ -10668,7 +13245,8 @@ def health():
 
 def no_cache(resp):
 
-    resp.headers["Cache-Control"] = "no-store"
+    # 帶 ETag 的回應允許瀏覽器暫存但每次都要重新驗證（If-None-Match → 304）
+    resp.headers["Cache-Control"] = "no-cache" if resp.headers.get("ETag") else "no-store"
 
     resp.headers["Access-Control-Allow-Origin"] = "*"
 
@@ -11079,6 +13657,8 @@ def delete_file():
 
         os.remove(p)
 
+        AUDIO_INDEX.discard(p)
+
         meta = p + ".json"
 
         if os.path.exists(meta):
@@ -11229,9 +13809,19 @@ def api_logs_list():
 
 
 
-@app.route("/state", methods=["GET"])
+# [NEW] STATE 版本化快照：背景執行緒比對差異後遞增版本，
+#       /state 以 ETag 回 304，/state/stream (SSE) 只推送變動的 key
+STATE_PUSH_INTERVAL = 0.25      # 比對 STATE 差異的週期（秒）
+STATE_SSE_KEEPALIVE = 15        # SSE 無變動時的心跳（秒）
+
+_state_cond = threading.Condition()
+_state_pub = {"version": 0, "snap": {}, "etag": "", "body": b""}
+_state_diffs = collections.deque(maxlen=64)     # (version, changed, removed)
+_state_subs = 0                                 # 目前連線中的 /state/stream 數；0 時背景不比對，/state 改為請求時才比對
+STATE_BOOT_ID = secrets.token_hex(4)            # 每次啟動不同：重啟後版本號從頭算，舊 ETag 不會誤中 304
 
-def state():
+
+def _state_view():
 
     out = dict(STATE)
 
@@ -11240,9 +13830,152 @@ def state():
     out["relay"] = STATE.get("relay", {})
     out["relay_auto_on"] = RELAY_AUTO_ON
 
-    out["ts"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # 透過 JSON 來回一次，順便深拷貝巢狀 dict，比對時不受原地修改影響
+    return json.loads(json.dumps(out, ensure_ascii=False, default=str))
+
+
+def _state_publish_once():
+
+    cur = _state_view()
+
+    with _state_cond:
+
+        prev = _state_pub["snap"]
+
+        changed = {k: v for k, v in cur.items() if k not in prev or prev[k] != v}
+
+        removed = [k for k in prev if k not in cur]
+
+        if not changed and not removed and _state_pub["version"]:
+
+            return False
+
+        v = _state_pub["version"] + 1
+
+        body = dict(cur); body["ts"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S"); body["state_version"] = v
+
+        _state_pub.update(version=v, snap=cur, etag=f'W/"state-{STATE_BOOT_ID}-{v}"',
+
+                          body=json.dumps(body, ensure_ascii=False).encode("utf-8"))
+
+        _state_diffs.append((v, changed, removed))
+
+        _state_cond.notify_all()
+
+    return True
+
+
+def state_publisher_loop():
+
+    while True:
+
+        try:
+            if _state_subs: _state_publish_once()
+
+        except Exception as e: print(f"[STATE] publish error: {e}")
+
+        time.sleep(STATE_PUSH_INTERVAL)
+
+
+@app.route("/state", methods=["GET"])
+
+def state():
+
+    if not _state_pub["version"] or not _state_subs:
+
+        _state_publish_once()   # 沒有 SSE 訂閱者時背景不跑，這裡現算（沒變動則版本不變，照樣 304）
+
+    with _state_cond:
+
+        etag = _state_pub["etag"]; body = _state_pub["body"]
+
+    if etag in request.headers.get("If-None-Match", ""):
+
+        resp = make_response("", 304)
+
+    else:
+
+        resp = make_response(body)
+
+        resp.mimetype = "application/json"
+
+    resp.headers["ETag"] = etag
+
+    return resp
+
+
+@app.get("/state/stream")
+
+def state_stream():
+
+    """SSE：先送一次完整快照（event: full），之後只送變動的 key（event: patch）。"""
+
+    def gen():
+        global _state_subs
+
+        with _state_cond: _state_subs += 1
+
+        try:
+            yield from _state_stream_body()
+
+        finally:
+            with _state_cond: _state_subs -= 1
+
+    def _state_stream_body():
+
+        _state_publish_once()   # 訂閱前背景可能沒在比對，先取最新快照
+
+        with _state_cond:
+
+            last_v = _state_pub["version"]
+
+            first = {"v": last_v, "state": _state_pub["snap"]}
+
+        yield f"event: full\ndata: {json.dumps(first, ensure_ascii=False)}\n\n"
+
+        while True:
+
+            with _state_cond:
+
+                _state_cond.wait_for(lambda: _state_pub["version"] > last_v, timeout=STATE_SSE_KEEPALIVE)
+
+                cur_v = _state_pub["version"]
+
+                if cur_v == last_v:
+
+                    msg = None
+
+                elif _state_diffs and _state_diffs[0][0] <= last_v + 1:
+
+                    changed, removed = {}, set()
+
+                    for v, c, r in _state_diffs:
+
+                        if v <= last_v: continue
+
+                        changed.update(c); removed.difference_update(c); removed.update(r)
+
+                    msg = ("patch", {"v": cur_v, "changed": changed, "removed": sorted(removed)})
+
+                else:
+
+                    msg = ("full", {"v": cur_v, "state": _state_pub["snap"]})
 
-    return jsonify(out)
+                last_v = cur_v
+
+            if msg is None:
+
+                yield ": ping\n\n"
+
+            else:
+
+                yield f"event: {msg[0]}\ndata: {json.dumps(msg[1], ensure_ascii=False)}\n\n"
+
+    resp = app.response_class(gen(), mimetype="text/event-stream")
+
+    resp.headers["X-Accel-Buffering"] = "no"
+
+    return resp
 
 @app.post("/api/relay_config")
 def api_relay_config():
@@ -11627,7 +14360,7 @@ def _auto_watch_schedules():
 
                 # 重載並更新 UI
 
-                data = _load_schedules_from_disk()
+                SCHEDULE_INDEX.reload()
 
                 if 'sched_tree' in globals():
 
@@ -11673,6 +14406,8 @@ def api_timetable_enable():
 
         timetable_data["enabled"] = enabled
 
+        TT_ENGINE.kick()
+
 
 
         # Save to disk
@@ -11905,6 +14640,9 @@ def api_post_schedules():
 
             pass
 
+        SCHEDULE_INDEX.reload(force=True)   # [NEW] 重建排程索引並喚醒排程器
+        _prerender_kick.set()   # [NEW] 排程變更 → 立即重新預先合成
+
 
 
         try:
@@ -11981,249 +14719,67 @@ def _load_schedules_from_disk():
 
 
 
-def schedules_scheduler_loop():
+# [NEW] 排程索引（sched_core.ScheduleIndex）：schedules.json 只在檔案 mtime 變更或 POST /schedules 時重新編譯成 min-heap，
+#       schedules_scheduler_loop 睡到最近一筆到期（或被 POST 喚醒），/schedules/status 與 UI 也讀同一份索引。
+SCHEDULE_INDEX = ScheduleIndex(SCHEDULES_PATH, _load_schedules_from_disk, SCHED_CLOCK)
 
-    global _schedules_last_fired
+def _schedule_fire(it):
+    if it.get('cancel_all'):
+        handle_msg('CancelAll', 'Schedules')
+    if it.get('auto_unmute'):
+        handle_msg('Unmute', 'Schedules')
+    typ = (it.get('type') or 'cmd').lower()
+    payload = (it.get('payload') or '').strip()
+    if typ == 'sendmp3':
+        handle_msg(f'PlayMP3:{payload}', 'Schedules')
+    else:
+        handle_msg(payload, 'Schedules')
 
-    while True:
+def _schedule_missed(it, at):
+    text_area_insert(f"⚠️ /schedules 排程逾時未觸發：{it.get('title') or it.get('payload')} @ {at:%H:%M:%S}")
 
+def schedules_scheduler_loop():
+    while True:
         try:
-
-            items = _load_schedules_from_disk()
-
-            if items:
-
-                now = datetime.now()
-
-                ymd = now.strftime('%Y-%m-%d')
-
-                wd = now.isoweekday()
-
-                hh = now.strftime('%H')
-
-                mm = now.strftime('%M')
-
-                ss = int(now.strftime('%S'))
-
-                for it in items:
-
-                    if not it.get('enabled', True):
-
-                        continue
-
-                    # 支援單次預約 (date)
-                    target_date = it.get('date')
-                    if target_date:
-                        if target_date != ymd:
-                            continue
-                    else:
-                        # 只有在沒有指定 date 時才檢查星期幾
-
-                        days = it.get('days') or []
-
-                        if days and wd not in days:
-
-                            continue
-
-                    t = (it.get('time') or '').strip()
-
-                    if not t:
-
-                        continue
-
-                    want = t if len(t)==8 else (t+':00')
-
-                    th, tm, ts = [int(x) for x in want.split(':')]
-
-                    if hh != f'{th:02d}' or mm != f'{tm:02d}':
-
-                        continue
-
-                    jitter = int(it.get('jitter') or 0)
-
-                    if abs(ss - ts) > jitter:
-
-                        continue
-
-                    key = f"{it.get('id','?')}@{ymd}{th:02d}{tm:02d}{ts:02d}"
-
-                    if key in _schedules_last_fired:
-
-                        continue
-
-                    _schedules_last_fired.add(key)
-
-                    if it.get('cancel_all'):
-
-                        handle_msg('CancelAll', 'Schedules')
-
-                    if it.get('auto_unmute'):
-
-                        handle_msg('Unmute', 'Schedules')
-
-                    typ = (it.get('type') or 'cmd').lower()
-
-                    payload = (it.get('payload') or '').strip()
-
-                    if typ == 'sendmp3':
-
-                        handle_msg(f'PlayMP3:{payload}', 'Schedules')
-
-                    else:
-
-                        handle_msg(payload, 'Schedules')
-
-            prefix = datetime.now().strftime('%Y-%m-%d')
-
-            _schedules_last_fired = {k for k in _schedules_last_fired if prefix in k}
-
+            schedules_run_once(SCHEDULE_INDEX, _schedules_last_fired, lambda it, at: _schedule_fire(it), _schedule_missed)
         except Exception as e:
-
             try:
-
                 text_area_insert(f'⚠️ /schedules 排程器錯誤：{e}')
-
             except Exception:
-
                 pass
-
-        time.sleep(1)
-
-
-
-def _compute_next_schedule_status(items):
-
-    now = datetime.now()
-
-    best = None  # (dt, item, idx)
-
-
-
-    def parse_time_to_hms(t):
-
-        t = (t or '').strip()
-
-        if not t: return (8,0,0)
-
-        if len(t) == 5: t = t + ':00'
-
-        hh, mm, ss = [int(x) for x in t.split(':')]
-
-        return hh, mm, ss
-
-
-
-    for i, it in enumerate(items or []):
-
-        try:
-
-            if not it.get('enabled', True):
-
-                continue
-
-            hh, mm, ss = parse_time_to_hms(it.get('time'))
-
-            if it.get('date'):
-
-                try:
-
-                    d = datetime.strptime(it['date'], '%Y-%m-%d')
-
-                except Exception:
-
-                    continue
-
-                cand = d.replace(hour=hh, minute=mm, second=ss, microsecond=0)
-
-                if cand < now:
-
-                    continue
-
-                if (best is None) or (cand < best[0]):
-
-                    best = (cand, it, i)
-
-                continue
-
-            days = it.get('days') or []
-
-            for add in range(0, 14):
-
-                day = now.date() + timedelta(days=add)
-
-                wd = day.isoweekday()
-
-                if days and (wd not in days):
-
-                    continue
-
-                cand = datetime.combine(day, dtime(hh, mm, ss))
-
-                if cand < now:
-
-                    continue
-
-                if (best is None) or (cand < best[0]):
-
-                    best = (cand, it, i)
-
-                break
-
-        except Exception:
-
-            continue
-
-
-
-    if best is None:
-
-        return {'has_next': False, 'count': len(items or []), 'now': now.strftime('%Y-%m-%d %H:%M:%S')}
-
-    cand, it, idx = best
-
+            time.sleep(1)
+
+def _compute_next_schedule_status():
+    now = SCHED_CLOCK.now()
+    items = SCHEDULE_INDEX.snapshot_items()
+    nxt = SCHEDULE_INDEX.peek()
+    if nxt is None:
+        return {'has_next': False, 'count': len(items), 'now': now.strftime('%Y-%m-%d %H:%M:%S')}
+    cand, idx, it = nxt
     return {
-
         'has_next': True,
-
-        'count': len(items or []),
-
+        'count': len(items),
         'now': now.strftime('%Y-%m-%d %H:%M:%S'),
-
         'next': {
-
             'index': idx,
-
             'id': it.get('id'),
-
             'title': it.get('title'),
-
             'time': it.get('time'),
-
             'at': cand.strftime('%Y-%m-%d %H:%M:%S'),
-
-            'in_seconds': int((cand - now).total_seconds()),
-
+            'in_seconds': max(0, int((cand - now).total_seconds())),
             'jitter': int(it.get('jitter') or 0),
-
             'type': it.get('type'),
-
             'payload': it.get('payload'),
-
         }
-
     }
 
-
-
 @app.get('/schedules/status')
 
 def api_schedules_status():
 
     try:
 
-        items = _load_schedules_from_disk()
-
-        return jsonify(_compute_next_schedule_status(items))
+        return jsonify(_compute_next_schedule_status())
 
     except Exception as e:
 
@@ -12314,11 +14870,9 @@ def api_play_shortcut():
 
                 _interrupt_current_playback()
 
-                first = relay_acquire("shortcut_tts")
-
-                if first:
+                relay_acquire("shortcut_tts")
 
-                    time.sleep(3)
+                relay_wait_warm("shortcut_tts")
 
                 try:
 
@@ -12396,11 +14950,9 @@ def api_play_shortcut():
 
             _interrupt_current_playback()
 
-            first = relay_acquire("shortcut")
+            relay_acquire("shortcut")
 
-            if first:
-
-                time.sleep(3) # Wait for amp warm up
+            relay_wait_warm("shortcut") # Wait for (remaining) amp warm up
 
             try:
 
@@ -12697,6 +15249,7 @@ def _taigi_generate_audio_file(text: str, voice_mode: str | None, speed: float =
 
     if os.path.getsize(save_path) < 44:
         raise TaigiTTSException("AUDIO_TOO_SMALL", status=502)
+    AUDIO_INDEX.add(save_path)
 
     return {"url": f"/taigi/audio/{fname}", "file": fname, "voice": voice_label}
 
@@ -13383,6 +15936,13 @@ if not _HAS_TKINTER:
 
     # 啟動所有背景執行緒
     threading.Thread(target=speech_worker, daemon=True).start()
+    threading.Thread(target=start_melo_pool, daemon=True).start()
+    threading.Thread(target=tts_prerender_loop, daemon=True).start()
+    threading.Thread(target=preload_audio_assets, daemon=True).start()
+    threading.Thread(target=AUDIO_INDEX.scan, daemon=True).start()
+    threading.Thread(target=relay_prearm_loop, daemon=True).start()
+    threading.Thread(target=state_publisher_loop, daemon=True).start()
+    threading.Thread(target=start_warm_mpv, daemon=True).start()
     threading.Thread(target=youtube_worker, daemon=True).start()
     threading.Thread(target=mp3_worker, daemon=True).start()
     if '_cwa_bg_loop' in globals():
@@ -15585,6 +18145,8 @@ def _delete_selected_file():
 
         os.remove(path)
 
+        AUDIO_INDEX.discard(path)
+
         refresh_files()
 
     except Exception as e:
@@ -15713,7 +18275,7 @@ def refresh_sched_tree():
 
         sched_tree.delete(i)
 
-    items = _load_schedules_from_disk()
+    items = SCHEDULE_INDEX.snapshot_items()
 
     for it in (items or []):
 
@@ -15733,7 +18295,7 @@ def refresh_sched_tree():
 
     # 更新「下一次」狀態
 
-    st = _compute_next_schedule_status(items)
+    st = _compute_next_schedule_status()
 
     if st.get("has_next"):
 
@@ -15818,9 +18380,7 @@ def _tick_every_5s():
 
         # 更新自訂排程「下一次」
 
-        items = _load_schedules_from_disk()
-
-        st = _compute_next_schedule_status(items)
+        st = _compute_next_schedule_status()
 
         if st.get("has_next"):
 
@@ -15972,7 +18532,7 @@ try:
         try:
             print(">>> [Self-Check] 正在檢查 Edge TTS 引擎連線...")
             STATE["edge_tts_status"] = "Testing..."
-            import edge_tts, asyncio, os, tempfile
+            import edge_tts, os, tempfile
             async def _test():
                 with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp:
                     tmp_path = tmp.name
@@ -15987,9 +18547,7 @@ try:
                     try: os.remove(tmp_path)
                     except: pass
 
-            loop = asyncio.new_event_loop()
-            ok = loop.run_until_complete(_test())
-            loop.close()
+            ok = SPEECH_LOOP.run(_test(), timeout=60)
 
             if ok:
                 print(">>> [Self-Check] Edge TTS 運作正常 (OK)")
@@ -16009,6 +18567,13 @@ try:
 
     # Threads
     threading.Thread(target=speech_worker, daemon=True).start()
+    threading.Thread(target=start_melo_pool, daemon=True).start()
+    threading.Thread(target=tts_prerender_loop, daemon=True).start()
+    threading.Thread(target=preload_audio_assets, daemon=True).start()
+    threading.Thread(target=AUDIO_INDEX.scan, daemon=True).start()
+    threading.Thread(target=relay_prearm_loop, daemon=True).start()
+    threading.Thread(target=state_publisher_loop, daemon=True).start()
+    threading.Thread(target=start_warm_mpv, daemon=True).start()
     threading.Thread(target=youtube_worker, daemon=True).start()
     threading.Thread(target=mp3_worker, daemon=True).start()
     if '_cwa_bg_loop' in globals(): threading.Thread(target=_cwa_bg_loop, daemon=True).start()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+mpv 首次出聲時間基準測試（冷啟動 vs 常駐 mpv）
+
+  cold：每次都啟動新的 mpv 播放檔案（舊的 /ws/live 做法）
+  warm：預先啟動 mpv --idle，之後以 JSON IPC loadfile（USE_LOCAL_MPV 的做法）
+
+兩者都以「playback-time 屬性可讀」作為第一聲出來的時間點。
+
+用法：
+  python bench/mpv_first_audio_bench.py --mpv mpv.exe --file ClassStart.mp3 --runs 10
+  （無音效卡的機器可加 --ao null）
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+
+
+class Ipc:
+    def __init__(self, path, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if os.name == "nt":
+                    self.f = open(path, "r+b", buffering=0)
+                    self.sock = None
+                else:
+                    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    self.sock.connect(path)
+                    self.f = self.sock.makefile("rb")
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.005)
+        self.rid = 0
+
+    def cmd(self, *args):
+        self.rid += 1
+        line = (json.dumps({"command": list(args), "request_id": self.rid}) + "\n").encode()
+        if self.sock:
+            self.sock.sendall(line)
+        else:
+            self.f.write(line)
+        while True:
+            msg = json.loads(self.f.readline())
+            if msg.get("request_id") == self.rid:
+                return msg
+
+    def wait_audio(self, t0, limit=10.0):
+        while time.perf_counter() - t0 < limit:
+            if self.cmd("get_property", "playback-time").get("error") == "success":
+                return (time.perf_counter() - t0) * 1000.0
+            time.sleep(0.002)
+        raise TimeoutError("no audio")
+
+    def close(self):
+        try:
+            self.f.close()
+            if self.sock:
+                self.sock.close()
+        except OSError:
+            pass
+
+
+def _ipc_path(tag):
+    if os.name == "nt":
+        return rf"\\.\pipe\relaybell-bench-{os.getpid()}-{tag}"
+    return os.path.join(tempfile.gettempdir(), f"relaybell-bench-{os.getpid()}-{tag}.sock")
+
+
+def _base_cmd(a, path):
+    cmd = [a.mpv, "--no-terminal", "--force-window=no", "--video=no", "--cache=no",
+           "--profile=low-latency", "--audio-buffer=0", f"--input-ipc-server={path}"]
+    if a.ao:
+        cmd.append(f"--ao={a.ao}")
+    return cmd
+
+
+def run_cold(a):
+    out = []
+    for i in range(a.runs):
+        path = _ipc_path(f"cold{i}")
+        t0 = time.perf_counter()
+        p = subprocess.Popen(_base_cmd(a, path) + [a.file], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        ipc = Ipc(path)
+        out.append(ipc.wait_audio(t0))
+        ipc.close(); p.kill(); p.wait()
+    return out
+
+
+def run_warm(a):
+    path = _ipc_path("warm")
+    p = subprocess.Popen(_base_cmd(a, path) + ["--idle=yes"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    ipc = Ipc(path)
+    out = []
+    try:
+        for _ in range(a.runs):
+            ipc.cmd("stop")
+            while ipc.cmd("get_property", "idle-active").get("data") is not True:
+                time.sleep(0.005)
+            t0 = time.perf_counter()
+            ipc.cmd("loadfile", os.path.abspath(a.file), "replace")
+            out.append(ipc.wait_audio(t0))
+    finally:
+        ipc.close(); p.kill(); p.wait()
+    return out
+
+
+def _report(name, vals):
+    print(f"[{name}] n={len(vals)} mean={statistics.mean(vals):.1f}ms "
+          f"median={statistics.median(vals):.1f}ms min={min(vals):.1f}ms max={max(vals):.1f}ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mpv", default="mpv")
+    ap.add_argument("--file", default="ClassStart.mp3")
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--ao", default="", help="例如 null（無音效卡時）")
+    a = ap.parse_args()
+    _report("cold", run_cold(a))
+    _report("warm", run_warm(a))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Piper 冷啟動 vs 常駐行程基準測試
+
+  cold：每句啟動一次 piper（舊的 _piper_run_to_wav 做法，每次重新載入 ONNX 模型）
+  warm：一個 piper --json-input 常駐行程，stdin 每行一句（PIPER_WARM 的做法）
+
+用法：
+  python bench/piper_warm_bench.py --piper piper/piper.exe --model zh_CN-huayan-medium.onnx --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+
+SENTENCES = ["各位同學請注意，現在是上課時間。", "請各班班長到學務處集合。", "今天放學後有社團活動。"]
+
+
+def run_cold(a, out_dir):
+    out = []
+    for i in range(a.runs):
+        wav = os.path.join(out_dir, f"cold-{i}.wav")
+        t0 = time.perf_counter()
+        p = subprocess.run([a.piper, "--model", a.model, "--output_file", wav],
+                           input=SENTENCES[i % len(SENTENCES)], text=True, encoding="utf-8", capture_output=True)
+        if p.returncode != 0 or not os.path.isfile(wav):
+            raise SystemExit(f"piper failed: {p.stderr[-400:]}")
+        out.append((time.perf_counter() - t0) * 1000.0)
+    return out
+
+
+def run_warm(a, out_dir):
+    p = subprocess.Popen([a.piper, "--model", a.model, "--json-input", "--output_dir", out_dir],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                         text=True, encoding="utf-8", bufsize=1)
+    out = []
+    try:
+        for i in range(a.runs + 1):   # 第 0 句含模型載入，不計入
+            wav = os.path.join(out_dir, f"warm-{i}.wav")
+            t0 = time.perf_counter()
+            p.stdin.write(json.dumps({"text": SENTENCES[i % len(SENTENCES)], "output_file": wav}, ensure_ascii=False) + "\n")
+            p.stdin.flush()
+            if not p.stdout.readline():
+                raise SystemExit("piper exited")
+            ms = (time.perf_counter() - t0) * 1000.0
+            if i == 0:
+                print(f"[warm] first sentence incl. model load: {ms:.1f}ms")
+            else:
+                out.append(ms)
+    finally:
+        p.kill(); p.wait()
+    return out
+
+
+def _report(name, vals):
+    print(f"[{name}] n={len(vals)} mean={statistics.mean(vals):.1f}ms "
+          f"median={statistics.median(vals):.1f}ms min={min(vals):.1f}ms max={max(vals):.1f}ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--piper", default=os.path.join("piper", "piper.exe"))
+    ap.add_argument("--model", required=True)
+    ap.add_argument("--runs", type=int, default=10)
+    a = ap.parse_args()
+    with tempfile.TemporaryDirectory() as d:
+        _report("cold", run_cold(a, d))
+        _report("warm", run_warm(a, d))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+/poll 長輪詢喚醒基準測試
+
+模擬 N 位閒置學生端掛在 /poll，量測：
+  1) 閒置期間伺服器 CPU 使用（以 /api/perf 的 cpu_s 差值計算）
+  2) /api/cmd 送出指令到各學生端收到回應的延遲（p50 / p95 / max）
+
+用法（伺服器需先啟動）：
+  python bench/poll_wake_bench.py --base http://127.0.0.1:5050 --user admin --password xxx
+"""
+import argparse
+import statistics
+import threading
+import time
+
+import requests
+
+
+def _pct(vals, p):
+    if not vals:
+        return 0.0
+    vals = sorted(vals)
+    k = min(len(vals) - 1, int(round(p / 100.0 * (len(vals) - 1))))
+    return vals[k]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base", default="http://127.0.0.1:5050")
+    ap.add_argument("--group", type=int, default=6)
+    ap.add_argument("--students", type=int, default=300)
+    ap.add_argument("--idle", type=float, default=20.0, help="閒置量測秒數")
+    ap.add_argument("--rounds", type=int, default=10)
+    ap.add_argument("--user", default="admin")
+    ap.add_argument("--password", default="")
+    a = ap.parse_args()
+    base = a.base.rstrip("/")
+
+    teacher = requests.Session()
+    r = teacher.post(base + "/auth/login", json={"username": a.user, "password": a.password}, timeout=10)
+    if not r.ok or not r.json().get("ok"):
+        raise SystemExit(f"login failed: {r.status_code} {r.text[:200]}")
+
+    start_ver = requests.get(base + "/api/states", timeout=10).json()["groups"].get(str(a.group), {}).get("version", 0)
+    arrivals = {}            # version -> [arrival_ts, ...]
+    lock = threading.Lock()
+    stop = threading.Event()
+    errors = [0]
+
+    def student():
+        s = requests.Session()
+        ver = start_ver
+        while not stop.is_set():
+            try:
+                j = s.get(f"{base}/poll", params={"g": a.group, "since": ver}, timeout=40).json()
+            except Exception:
+                errors[0] += 1
+                time.sleep(0.5)
+                continue
+            t = time.perf_counter()
+            nv = j.get("version", ver)
+            if nv > ver:
+                with lock:
+                    for v in range(ver + 1, nv + 1):
+                        arrivals.setdefault(v, []).append(t)
+            ver = nv
+
+    ths = [threading.Thread(target=student, daemon=True) for _ in range(a.students)]
+    for t in ths:
+        t.start()
+    time.sleep(2.0)
+
+    p0 = requests.get(base + "/api/perf", timeout=10).json()
+    time.sleep(a.idle)
+    p1 = requests.get(base + "/api/perf", timeout=10).json()
+    idle_cpu = (p1["cpu_s"] - p0["cpu_s"]) / max(0.001, p1["ts"] - p0["ts"]) * 100.0
+    print(f"[idle] students={a.students} secs={a.idle:.0f} server_cpu={idle_cpu:.2f}% "
+          f"threads={p1['threads']} waiters={p1['poll']['waiters'].get(str(a.group))}")
+
+    lats = []
+    for _ in range(a.rounds):
+        t0 = time.perf_counter()
+        j = teacher.post(base + "/api/cmd", json={"groups": [a.group], "action": "bench_ping", "payload": {}}, timeout=10).json()
+        v = j["result"][str(a.group)]["version"]
+        time.sleep(1.0)
+        with lock:
+            got = arrivals.get(v, [])
+            lats.extend((t - t0) * 1000.0 for t in got)
+        print(f"[round] v={v} delivered={len(got)}/{a.students}")
+    stop.set()
+
+    p2 = requests.get(base + "/api/perf", timeout=10).json()
+    if lats:
+        print(f"[wake] n={len(lats)} p50={_pct(lats, 50):.1f}ms p95={_pct(lats, 95):.1f}ms "
+              f"max={max(lats):.1f}ms mean={statistics.mean(lats):.1f}ms")
+    print(f"[server] {p2['poll']}  client_errors={errors[0]}")
+
+
+if __name__ == "__main__":
+    main()
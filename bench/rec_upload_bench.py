@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+/api/speak_audio_blob 錄音上傳基準測試
+
+量測：
+  1) 請求延遲（POST 到收到回應；轉檔改為背景工作後應只剩存檔時間）
+  2) 每筆錄音的背景工作時間與 ffmpeg CPU 秒數（GET /api/speak_audio_blob/<job>）
+  3) 伺服器彙總（/api/perf 的 rec_jobs）
+
+用法（伺服器需先啟動；--file 用一段瀏覽器錄下的 webm）：
+  python bench/rec_upload_bench.py --base http://127.0.0.1:5050 --file voice.webm --runs 10 --chime
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base", default="http://127.0.0.1:5050")
+    ap.add_argument("--file", required=True)
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--chime", action="store_true")
+    a = ap.parse_args()
+    base = a.base.rstrip("/")
+    data = open(a.file, "rb").read()
+
+    req_ms, jobs = [], []
+    for _ in range(a.runs):
+        t0 = time.perf_counter()
+        r = requests.post(base + "/api/speak_audio_blob", files={"file": ("voice.webm", data)},
+                          data={"chime": "true" if a.chime else "false"}, timeout=120)
+        req_ms.append((time.perf_counter() - t0) * 1000.0)
+        j = r.json()
+        if not j.get("ok"):
+            raise SystemExit(f"upload failed: {r.status_code} {j}")
+        if j.get("job"):
+            jobs.append(j["job"])
+
+    job_ms, cpu_s = [], []
+    for jid in jobs:
+        while True:
+            st = requests.get(f"{base}/api/speak_audio_blob/{jid}", timeout=10).json()
+            if st.get("status") in ("done", "error"):
+                break
+            time.sleep(0.2)
+        if st["status"] == "done":
+            job_ms.append(st.get("job_ms", 0.0)); cpu_s.append(st.get("cpu_s", 0.0))
+        else:
+            print(f"[job] {jid} error: {st.get('error')}")
+
+    print(f"[request] n={len(req_ms)} median={statistics.median(req_ms):.1f}ms max={max(req_ms):.1f}ms")
+    if job_ms:
+        print(f"[job] n={len(job_ms)} median={statistics.median(job_ms):.1f}ms "
+              f"cpu_median={statistics.median(cpu_s):.3f}s")
+    print(f"[server] {requests.get(base + '/api/perf', timeout=10).json().get('rec_jobs')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+排程器重播基準測試（模擬時鐘，不需要啟動伺服器）
+
+以 sched_core 的 timetable_run_once / schedules_run_once（和主程式同一份迴圈程式碼）搭配模擬時鐘，
+幾秒內重播整個學年的 timetable.json + schedules.json + 假日，並與逐日暴力展開的預期結果比對：
+  missed     預期要響卻沒觸發
+  duplicate  同一筆在同一預定時刻觸發超過一次
+  unexpected 不在預期清單內的觸發
+  late       實際觸發晚於預定超過 --late-ms
+另外回報每個模擬日的 CPU 時間。--reload-hours 會定期強制重建索引，驗證重載不會重複觸發。
+
+用法：
+  python bench/sched_replay_bench.py --timetable timetable.json --schedules data/schedules.json \\
+      --start 2025-08-30 --end 2026-06-30
+  （未指定 --schedules 時使用內建的範例排程）
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sched_core import ScheduleIndex, TimetableEngine, schedules_run_once, timetable_run_once  # noqa: E402
+
+SAMPLE_SCHEDULES = [
+    {"id": "morning", "title": "早安廣播", "time": "07:30", "days": [1, 2, 3, 4, 5], "type": "cmd", "payload": "早安"},
+    {"id": "lunch", "title": "午餐", "time": "12:00:30", "days": [], "jitter": 5, "type": "cmd", "payload": "午餐時間"},
+    {"id": "drill", "title": "防災演練", "time": "10:15", "date": "2025-09-19", "type": "cmd", "payload": "演練"},
+    {"id": "off", "title": "停用", "time": "09:00", "enabled": False, "type": "cmd", "payload": "x"},
+]
+
+
+class SimClock:
+    """模擬時鐘：wait() 不睡覺，直接把時間往前推（加上模擬的喚醒延遲）"""
+
+    def __init__(self, t, wake_ms):
+        self.t = t
+        self.wake_ms = wake_ms
+
+    def now(self):
+        return self.t
+
+    def wait(self, cond, timeout):
+        self.t += timedelta(seconds=timeout, milliseconds=random.uniform(0, self.wake_ms))
+
+
+# 預期結果刻意不用 sched_core 的解析函式（sched_hms / tt_item_dows），以獨立的寫法展開，
+# 這樣解析上的錯誤才會在比對時現形
+_DOW_NAMES = {"mon": 1, "tue": 2, "wed": 3, "thu": 4, "fri": 5, "sat": 6, "sun": 7}
+
+
+def _oracle_dows(it):
+    raw = it.get("dow") or it.get("weekday") or it.get("days")
+    out = set()
+    for v in (raw if isinstance(raw, (list, tuple)) else [raw]):
+        if isinstance(v, str):
+            v = v.strip().lower()
+            v = _DOW_NAMES.get(v, int(v) if v.isdigit() else None)
+        if isinstance(v, int) and 1 <= v <= 7:
+            out.add(v)
+    return out
+
+
+def _oracle_time(s, with_seconds):
+    s = (s or "").strip()
+    for fmt in (("%H:%M:%S", "%H:%M") if with_seconds else ("%H:%M",)):
+        try:
+            t = datetime.strptime(s if with_seconds else s[:5], fmt).time()
+            return (t.hour, t.minute, t.second) if with_seconds else (t.hour, t.minute)
+        except ValueError:
+            continue
+    return None
+
+
+def _days(start, end):
+    d = start
+    while d <= end:
+        yield d
+        d += timedelta(days=1)
+
+
+def expected_timetable(data, start, end):
+    holidays = set(data.get("holidays") or [])
+    out = set()
+    for d in _days(start, end):
+        ymd = d.strftime("%Y-%m-%d")
+        if d.isoweekday() == 6 and not data.get("treat_saturday_as_school", False): continue
+        if data.get("skip_holidays", True) and ymd in holidays: continue
+        for i, it in enumerate(data.get("items", [])):
+            if not (it.get("action") or "").strip(): continue
+            hm = _oracle_time(it.get("time"), False)
+            if not hm: continue
+            if it.get("date"):
+                if it["date"] != ymd: continue
+            elif d.isoweekday() not in _oracle_dows(it):
+                continue
+            out.add((i, datetime(d.year, d.month, d.day, *hm)))
+    return out
+
+
+def expected_schedules(items, start, end):
+    out = set()
+    for d in _days(start, end):
+        for it in items:
+            if not it.get("enabled", True): continue
+            hms = _oracle_time(it.get("time"), True)
+            if not hms: continue
+            if it.get("date"):
+                if it["date"] != d.strftime("%Y-%m-%d"): continue
+            elif (it.get("days") or []) and d.isoweekday() not in it["days"]:
+                continue
+            out.add((_sid(it), datetime(d.year, d.month, d.day, *hms)))
+    return out
+
+
+def _sid(it):
+    return json.dumps(it, sort_keys=True, ensure_ascii=False)
+
+
+def _report(name, expected, fired, late_ms, cpu_s, days, extra=""):
+    seen = {}
+    for key, actual in fired:
+        seen.setdefault(key, []).append(actual)
+    dup = sum(len(v) - 1 for v in seen.values() if len(v) > 1)
+    missed = expected - set(seen)
+    unexpected = set(seen) - expected
+    skews = sorted((min(v) - k[1]).total_seconds() * 1000.0 for k, v in seen.items())
+    late = sum(1 for s in skews if s > late_ms)
+    p = (lambda q: skews[min(len(skews) - 1, int(len(skews) * q))] if skews else 0.0)
+    print(f"[{name}] expected={len(expected)} fired={len(fired)} missed={len(missed)} duplicate={dup} "
+          f"unexpected={len(unexpected)} late(>{late_ms:.0f}ms)={late} "
+          f"skew p50={p(0.5):.1f}ms p95={p(0.95):.1f}ms max={(skews[-1] if skews else 0.0):.1f}ms "
+          f"cpu/day={cpu_s / max(1, days) * 1000.0:.2f}ms{extra}")
+    for k in sorted(missed, key=lambda k: k[1])[:5]:
+        print(f"  missed: {k[1]} #{k[0] if isinstance(k[0], int) else json.loads(k[0]).get('id')}")
+    return not missed and not dup and not unexpected
+
+
+def run_timetable(data, start, end, a):
+    clock = SimClock(datetime.combine(start, datetime.min.time()), a.wake_ms)
+    eng = TimetableEngine(clock)
+    eng.rebuild(data)
+    fired, log = set(), []
+    stop = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    next_reload = clock.now() + timedelta(hours=a.reload_hours) if a.reload_hours else None
+    t0 = time.process_time()
+    while clock.now() < stop:
+        timetable_run_once(eng, fired, lambda: True, lambda i, it, at: log.append(((i, at), clock.now())))
+        if next_reload and clock.now() >= next_reload:
+            eng.rebuild(data); next_reload += timedelta(hours=a.reload_hours * random.uniform(0.5, 1.5))
+    cpu = time.process_time() - t0
+    days = (end - start).days + 1
+    log = [x for x in log if x[0][1] < stop]
+    return _report("timetable", expected_timetable(data, start, end), log, a.late_ms, cpu, days,
+                   f" wakeups={eng.stats['wakeups']} builds={eng.stats['builds']}")
+
+
+def run_schedules(items, path, start, end, a):
+    clock = SimClock(datetime.combine(start, datetime.min.time()), a.wake_ms)
+    idx = ScheduleIndex(path, lambda: json.loads(json.dumps(items)), clock)
+    fired, log = set(), []
+    stop = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    next_reload = clock.now() + timedelta(hours=a.reload_hours) if a.reload_hours else None
+    t0 = time.process_time()
+    while clock.now() < stop:
+        schedules_run_once(idx, fired, lambda it, at: log.append(((_sid(it), at), clock.now())))
+        if next_reload and clock.now() >= next_reload:
+            idx.reload(force=True); next_reload += timedelta(hours=a.reload_hours * random.uniform(0.5, 1.5))
+    cpu = time.process_time() - t0
+    days = (end - start).days + 1
+    log = [x for x in log if x[0][1] < stop]
+    return _report("schedules", expected_schedules(items, start, end), log, a.late_ms, cpu, days,
+                   f" reloads={idx.stats['reloads']} missed_by_loop={idx.stats['missed']}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--timetable", default="timetable.json")
+    ap.add_argument("--schedules", default="")
+    ap.add_argument("--start", default="2025-08-30")
+    ap.add_argument("--end", default="2026-06-30")
+    ap.add_argument("--wake-ms", type=float, default=2.0, help="模擬每次喚醒的延遲上限（ms）")
+    ap.add_argument("--late-ms", type=float, default=1000.0)
+    ap.add_argument("--reload-hours", type=float, default=6.0, help="平均每幾小時強制重建一次索引（0=不重建）")
+    ap.add_argument("--seed", type=int, default=1)
+    a = ap.parse_args()
+    random.seed(a.seed)
+    start = datetime.strptime(a.start, "%Y-%m-%d").date()
+    end = datetime.strptime(a.end, "%Y-%m-%d").date()
+
+    with open(a.timetable, "r", encoding="utf-8") as f:
+        tt = json.load(f)
+    if a.schedules:
+        with open(a.schedules, "r", encoding="utf-8") as f:
+            sched = json.load(f)
+        sched = sched if isinstance(sched, list) else [sched]
+        spath = a.schedules
+    else:
+        sched, spath = SAMPLE_SCHEDULES, os.path.join(os.path.dirname(os.path.abspath(a.timetable)), ".no-schedules.json")
+
+    ok = run_timetable(tt, start, end, a)
+    ok = run_schedules(sched, spath, start, end, a) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+語音 event loop 開銷基準測試（每則 asyncio.run vs 常駐 loop）
+
+  fresh：舊做法，每則訊息 asyncio.run(...)（建立 loop + 預設 executor，結束時再拆掉）
+  warm ：新做法（SpeechLoop），常駐 loop + 常駐 executor，以 run_coroutine_threadsafe 提交
+
+模擬的「一則訊息」= 一次 executor 呼叫（阻塞型引擎 / play_sound）+ 幾次 await。
+加 --edge 時改為真的呼叫 edge-tts 合成一句話（需要網路）。
+
+用法：
+  python bench/speech_loop_bench.py --runs 500
+  python bench/speech_loop_bench.py --edge --runs 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _blocking_engine():
+    return sum(range(200))
+
+
+async def _job_sim():
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, _blocking_engine)
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def _make_edge_job(text, voice):
+    import edge_tts
+
+    async def _job():
+        fd, p = tempfile.mkstemp(suffix=".mp3")
+        os.close(fd)
+        try:
+            await edge_tts.Communicate(text, voice).save(p)
+        finally:
+            os.remove(p)
+    return _job
+
+
+def run_fresh(job, runs):
+    out = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        asyncio.run(job())
+        out.append((time.perf_counter() - t0) * 1000.0)
+    return out
+
+
+def run_warm(job, runs):
+    loop = asyncio.new_event_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=8, thread_name_prefix="tts-exec"))
+    th = threading.Thread(target=loop.run_forever, daemon=True)
+    th.start()
+    out = []
+    try:
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            asyncio.run_coroutine_threadsafe(job(), loop).result()
+            out.append((time.perf_counter() - t0) * 1000.0)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        th.join()
+    return out
+
+
+def _report(name, vals):
+    print(f"[{name}] n={len(vals)} mean={statistics.mean(vals):.3f}ms "
+          f"median={statistics.median(vals):.3f}ms max={max(vals):.3f}ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=500)
+    ap.add_argument("--edge", action="store_true", help="實際呼叫 edge-tts（需要網路）")
+    ap.add_argument("--text", default="各位同學請注意。")
+    ap.add_argument("--voice", default="zh-TW-HsiaoChenNeural")
+    a = ap.parse_args()
+    job = _make_edge_job(a.text, a.voice) if a.edge else _job_sim
+    fresh = run_fresh(job, a.runs)
+    warm = run_warm(job, a.runs)
+    _report("fresh", fresh)
+    _report("warm", warm)
+    print(f"[saved] {statistics.median(fresh) - statistics.median(warm):.3f}ms per announcement (median)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+MeloTTS 子行程（由 RelayBell_demo.py 的 MeloWorkerPool 啟動）
+
+PyTorch 推論會長時間佔住 GIL，放在主程式裡 Flask /poll、/ws/live 與 GUI 都會卡住，
+所以模型載入與合成都在這個獨立行程裡做。
+
+協定：stdin / stdout 一行一個 JSON
+  啟動完成 → {"ready": true, "speakers": {...}, "device": "cpu", "load_ms": 1234.5}
+  請求     ← {"id": 1, "text": "...", "speaker": 0, "speed": 1.0, "out": "C:/.../x.wav"}
+  回應     → {"id": 1, "ok": true, "ms": 812.3}  /  {"id": 1, "ok": false, "error": "..."}
+WAV 直接寫到主程式指定的 out 路徑（通常是 TTS 快取的暫存檔）。
+
+單獨執行：python melo_worker.py [--language ZH] [--device auto]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--language", default="ZH")
+    ap.add_argument("--device", default="auto")
+    a, _ = ap.parse_known_args(argv)
+
+    # 協定專用通道：複製原本的 stdout，之後所有 print（含 melo/torch 的進度輸出）都導到 stderr
+    proto = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    def send(obj):
+        proto.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        proto.flush()
+
+    t0 = time.perf_counter()
+    try:
+        import torch
+        from melo.api import TTS
+        device = a.device
+        if device == "auto":
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        model = TTS(language=a.language, device=device)
+        try:
+            speakers = dict(model.hps.data.spk2id)
+        except Exception:
+            speakers = {}
+    except Exception as e:
+        send({"ready": False, "error": f"{type(e).__name__}: {e}"})
+        return 2
+    send({"ready": True, "speakers": speakers, "device": device, "pid": os.getpid(),
+          "load_ms": round((time.perf_counter() - t0) * 1000.0, 1)})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            req = json.loads(line)
+        except ValueError:
+            continue
+        if req.get("cmd") == "quit":
+            break
+        rid = req.get("id")
+        t1 = time.perf_counter()
+        try:
+            model.tts_to_file(req["text"], int(req.get("speaker", 0)), req["out"], speed=float(req.get("speed", 1.0)))
+            send({"id": rid, "ok": True, "ms": round((time.perf_counter() - t1) * 1000.0, 1)})
+        except Exception as e:
+            send({"id": rid, "ok": False, "error": f"{type(e).__name__}: {e}"})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+排程核心（由 RelayBell_demo.py 匯入；bench/sched_replay_bench.py 也直接使用）
+
+  ScheduleIndex    schedules.json 編譯成 min-heap（下一次觸發時間），檔案 mtime 變更或強制重載才重建
+  TimetableEngine  課表編譯成「每個星期幾一份的排序陣列 + 指定日期例外表 + 假日集合」
+  *_run_once       排程器迴圈的一次迭代：取出到期項目 → 觸發 → 在 Condition 上等到下一筆
+
+所有「現在時間」與等待都經過 clock 物件（SystemClock），測試/基準測試可換成模擬時鐘，
+不用真的等就能重播一整個學年。
+"""
+import bisect
+import collections
+import heapq
+import os
+import threading
+from datetime import datetime, timedelta, time as dtime
+
+TT_LOOKAHEAD_DAYS = 14
+SCHEDULE_MAX_SLEEP_SEC = 30     # 最長睡眠：順便偵測外部修改 schedules.json
+SCHEDULE_LATE_GRACE_SEC = 30    # 醒得太晚仍補觸發的寬限秒數（jitter 較大時以 jitter 為準）
+TIMETABLE_MAX_SLEEP_SEC = 60
+
+
+class SystemClock:
+    """真實時鐘：now() 與在 Condition 上等待"""
+
+    def now(self):
+        return datetime.now()
+
+    def wait(self, cond, timeout):
+        with cond:
+            cond.wait(timeout)
+
+
+def _norm_dow(d):
+    if isinstance(d, int): return d
+    if isinstance(d, str):
+        return {"mon": 1, "tue": 2, "wed": 3, "thu": 4, "fri": 5, "sat": 6, "sun": 7}.get(d.strip().lower()) \
+            or (int(d) if d.strip().isdigit() else None)
+    return None
+
+
+def _hhmm_to_minutes(s):
+    try:
+        h, m = s.strip().split(":")[:2]
+        return int(h) * 60 + int(m)
+    except Exception:
+        return None
+
+
+def _parse_date(s):
+    try: return datetime.strptime(str(s).strip(), "%Y-%m-%d").date()
+    except ValueError: return None
+
+
+def _percentiles(vals):
+    vals = sorted(vals)
+    if not vals: return {}
+    return {"skew_ms_p50": round(vals[len(vals) // 2], 1),
+            "skew_ms_p95": round(vals[min(len(vals) - 1, int(len(vals) * 0.95))], 1),
+            "skew_ms_max": round(vals[-1], 1)}
+
+
+# ===============================
+# == 自訂排程（schedules.json）==
+# ===============================
+def sched_hms(t):
+    t = (t or "").strip()
+    if not t: return None
+    hh, mm, ss = [int(x) for x in (t if len(t) == 8 else t + ":00").split(":")]
+    return hh, mm, ss
+
+
+def sched_next_fire(it, hms, after):
+    """it 在 after（含）之後的下一次觸發時間；沒有則回傳 None"""
+    if it.get("date"):
+        try: d = datetime.strptime(it["date"], "%Y-%m-%d").date()
+        except Exception: return None
+        at = datetime.combine(d, dtime(*hms))
+        return at if at >= after else None
+    days = it.get("days") or []
+    for add in range(8):
+        d = after.date() + timedelta(days=add)
+        if days and d.isoweekday() not in days: continue
+        at = datetime.combine(d, dtime(*hms))
+        if at >= after: return at
+    return None
+
+
+class ScheduleIndex:
+    def __init__(self, path, loader, clock=None):
+        self.path, self.loader = path, loader      # loader() → list[dict]
+        self.clock = clock or SystemClock()
+        self.cond = threading.Condition()
+        self.items, self.heap = [], []             # heap: (下一次觸發時間, 項目索引, (h, m, s))
+        self.mtime, self.loaded = None, False
+        self.skews = collections.deque(maxlen=500)
+        self.stats = {"reloads": 0, "fired": 0, "missed": 0, "late_ms_max": 0.0}
+
+    def _compile(self, items, now):
+        heap = []
+        for i, it in enumerate(items):
+            if not it.get("enabled", True): continue
+            try: hms = sched_hms(it.get("time"))
+            except Exception: continue
+            at = sched_next_fire(it, hms, now) if hms else None
+            if at: heap.append((at, i, hms))
+        heapq.heapify(heap)
+        return heap
+
+    def reload(self, force=False):
+        """檔案有變（或 force）才重新讀取並編譯；回傳是否重建"""
+        try: m = os.path.getmtime(self.path)
+        except OSError: m = None
+        with self.cond:
+            if self.loaded and not force and m == self.mtime: return False
+        items = self.loader()
+        heap = self._compile(items, self.clock.now().replace(microsecond=0))
+        with self.cond:
+            self.items, self.heap, self.mtime, self.loaded = items, heap, m, True
+            self.stats["reloads"] += 1
+            self.cond.notify_all()
+        return True
+
+    def pop_due(self, now):
+        """取出 now 以前到期的 [(觸發時間, 項目)]，並把每筆排入下一次"""
+        due = []
+        with self.cond:
+            while self.heap and self.heap[0][0] <= now:
+                at, i, hms = heapq.heappop(self.heap)
+                nxt = sched_next_fire(self.items[i], hms, at + timedelta(seconds=1))
+                if nxt: heapq.heappush(self.heap, (nxt, i, hms))
+                due.append((at, self.items[i]))
+        return due
+
+    def peek(self):
+        """(下一次觸發時間, 項目索引, 項目) 或 None"""
+        if not self.loaded: self.reload()
+        with self.cond:
+            if not self.heap: return None
+            at, i, _ = self.heap[0]
+            return at, i, self.items[i]
+
+    def upcoming(self, until):
+        """until（含）以前還沒觸發的 [(觸發時間, 項目)]：從 heap 往後展開，規則與 pop_due 相同"""
+        if not self.loaded: self.reload()
+        out = []
+        with self.cond:
+            for at, i, hms in self.heap:
+                it = self.items[i]
+                while at and at <= until:
+                    out.append((at, it))
+                    at = sched_next_fire(it, hms, at + timedelta(seconds=1))
+        out.sort(key=lambda x: x[0])
+        return out
+
+    def snapshot_items(self):
+        if not self.loaded: self.reload()
+        with self.cond: return list(self.items)
+
+    def snapshot(self):
+        with self.cond:
+            st = dict(self.stats, pending=len(self.heap))
+        st.update(_percentiles(list(self.skews)))
+        return st
+
+
+def schedules_run_once(idx, fired, fire, on_missed=None,
+                       max_sleep=SCHEDULE_MAX_SLEEP_SEC, late_grace=SCHEDULE_LATE_GRACE_SEC):
+    """
+    schedules 排程器的一次迭代。fired：已觸發 key 的 set（原地更新，只保留今天）；
+    fire(item, planned_at) 觸發；on_missed(item, planned_at) 逾時未觸發。
+    """
+    idx.reload()
+    now = idx.clock.now()
+    for at, it in idx.pop_due(now):
+        key = f"{it.get('id', '?')}@{at.strftime('%Y-%m-%d%H%M%S')}"
+        if key in fired:
+            continue
+        fired.add(key)
+        late = (now - at).total_seconds()
+        if late > max(int(it.get('jitter') or 0), late_grace):
+            idx.stats["missed"] += 1
+            if on_missed: on_missed(it, at)
+            continue
+        idx.stats["fired"] += 1
+        idx.stats["late_ms_max"] = max(idx.stats["late_ms_max"], round(late * 1000.0, 1))
+        idx.skews.append(late * 1000.0)
+        fire(it, at)
+    prefix = now.date().isoformat()
+    for k in [k for k in fired if prefix not in k]: fired.discard(k)
+    nxt = idx.peek()
+    sleep = max_sleep if not nxt else (nxt[0] - idx.clock.now()).total_seconds()
+    idx.clock.wait(idx.cond, min(max_sleep, max(0.0, sleep)))
+
+
+# ===============================
+# == 課表（timetable.json）==
+# ===============================
+def tt_item_dows(it):
+    dow = it.get("dow") or it.get("weekday") or it.get("days")
+    vals = dow if isinstance(dow, (list, tuple)) else [dow]
+    return {d for d in (_norm_dow(v) for v in vals) if d and 1 <= d <= 7}
+
+
+class TimetableEngine:
+    def __init__(self, clock=None):
+        self.clock = clock or SystemClock()
+        self.cond = threading.Condition()
+        self.weekly = {wd: [] for wd in range(1, 8)}   # wd -> [(分鐘, 項目索引)]（已排序）
+        self.dated = {}                                 # date -> [(分鐘, 項目索引)]
+        self.holidays, self.sat_school, self.skip_holidays = set(), False, True
+        self.items = []
+        self.version = 0
+        self.skews = collections.deque(maxlen=500)      # 觸發誤差（ms，實際 - 預定）
+        self.stats = {"builds": 0, "fired": 0, "wakeups": 0}
+
+    def rebuild(self, data):
+        weekly = {wd: [] for wd in range(1, 8)}; dated = {}
+        items = list(data.get("items", []) or [])
+        for i, it in enumerate(items):
+            mins = _hhmm_to_minutes(it.get("time") or "")
+            if mins is None: continue
+            if it.get("date"):
+                d = _parse_date(it["date"])
+                if d: dated.setdefault(d, []).append((mins, i))
+            else:
+                for wd in tt_item_dows(it): weekly[wd].append((mins, i))
+        for arr in list(weekly.values()) + list(dated.values()): arr.sort()
+        with self.cond:
+            self.weekly, self.dated, self.items = weekly, dated, items
+            self.holidays = {d for d in map(_parse_date, data.get("holidays") or []) if d}
+            self.sat_school = bool(data.get("treat_saturday_as_school", False))
+            self.skip_holidays = bool(data.get("skip_holidays", True))
+            self.version += 1; self.stats["builds"] += 1
+            self.cond.notify_all()
+
+    def kick(self):
+        with self.cond: self.cond.notify_all()
+
+    def is_holiday(self, d):
+        if d.isoweekday() == 6 and not self.sat_school: return True
+        return self.skip_holidays and d in self.holidays
+
+    def next_after(self, after):
+        """after（含，取到分鐘）之後第一個響鈴時刻 → (datetime, [(項目索引, 項目)])；找不到回傳 None"""
+        start = after.replace(second=0, microsecond=0)
+        if start < after: start += timedelta(minutes=1)
+        with self.cond:
+            for add in range(TT_LOOKAHEAD_DAYS + 1):
+                d = start.date() + timedelta(days=add)
+                if self.is_holiday(d): continue
+                lo = start.hour * 60 + start.minute if add == 0 else 0
+                best, idxs = None, []
+                for arr in (self.weekly[d.isoweekday()], self.dated.get(d, ())):
+                    j = bisect.bisect_left(arr, (lo, -1))
+                    if j < len(arr) and (best is None or arr[j][0] <= best):
+                        if best is None or arr[j][0] < best: best, idxs = arr[j][0], []
+                        while j < len(arr) and arr[j][0] == best:
+                            idxs.append(arr[j][1]); j += 1
+                if best is not None:
+                    hh, mm = divmod(best, 60)
+                    return datetime.combine(d, dtime(hh, mm)), [(i, self.items[i]) for i in sorted(idxs)]
+        return None
+
+    def snapshot(self):
+        st = dict(self.stats, version=self.version)
+        st.update(_percentiles(list(self.skews)))
+        return st
+
+
+def timetable_run_once(eng, fired, enabled, fire, prefetch=None, prefetch_sec=0,
+                       max_sleep=TIMETABLE_MAX_SLEEP_SEC):
+    """
+    課表排程器的一次迭代。fired：已觸發 key（"YYYY-MM-DD HH:MM #i"）的 set（原地更新，只保留今天）；
+    enabled()：目前是否啟用；fire(index, item, planned_at) 觸發；prefetch([(i, item)]) 在響鈴前 prefetch_sec 秒呼叫。
+    本分鐘內剛錯過的鈴聲仍會補響（同舊的逐分鐘比對行為）。
+    """
+    now = eng.clock.now()
+    cursor = now.replace(second=0, microsecond=0)
+    while True:
+        nxt = eng.next_after(cursor)
+        if not nxt or nxt[0] > now: break
+        stamp = nxt[0].strftime("%Y-%m-%d %H:%M")
+        pending = [(i, it) for i, it in nxt[1] if f"{stamp} #{i}" not in fired]
+        if pending:
+            nxt = (nxt[0], pending); break
+        cursor = nxt[0] + timedelta(minutes=1)
+    if nxt and nxt[0] <= now:
+        at, pending = nxt
+        stamp = at.strftime("%Y-%m-%d %H:%M")
+        fired.update(f"{stamp} #{i}" for i, _ in pending)
+        if enabled():
+            eng.skews.append((now - at).total_seconds() * 1000.0); eng.stats["fired"] += 1
+            for i, it in pending:
+                if (it.get("action") or "").strip(): fire(i, it, at)
+        today = now.date().isoformat()
+        for k in [k for k in fired if not k.startswith(today)]: fired.discard(k)
+        return
+    wait = max_sleep if not nxt else (nxt[0] - now).total_seconds()
+    if nxt and enabled() and prefetch:
+        if wait <= prefetch_sec: prefetch(nxt[1])
+        else: wait -= prefetch_sec
+    eng.stats["wakeups"] += 1
+    eng.clock.wait(eng.cond, min(max_sleep, max(0.0, wait)))
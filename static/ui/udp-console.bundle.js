@@ -15,11 +15,29 @@ class UDPConsole extends HTMLElement {
     this.render();
     this.bind();
     this.refreshState();
-    this.timer = setInterval(()=>this.refreshState(), 2000);
+    this.subscribeState();
   }
 
   disconnectedCallback() {
     if (this.timer) clearInterval(this.timer);
+    if (this.es) this.es.close();
+  }
+
+  // /state/stream (SSE): server pushes only changed keys; fall back to polling without EventSource
+  subscribeState() {
+    if (!window.EventSource) { this.timer = setInterval(()=>this.refreshState(), 2000); return; }
+    this.srvState = {};
+    this.es = new EventSource("/state/stream");
+    this.es.addEventListener("full", (e)=> {
+      this.srvState = JSON.parse(e.data).state || {};
+      this.applyState(this.srvState);
+    });
+    this.es.addEventListener("patch", (e)=> {
+      const d = JSON.parse(e.data);
+      Object.assign(this.srvState, d.changed || {});
+      (d.removed || []).forEach(k => delete this.srvState[k]);
+      this.applyState(this.srvState);
+    });
   }
 
   css() {
@@ -346,7 +364,14 @@ class UDPConsole extends HTMLElement {
 
   async refreshState() {
     try {
-      const r = await fetch("/state"); const s = await r.json();
+      const r = await fetch("/state", { cache: "no-cache" }); this.applyState(await r.json());
+    } catch (e) {
+      // ignore
+    }
+  }
+
+  applyState(s) {
+    try {
       // Merge state defensively
       const next = Object.assign({}, this.state, s || {});
       this.state = next;